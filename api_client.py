@@ -1,15 +1,33 @@
 import requests
 import logging
-import base64
-import json
-from datetime import datetime, timedelta
-from config import (
-    API_BASE_URL, ORIGIN, DESTINATION, CURRENCY, SEARCH_DATES, BASE_HEADERS,
-    ONE_WAY_ORIGIN, ONE_WAY_DESTINATION, ONE_WAY_DATES, ONE_WAY_THRESHOLD_EUR,
-    SPECIFIC_ORIGIN, SPECIFIC_DESTINATION, SPECIFIC_THRESHOLD_EUR,
-    SPECIFIC_START_DATE, SPECIFIC_END_DATE, MIN_DURATION_DAYS, MAX_DURATION_DAYS,
-    AR_ROUTES, AIR_EUROPA_ROUTES
-)
+from urllib.parse import urlsplit
+from config import API_BASE_URL, BASE_HEADERS
+from search_plan import Query, compile_watch, current_plan
+from deals import Deal
+from dates import date_ordinal, iso_month, month_bounds
+from price_matrix import PriceMatrix
+from token_validator import token_validator, decode_jwt_token, is_token_expired
+import fixtures
+from metrics import HTTP_REQUESTS, HTTP_LATENCY, HTTP_BYTES
+from providers import Provider, Runtime, loads, register
+from log_setup import REQUEST_LOGGER
+
+# Per-request and per-deal events; sampled by log_setup, formatted lazily
+request_log = logging.getLogger(REQUEST_LOGGER)
+
+# Shared HTTP session for every fetcher: keeps connections alive between
+# requests and is where the record/replay transport gets mounted
+session = requests.Session()
+fixtures.install_from_env(session)
+
+def record_response_metrics(response, *args, **kwargs):
+    """Response hook counting requests, latency and bytes per host."""
+    host = urlsplit(response.url).hostname
+    HTTP_REQUESTS.inc(host=host, status=response.status_code)
+    HTTP_LATENCY.observe(response.elapsed.total_seconds(), host=host)
+    HTTP_BYTES.observe(len(response.content), host=host)
+
+session.hooks['response'].append(record_response_metrics)
 
 # Aerolíneas Argentinas API configuration
 AR_API_BASE_URL = "https://api.aerolineas.com.ar/v1/flights/offers"
@@ -20,48 +38,12 @@ AIR_EUROPA_API_BASE_URL = "https://api-des.aireuropa.com/v2/search/air-calendars
 AIR_EUROPA_AUTH_TOKEN = "IWDcV5ftwwsFxGrBTMYOkTCK8BCp"
 AIR_EUROPA_D_TOKEN = "3:VqFR+oCS53LNkczuXgRMmg==:VXFuOZeaxJ8APmqIw3vCLb1SNciDEb/gRZTFJdQ3Rn7laJ5Go3HmIImNe/aAidcu9NITFePW0gpfkBBbbGPS5wuGvu2J4NgZyPw/Z81kzbZ5u/nHcMRlxDNoV0dSo1oj5kw/I/XafLWw5CH+7Z8c3KbLDLzcQdaB2ZYVrCoUgxFiVBwcmOjyznmfEzrfG2K/cOHNuouyoDHmq6aZ4FWIeHQ+r5DghwgUixrm3t/mnqvGB3v4JIqr9tTlh0ZCA3jlT6oca3kajpYjq/v0BHLm5r9dv9hk885cTpA33fXaBTOJjKeqtt1t6RL8L0+hr1e7pY6KKZjVkMQopui0JAnozfvzwrHcsOTLuPQ5cG89PcidEDJ5TT7z9VVwPC0lHE/qMfKZvzdhUXMy9pDWBRFS8Whic1HQrnxv0O/cHL/EPuItqyfaC8mKFBjj+Qu2HHG1UlNWk1DHmlY2G/u+YiJRdwAiDYDjqdc8V1pm1zn6/Svea1hWJUZMketZZPAgR3bDDc0M7VubHpO0uH/tQQpHsg==:+Ts17FbJPkQmanzG9bC+1W4rQd0AkIcJN7IpRMqCqmk="
 
-def decode_jwt_token(token):
-    """
-    Decodes a JWT token to extract its payload.
-    Note: This doesn't verify the signature, just decodes the payload.
-    """
-    try:
-        # Split the token into parts
-        parts = token.split('.')
-        if len(parts) != 3:
-            return None
-        
-        # Decode the payload (second part)
-        payload = parts[1]
-        # Add padding if needed
-        payload += '=' * (4 - len(payload) % 4)
-        decoded = base64.urlsafe_b64decode(payload)
-        return json.loads(decoded)
-    except Exception as e:
-        logging.error(f"Error decoding JWT token: {e}")
-        return None
-
-def is_token_expired(token):
-    """
-    Checks if the JWT token is expired.
-    """
-    payload = decode_jwt_token(token)
-    if not payload:
-        return True
-    
-    # Get expiration time
-    exp_timestamp = payload.get('exp')
-    if not exp_timestamp:
-        return True
-    
-    # Convert to datetime
-    exp_datetime = datetime.fromtimestamp(exp_timestamp)
-    current_datetime = datetime.now()
-    
-    # Add 5 minutes buffer to refresh before actual expiration
-    buffer_time = timedelta(minutes=5)
-    
-    return current_datetime + buffer_time >= exp_datetime
+def report_token_status(airline, token, response):
+    """Feeds the outcome of a production request into the token validator."""
+    if response.status_code == 401:
+        token_validator.report_unauthorized(airline, token)
+    elif response.ok:
+        token_validator.report_authorized(airline, token)
 
 def get_ar_headers():
     """
@@ -69,8 +51,8 @@ def get_ar_headers():
     """
     global AR_AUTH_TOKEN
     
-    # Check if token is expired
-    if is_token_expired(AR_AUTH_TOKEN):
+    # Check if token is expired (cached verdict, no remote call)
+    if not token_validator.is_valid("ar", AR_AUTH_TOKEN):
         logging.warning("AR token is expired or will expire soon. You need to refresh it manually.")
         logging.info("To get a new token:")
         logging.info("1. Go to https://www.aerolineas.com.ar")
@@ -123,643 +105,432 @@ def get_aireuropa_headers():
         'x-d-token': AIR_EUROPA_D_TOKEN
     }
 
-def fetch_aerolineas_argentinas_flights():
+def level_request(query):
     """
-    Fetches flights from Aerolíneas Argentinas API for multiple routes.
-    Searches for flights between March 10 and April 15 with 20-30 days duration.
-    
-    Returns:
-        A list of Aerolíneas Argentinas flight deals.
+    Returns (params, headers) for a LEVEL calendar query.
     """
-    ar_deals = []
-    
-    # Parse start and end dates
-    start_date = datetime.strptime(SPECIFIC_START_DATE, "%Y-%m-%d")
-    end_date = datetime.strptime(SPECIFIC_END_DATE, "%Y-%m-%d")
-    
-    logging.info(f"Fetching Aerolíneas Argentinas flights: {SPECIFIC_START_DATE} to {SPECIFIC_END_DATE}")
-    
-    # Process each route
-    for route in AR_ROUTES:
-        origin = route["origin"]
-        destination = route["destination"]
-        description = route["description"]
-        threshold = route["threshold_eur"]
-        
-        logging.info(f"Processing AR route: {description}")
-        
-        # Generate all possible outbound dates in the range
-        current_date = start_date
-        while current_date <= end_date:
-            outbound_date_str = current_date.strftime("%Y%m%d")
-            
-            # Calculate valid return date range (20-30 days after outbound)
-            min_return_date = current_date + timedelta(days=MIN_DURATION_DAYS)
-            max_return_date = current_date + timedelta(days=MAX_DURATION_DAYS)
-            
-            # Ensure return date doesn't exceed our end date
-            max_return_date = min(max_return_date, end_date)
-            
-            if min_return_date <= max_return_date:
-                return_date_str = max_return_date.strftime("%Y%m%d")
-                
-                # AR API parameters
-                params = {
-                    'adt': 1,
-                    'inf': 0,
-                    'chd': 0,
-                    'flexDates': 'true',
-                    'cabinClass': 'Economy',
-                    'flightType': 'ROUND_TRIP',
-                    'leg': [f'{origin}-{destination}-{outbound_date_str}', f'{destination}-{origin}-{return_date_str}']
-                }
-                
-                try:
-                    logging.info(f"Fetching AR flights for {description}: {current_date.strftime('%Y-%m-%d')} -> {max_return_date.strftime('%Y-%m-%d')}")
-                    response = requests.get(AR_API_BASE_URL, params=params, headers=get_ar_headers())
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    # Parse AR API response
-                    if 'calendarOffers' in data:
-                        # Check outbound flights (index 0)
-                        if '0' in data['calendarOffers']:
-                            outbound_offers = data['calendarOffers']['0']
-                            for offer in outbound_offers:
-                                if offer.get('leg') and offer.get('offerDetails'):
-                                    offer_date = datetime.strptime(offer['departure'], "%Y-%m-%d")
-                                    if offer_date == current_date:
-                                        outbound_price = offer['offerDetails']['fare']['total']
-                                        
-                                        # Check return flights (index 1)
-                                        if '1' in data['calendarOffers']:
-                                            return_offers = data['calendarOffers']['1']
-                                            for return_offer in return_offers:
-                                                if return_offer.get('leg') and return_offer.get('offerDetails'):
-                                                    return_date = datetime.strptime(return_offer['departure'], "%Y-%m-%d")
-                                                    duration_days = (return_date - current_date).days
-                                                    
-                                                    # Check if return date is within valid range
-                                                    if min_return_date <= return_date <= max_return_date:
-                                                        if MIN_DURATION_DAYS <= duration_days <= MAX_DURATION_DAYS:
-                                                            return_price = return_offer['offerDetails']['fare']['total']
-                                                            total_price = outbound_price + return_price
-                                                            
-                                                            if total_price < threshold:
-                                                                deal = {
-                                                                    "outbound_date": offer['departure'],
-                                                                    "return_date": return_offer['departure'],
-                                                                    "price": total_price,
-                                                                    "currency": "EUR",  # AR API returns EUR
-                                                                    "type": "aerolineas_argentinas",
-                                                                    "duration_days": duration_days,
-                                                                    "airline": "Aerolíneas Argentinas",
-                                                                    "route": description,
-                                                                    "origin": origin,
-                                                                    "destination": destination,
-                                                                    "threshold": threshold
-                                                                }
-                                                                ar_deals.append(deal)
-                                                                logging.info(f"Found AR deal: {description} - {offer['departure']} -> {return_offer['departure']} ({duration_days} days) = {total_price} EUR")
-                                                                break
-                
-                except requests.exceptions.RequestException as e:
-                    logging.error(f"Error fetching AR flights for {description} on {current_date.strftime('%Y-%m-%d')}: {e}")
-                except ValueError as e:
-                    logging.error(f"Error parsing AR flights JSON for {description} on {current_date.strftime('%Y-%m-%d')}: {e}")
-            
-            # Move to next day
-            current_date += timedelta(days=1)
-    
-    return ar_deals
+    params = {
+        'triptype': query.triptype,
+        'origin': query.origin,
+        'destination': query.destination,
+        'month': query.month,
+        'year': query.year,
+        'currencyCode': query.currency
+    }
+    if query.outbound_date:
+        params['outboundDate'] = query.outbound_date
+        dates = f"&dd1={query.outbound_date}&dd2={query.year}-{query.month:02d}-16"
+    else:
+        dates = f"&dd1={query.year}-{query.month:02d}"
+        if query.triptype == 'RT':
+            dates += f"&dd2={query.year}-{query.month:02d}"
 
-def fetch_specific_date_range_flights():
+    round_trip = "&r=true&mm=true" if query.triptype == 'RT' else ""
+    referer = (
+        f"https://www.flylevel.com/Flight/Select?o1={query.origin}&d1={query.destination}"
+        f"{dates}&ADT=1&CHD=0&INL=0{round_trip}&forcedCurrency={query.currency}&forcedCulture=es-ES&newecom=true"
+    )
+
+    headers = BASE_HEADERS.copy()
+    headers['Referer'] = referer
+    return params, headers
+
+def aireuropa_payload(query):
     """
-    Fetches flights for specific date range with duration filtering.
-    Searches for flights between March 10 and April 15 with 20-30 days duration.
-    
-    Returns:
-        A list of specific date range flight deals.
+    Returns the air-calendars payload for an AirEuropa query.
     """
-    specific_deals = []
-    
-    # Parse start and end dates
-    start_date = datetime.strptime(SPECIFIC_START_DATE, "%Y-%m-%d")
-    end_date = datetime.strptime(SPECIFIC_END_DATE, "%Y-%m-%d")
-    
-    logging.info(f"Fetching specific date range flights: {SPECIFIC_START_DATE} to {SPECIFIC_END_DATE}")
-    
-    # Generate all possible outbound dates in the range
-    current_date = start_date
-    while current_date <= end_date:
-        outbound_date_str = current_date.strftime("%Y-%m-%d")
-        
-        # Calculate valid return date range (20-30 days after outbound)
-        min_return_date = current_date + timedelta(days=MIN_DURATION_DAYS)
-        max_return_date = current_date + timedelta(days=MAX_DURATION_DAYS)
-        
-        # Ensure return date doesn't exceed our end date
-        max_return_date = min(max_return_date, end_date)
-        
-        if min_return_date <= max_return_date:
-            # Get return flights for this outbound date
-            return_params = {
-                'triptype': 'RT',
-                'origin': SPECIFIC_ORIGIN,
-                'destination': SPECIFIC_DESTINATION,
-                'outboundDate': outbound_date_str,
-                'month': max_return_date.month,
-                'year': max_return_date.year,
-                'currencyCode': CURRENCY
+    return {
+        "commercialFareFamilies": ["DIGITAL1"],
+        "travelers": [{"passengerTypeCode": "ADT"}],
+        "itineraries": [
+            {
+                "departureDateTime": f"{query.outbound_date}T00:00:00.000",
+                "originLocationCode": query.origin,
+                "destinationLocationCode": query.destination,
+                "flexibility": 7,
+                "isRequestedBound": True
+            },
+            {
+                "departureDateTime": f"{query.return_date}T00:00:00.000",
+                "originLocationCode": query.destination,
+                "destinationLocationCode": query.origin,
+                "isRequestedBound": False
             }
-            
-            return_referer = (
-                f"https://www.flylevel.com/Flight/Select?o1={SPECIFIC_ORIGIN}&d1={SPECIFIC_DESTINATION}"
-                f"&dd1={outbound_date_str}&dd2={max_return_date.strftime('%Y-%m-%d')}&ADT=1&CHD=0&INL=0&r=true&mm=true"
-                f"&forcedCurrency={CURRENCY}&forcedCulture=es-ES&newecom=true"
-            )
-            
-            return_headers = BASE_HEADERS.copy()
-            return_headers['Referer'] = return_referer
-            
-            try:
-                logging.info(f"Fetching return flights for outbound date {outbound_date_str}")
-                return_response = requests.get(API_BASE_URL, params=return_params, headers=return_headers)
-                return_response.raise_for_status()
-                return_data = return_response.json()
-                
-                # Parse return flights
-                return_flights = []
-                if 'data' in return_data and 'dayPrices' in return_data['data']:
-                    for day_info in return_data['data']['dayPrices']:
-                        return_date_str = day_info['date']
-                        return_date = datetime.strptime(return_date_str, "%Y-%m-%d")
-                        
-                        # Check if return date is within valid range
-                        if min_return_date <= return_date <= max_return_date:
-                            duration_days = (return_date - current_date).days
-                            if MIN_DURATION_DAYS <= duration_days <= MAX_DURATION_DAYS:
-                                return_flights.append({
-                                    'date': return_date_str,
-                                    'price': day_info['price'],
-                                    'duration': duration_days
-                                })
-                
-                # Find cheapest return flight
-                if return_flights:
-                    cheapest_return = min(return_flights, key=lambda x: x['price'])
-                    return_date_str = cheapest_return['date']
-                    duration = cheapest_return['duration']
-                    
-                    # Calculate total price (we need to get outbound price)
-                    outbound_params = {
-                        'triptype': 'RT',
-                        'origin': SPECIFIC_ORIGIN,
-                        'destination': SPECIFIC_DESTINATION,
-                        'month': current_date.month,
-                        'year': current_date.year,
-                        'currencyCode': CURRENCY
-                    }
-                    
-                    outbound_referer = (
-                        f"https://www.flylevel.com/Flight/Select?o1={SPECIFIC_ORIGIN}&d1={SPECIFIC_DESTINATION}"
-                        f"&dd1={current_date.strftime('%Y-%m')}&ADT=1&CHD=0&INL=0&r=true&mm=true"
-                        f"&dd2={max_return_date.strftime('%Y-%m')}&forcedCurrency={CURRENCY}&forcedCulture=es-ES&newecom=true"
-                    )
-                    
-                    outbound_headers = BASE_HEADERS.copy()
-                    outbound_headers['Referer'] = outbound_referer
-                    
-                    outbound_response = requests.get(API_BASE_URL, params=outbound_params, headers=outbound_headers)
-                    outbound_response.raise_for_status()
-                    outbound_data = outbound_response.json()
-                    
-                    # Find outbound price for this specific date
-                    outbound_price = None
-                    if 'data' in outbound_data and 'dayPrices' in outbound_data['data']:
-                        for day_info in outbound_data['data']['dayPrices']:
-                            if day_info['date'] == outbound_date_str:
-                                outbound_price = day_info['price']
-                                break
-                    
-                    if outbound_price is not None:
-                        total_price = outbound_price + cheapest_return['price']
-                        
-                        if total_price < SPECIFIC_THRESHOLD_EUR:
-                            deal = {
-                                "outbound_date": outbound_date_str,
-                                "return_date": return_date_str,
-                                "price": total_price,
-                                "currency": CURRENCY,
-                                "type": "specific_range",
-                                "duration_days": duration
-                            }
-                            specific_deals.append(deal)
-                            logging.info(f"Found specific range deal: {outbound_date_str} -> {return_date_str} ({duration} days) = {total_price} {CURRENCY}")
-                
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Error fetching specific range flights for {outbound_date_str}: {e}")
-            except ValueError as e:
-                logging.error(f"Error parsing specific range flights JSON for {outbound_date_str}: {e}")
-        
-        # Move to next day
-        current_date += timedelta(days=1)
-    
-    return specific_deals
+        ],
+        "searchPreferences": {
+            "showUnavailableEntries": True,
+            "showMilesPrice": False
+        }
+    }
 
-def fetch_one_way_flights():
+def _day_prices(data):
+    """(date, price) pairs of a LEVEL calendar, or [] if it failed or is empty."""
+    return data or []
+
+# Latest round trip PriceMatrix per watch name, for queries outside the fetch
+price_matrices = {}
+
+class LevelProvider(Provider):
     """
-    Fetches one-way flight prices from BCN to Buenos Aires for the configured dates.
-    
-    Returns:
-        A list of one-way flight deals.
+    LEVEL calendar API: round trips, one-way flights and date-range round trips.
     """
-    one_way_deals = []
-    
-    for year, month in ONE_WAY_DATES:
-        logging.info(f"Fetching one-way flights BCN -> BUE for {year}-{month}")
-        
-        # API call for one-way flights
-        params = {
-            'triptype': 'OW',  # One-way
-            'origin': ONE_WAY_ORIGIN,
-            'destination': ONE_WAY_DESTINATION,
-            'month': month,
-            'year': year,
-            'currencyCode': CURRENCY
-        }
-        
-        referer = (
-            f"https://www.flylevel.com/Flight/Select?o1={ONE_WAY_ORIGIN}&d1={ONE_WAY_DESTINATION}"
-            f"&dd1={year}-{month}&ADT=1&CHD=0&INL=0&forcedCurrency={CURRENCY}&forcedCulture=es-ES&newecom=true"
-        )
-        
-        headers = BASE_HEADERS.copy()
-        headers['Referer'] = referer
-        
-        try:
-            response = requests.get(API_BASE_URL, params=params, headers=headers)
-            response.raise_for_status()
-            data = response.json()
-            
-            # Parse one-way flights
-            if 'data' in data and 'dayPrices' in data['data']:
-                for day_info in data['data']['dayPrices']:
-                    price = day_info['price']
-                    if price < ONE_WAY_THRESHOLD_EUR:
-                        deal = {
-                            "outbound_date": day_info['date'],
-                            "return_date": None,  # One-way flight
-                            "price": price,
-                            "currency": CURRENCY,
-                            "type": "one_way"
-                        }
-                        one_way_deals.append(deal)
-                        logging.info(f"Found cheap one-way flight: {day_info['date']} = {price} {CURRENCY}")
-            
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching one-way flight data for {year}-{month}: {e}")
-        except ValueError as e:
-            logging.error(f"Error parsing one-way flights JSON for {year}-{month}: {e}")
-    
-    return one_way_deals
 
-def fetch_flight_prices():
-    """
-    Fetches flight prices from the LEVEL API for the configured dates.
-    Makes two separate calls: one for outbound flights and one for return flights.
+    name = "level"
+    watch_types = ("round_trip", "one_way", "specific_range")
+
+    def send(self, session, query):
+        params, headers = level_request(query)
+        return session.get(API_BASE_URL, params=params, headers=headers)
+
+    def extract(self, response):
+        """(date, price) of every day of the calendar."""
+        data = loads(response.content)
+        day_prices = (data.get('data') or {}).get('dayPrices') or []
+        return [(day_info['date'], day_info['price']) for day_info in day_prices]
+
+    def plan(self, watch, responses):
+        if watch.type == "round_trip":
+            return self._plan_round_trip(watch, responses)
+        if watch.type == "specific_range":
+            return self._plan_specific_range(watch, responses)
+        return compile_watch(watch)
+
+    def parse(self, watch, responses):
+        if watch.type == "round_trip":
+            return self._parse_round_trip(watch, responses)
+        if watch.type == "specific_range":
+            return self._parse_specific_range(watch, responses)
+        return self._parse_one_way(watch, responses)
+
+    # Round trips: one outbound calendar per month, then the return calendar
+    # of each outbound date it lists (second call)
+
+    def _outbound_flights(self, watch, data):
+        # Limit to avoid too many requests
+        return _day_prices(data)[:watch.max_outbound_dates]
+
+    def _return_query(self, watch, outbound_date, year, month):
+        return Query("level", watch.origin, watch.destination, "RT", year, month,
+                     outbound_date=outbound_date, currency=watch.currency)
+
+    def _plan_round_trip(self, watch, responses):
+        queries = []
+        for outbound_query in compile_watch(watch):
+            queries.append(outbound_query)
+            for outbound_date, _ in self._outbound_flights(watch, responses.get(outbound_query)):
+                for return_year, return_month in watch.return_months:
+                    queries.append(self._return_query(watch, outbound_date, return_year, return_month))
+        return queries
+
+    def _parse_round_trip(self, watch, responses):
+        """
+        Assembles the calendars into a PriceMatrix (outbound date x return date)
+        and returns the cheapest pair per outbound date within the watch's
+        durations, or every pair under the threshold with all_pairs.
+        """
+        first_return = min(month_bounds(*month)[0] for month in watch.return_months)
+        last_return = max(month_bounds(*month)[1] for month in watch.return_months)
+        matrix = PriceMatrix(first_return, last_return)
+
+        for outbound_query in compile_watch(watch):
+            outbound_flights = self._outbound_flights(watch, responses.get(outbound_query))
+            logging.info(f"Found {len(outbound_flights)} outbound flights for {outbound_query.year}-{outbound_query.month}")
+            for outbound_date, price in outbound_flights:
+                matrix.set_outbound(date_ordinal(outbound_date), price)
+
+            for return_year, return_month in watch.return_months:
+                for outbound_date, _ in outbound_flights:
+                    return_data = responses.get(self._return_query(watch, outbound_date, return_year, return_month))
+                    # Return dates outside the watch's return months fall outside the matrix
+                    if _day_prices(return_data):
+                        matrix.add_returns(date_ordinal(outbound_date), {
+                            date_ordinal(return_date): price
+                            for return_date, price in _day_prices(return_data)
+                        })
+
+        price_matrices[watch.name] = matrix
+
+        if watch.all_pairs:
+            cells = matrix.under(watch.threshold, watch.min_duration_days, watch.max_duration_days)
+        else:
+            cells = matrix.cheapest_per_outbound(watch.min_duration_days, watch.max_duration_days)
+
+        all_deals = []
+        for cell in cells:
+            all_deals.append(Deal(
+                "round_trip", cell.outbound_date, cell.return_date, cell.price, watch.currency,
+                watch.origin, watch.destination, watch.threshold, duration_days=cell.duration_days
+            ))
+            request_log.info("Found deal: %s -> %s = %s %s", cell.outbound_date, cell.return_date, cell.price, watch.currency)
+        return all_deals
+
+    # One-way flights: one calendar per month
+
+    def _parse_one_way(self, watch, responses):
+        one_way_deals = []
+        for query in compile_watch(watch):
+            # Every price is kept for the baselines; main.py applies the threshold
+            for outbound_date, price in _day_prices(responses.get(query)):
+                deal = Deal(
+                    "one_way", outbound_date, None,  # One-way flight
+                    price, watch.currency, watch.origin, watch.destination, watch.threshold
+                )
+                one_way_deals.append(deal)
+                request_log.info("Found one-way flight: %s = %s %s", outbound_date, price, watch.currency)
+        return one_way_deals
+
+    # Date ranges: the return calendar of every outbound date, then the
+    # outbound price from its month calendar, shared by every date in it
+
+    def _specific_queries(self, watch, window):
+        return_query = Query("level", watch.origin, watch.destination, "RT", *iso_month(window.max_return_iso),
+                             outbound_date=window.outbound_iso, currency=watch.currency)
+        outbound_query = Query("level", watch.origin, watch.destination, "RT", *iso_month(window.outbound_iso),
+                               currency=watch.currency)
+        return return_query, outbound_query
 
-    Returns:
-        A list of flight deals, where each deal is a dictionary.
-        Example: [{'outbound_date': '2025-12-10', 'return_date': '2026-04-15', 'price': 240.5, 'currency': 'EUR'}]
-        Returns an empty list if there's an error.
+    def _cheapest_return(self, watch, window, return_data):
+        """Cheapest (price, return date, duration) within the window, or None."""
+        cheapest = None
+        for return_date_str, price in _day_prices(return_data):
+            return_date = date_ordinal(return_date_str)
+            # Check if return date is within valid range
+            if window.min_return <= return_date <= window.max_return:
+                duration_days = return_date - window.outbound
+                if watch.min_duration_days <= duration_days <= watch.max_duration_days:
+                    if cheapest is None or price < cheapest[0]:
+                        cheapest = (price, return_date_str, duration_days)
+        return cheapest
+
+    def _plan_specific_range(self, watch, responses):
+        queries = []
+        for window in watch.outbound_windows():
+            return_query, outbound_query = self._specific_queries(watch, window)
+            queries.append(return_query)
+            # The outbound price is only needed if there is a return to pair it with
+            if self._cheapest_return(watch, window, responses.get(return_query)):
+                queries.append(outbound_query)
+        return queries
+
+    def _parse_specific_range(self, watch, responses):
+        specific_deals = []
+        for window in watch.outbound_windows():
+            outbound_date_str = window.outbound_iso
+            return_query, outbound_query = self._specific_queries(watch, window)
+            cheapest_return = self._cheapest_return(watch, window, responses.get(return_query))
+            if cheapest_return is None:
+                continue
+            return_price, return_date_str, duration = cheapest_return
+
+            # Find outbound price for this specific date
+            outbound_price = None
+            for day, price in _day_prices(responses.get(outbound_query)):
+                if day == outbound_date_str:
+                    outbound_price = price
+                    break
+
+            if outbound_price is not None:
+                total_price = outbound_price + return_price
+
+                # Every price is kept for the baselines; main.py applies the threshold
+                deal = Deal(
+                    "specific_range", outbound_date_str, return_date_str, total_price, watch.currency,
+                    watch.origin, watch.destination, watch.threshold, duration_days=duration
+                )
+                specific_deals.append(deal)
+                request_log.info("Found specific range deal: %s -> %s (%s days) = %s %s", outbound_date_str, return_date_str, duration, total_price, watch.currency)
+        return specific_deals
+
+class AerolineasProvider(Provider):
     """
-    all_deals = []
-    
-    for outbound_year, outbound_month, return_year, return_month in SEARCH_DATES:
-        logging.info(f"Processing outbound: {outbound_year}-{outbound_month}, return: {return_year}-{return_month}")
-        
-        # First call: Get outbound flights (inbound tickets)
-        outbound_params = {
-            'triptype': 'RT',
-            'origin': ORIGIN,
-            'destination': DESTINATION,
-            'month': outbound_month,
-            'year': outbound_year,
-            'currencyCode': CURRENCY
+    Aerolíneas Argentinas offers API: one flexible-dates search per outbound
+    date of the watch's range, paired with returns within its durations.
+    """
+
+    name = "aerolineas_argentinas"
+    watch_types = ("aerolineas_argentinas",)
+    max_concurrency = 2
+
+    def send(self, session, query):
+        params = {
+            'adt': 1,
+            'inf': 0,
+            'chd': 0,
+            'flexDates': 'true',
+            'cabinClass': 'Economy',
+            'flightType': 'ROUND_TRIP',
+            'leg': [
+                f"{query.origin}-{query.destination}-{query.outbound_date.replace('-', '')}",
+                f"{query.destination}-{query.origin}-{query.return_date.replace('-', '')}"
+            ]
         }
-        
-        outbound_referer = (
-            f"https://www.flylevel.com/Flight/Select?o1={ORIGIN}&d1={DESTINATION}"
-            f"&dd1={outbound_year}-{outbound_month:02d}&ADT=1&CHD=0&INL=0&r=true&mm=true"
-            f"&dd2={outbound_year}-{outbound_month:02d}&forcedCurrency={CURRENCY}&forcedCulture=es-ES&newecom=true"
+        response = session.get(AR_API_BASE_URL, params=params, headers=get_ar_headers())
+        report_token_status("ar", AR_AUTH_TOKEN, response)
+        return response
+
+    def extract(self, response):
+        """
+        (departure, fare total) of the bookable outbound (index 0) and return
+        (index 1) offers; the leg and offer details are not kept.
+        """
+        data = loads(response.content)
+        calendar_offers = data.get('calendarOffers') or {}
+        return tuple(
+            [(offer['departure'], offer['offerDetails']['fare']['total'])
+             for offer in calendar_offers.get(index, []) if offer.get('leg') and offer.get('offerDetails')]
+            for index in ('0', '1')
         )
-        
-        outbound_headers = BASE_HEADERS.copy()
-        outbound_headers['Referer'] = outbound_referer
-        
-        try:
-            logging.info(f"Fetching outbound flights for {outbound_year}-{outbound_month}")
-            outbound_response = requests.get(API_BASE_URL, params=outbound_params, headers=outbound_headers)
-            outbound_response.raise_for_status()
-            outbound_data = outbound_response.json()
-            logging.info(f"Outbound API Response received: {len(str(outbound_data))} characters")
-            
-            # Parse outbound flights (new format)
-            outbound_flights = []
-            if 'data' in outbound_data and 'dayPrices' in outbound_data['data']:
-                for day_info in outbound_data['data']['dayPrices']:
-                    outbound_flights.append({
-                        'date': day_info['date'],
-                        'price': day_info['price']
-                    })
-            logging.info(f"Found {len(outbound_flights)} outbound flights")
-            
-            # For each outbound flight, get return flights
-            for outbound_flight in outbound_flights[:5]:  # Limit to first 5 to avoid too many requests
-                outbound_date = outbound_flight['date']
-                
-                # Second call: Get return flights for specific outbound date
-                return_params = {
-                    'triptype': 'RT',
-                    'origin': ORIGIN,
-                    'destination': DESTINATION,
-                    'outboundDate': outbound_date,
-                    'month': return_month,
-                    'year': return_year,
-                    'currencyCode': CURRENCY
-                }
-                
-                return_referer = (
-                    f"https://www.flylevel.com/Flight/Select?o1={ORIGIN}&d1={DESTINATION}"
-                    f"&dd1={outbound_date}&dd2={return_year}-{return_month:02d}-16&ADT=1&CHD=0&INL=0&r=true&mm=true"
-                    f"&forcedCurrency={CURRENCY}&forcedCulture=es-ES&newecom=true"
+
+    def parse(self, watch, responses):
+        ar_deals = []
+        origin = watch.origin
+        destination = watch.destination
+        description = watch.description
+        threshold = watch.threshold
+
+        for query, window in zip(compile_watch(watch), watch.outbound_windows()):
+            data = responses.get(query)
+
+            if not data:
+                continue
+            # Outbound flights (index 0) and return flights (index 1)
+            outbound_offers, return_offers = data
+            for departure, outbound_price in outbound_offers:
+                if departure != window.outbound_iso:
+                    continue
+
+                # Cheapest return within the window; every price is kept for
+                # the baselines, main.py applies the threshold
+                cheapest = None
+                for return_departure, return_price in return_offers:
+                    return_date = date_ordinal(return_departure)
+                    duration_days = return_date - window.outbound
+
+                    # Check if return date is within valid range
+                    if window.min_return <= return_date <= window.max_return:
+                        if watch.min_duration_days <= duration_days <= watch.max_duration_days:
+                            if cheapest is None or return_price < cheapest[0]:
+                                cheapest = (return_price, return_departure, duration_days)
+                if cheapest is None:
+                    continue
+
+                return_price, return_departure, duration_days = cheapest
+                total_price = outbound_price + return_price
+                deal = Deal(
+                    "aerolineas_argentinas", departure, return_departure,
+                    total_price, "EUR",  # AR API returns EUR
+                    origin, destination, threshold, duration_days=duration_days,
+                    airline="Aerolíneas Argentinas", route=description
                 )
-                
-                return_headers = BASE_HEADERS.copy()
-                return_headers['Referer'] = return_referer
-                
-                try:
-                    logging.info(f"Fetching return flights for outbound date {outbound_date}")
-                    return_response = requests.get(API_BASE_URL, params=return_params, headers=return_headers)
-                    return_response.raise_for_status()
-                    return_data = return_response.json()
-                    
-                    # Parse return flights (new format)
-                    return_flights = []
-                    if 'data' in return_data and 'dayPrices' in return_data['data']:
-                        for day_info in return_data['data']['dayPrices']:
-                            return_date = day_info['date']
-                            # Filter to only include return dates in April or May 2026
-                            if return_date.startswith('2026-04') or return_date.startswith('2026-05'):
-                                return_flights.append({
-                                    'date': return_date,
-                                    'price': day_info['price']
-                                })
-                            else:
-                                logging.warning(f"Skipping return date {return_date} - not in configured months (Apr/May 2026)")
-                    
-                    # Find cheapest return flight
-                    if return_flights:
-                        cheapest_return = min(return_flights, key=lambda x: x['price'])
-                        return_date = cheapest_return['date']
-                        
-                        # Calculate total price
-                        total_price = outbound_flight['price'] + cheapest_return['price']
-                        
-                        deal = {
-                            "outbound_date": outbound_date,
-                            "return_date": return_date,
-                            "price": total_price,
-                            "currency": CURRENCY,
-                            "type": "round_trip"
-                        }
-                        all_deals.append(deal)
-                        logging.info(f"Found deal: {outbound_date} -> {return_date} = {total_price} {CURRENCY}")
-                    else:
-                        logging.info(f"No valid return flights found for outbound date {outbound_date} in Apr/May 2026")
-                    
-                except requests.exceptions.RequestException as e:
-                    logging.error(f"Error fetching return flights for {outbound_date}: {e}")
-                except ValueError as e:
-                    logging.error(f"Error parsing return flights JSON for {outbound_date}: {e}")
-                    
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching outbound flight data: {e}")
-        except ValueError as e:
-            logging.error(f"Error parsing outbound flights JSON: {e}")
-            
-    return all_deals
-
-def fetch_aireuropa_flights():
+                ar_deals.append(deal)
+                request_log.info("Found AR deal: %s - %s -> %s (%s days) = %s EUR", description, departure, return_departure, duration_days, total_price)
+
+        return ar_deals
+
+class AirEuropaProvider(Provider):
     """
-    Fetches flights from AirEuropa API for multiple routes.
-    Searches for flights between March 10 and April 15 with 20-30 days duration.
-    
-    Returns:
-        A list of AirEuropa flight deals.
+    AirEuropa air-calendars API: one search per outbound date of the watch's
+    range, for the return at the end of its longest duration.
     """
-    aireuropa_deals = []
-    
-    # Parse start and end dates
-    start_date = datetime.strptime(SPECIFIC_START_DATE, "%Y-%m-%d")
-    end_date = datetime.strptime(SPECIFIC_END_DATE, "%Y-%m-%d")
-    
-    logging.info(f"Fetching AirEuropa flights: {SPECIFIC_START_DATE} to {SPECIFIC_END_DATE}")
-    
-    # Process each route
-    for route in AIR_EUROPA_ROUTES:
-        origin = route["origin"]
-        destination = route["destination"]
-        description = route["description"]
-        threshold = route["threshold_eur"]
-        
-        logging.info(f"Processing AirEuropa route: {description}")
-        
-        # Generate all possible outbound dates in the range
-        current_date = start_date
-        while current_date <= end_date:
-            outbound_date_str = current_date.strftime("%Y-%m-%d")
-            
-            # Calculate valid return date range (20-30 days after outbound)
-            min_return_date = current_date + timedelta(days=MIN_DURATION_DAYS)
-            max_return_date = current_date + timedelta(days=MAX_DURATION_DAYS)
-            
-            # Ensure return date doesn't exceed our end date
-            max_return_date = min(max_return_date, end_date)
-            
-            if min_return_date <= max_return_date:
-                return_date_str = max_return_date.strftime("%Y-%m-%d")
-                
-                # AirEuropa API payload
-                payload = {
-                    "commercialFareFamilies": ["DIGITAL1"],
-                    "travelers": [{"passengerTypeCode": "ADT"}],
-                    "itineraries": [
-                        {
-                            "departureDateTime": f"{outbound_date_str}T00:00:00.000",
-                            "originLocationCode": origin,
-                            "destinationLocationCode": destination,
-                            "flexibility": 7,
-                            "isRequestedBound": True
-                        },
-                        {
-                            "departureDateTime": f"{return_date_str}T00:00:00.000",
-                            "originLocationCode": destination,
-                            "destinationLocationCode": origin,
-                            "isRequestedBound": False
-                        }
-                    ],
-                    "searchPreferences": {
-                        "showUnavailableEntries": True,
-                        "showMilesPrice": False
-                    }
-                }
-                
-                try:
-                    logging.info(f"Fetching AirEuropa flights for {description}: {current_date.strftime('%Y-%m-%d')} -> {max_return_date.strftime('%Y-%m-%d')}")
-                    response = requests.post(AIR_EUROPA_API_BASE_URL, json=payload, headers=get_aireuropa_headers())
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    # Parse AirEuropa API response
-                    if 'data' in data:
-                        for flight_data in data['data']:
-                            departure_date = flight_data.get('departureDate')
-                            return_date = flight_data.get('returnDate')
-                            
-                            # Check if dates match our search criteria
-                            if departure_date == outbound_date_str and return_date == return_date_str:
-                                # Calculate duration
-                                dep_date = datetime.strptime(departure_date, "%Y-%m-%d")
-                                ret_date = datetime.strptime(return_date, "%Y-%m-%d")
-                                duration_days = (ret_date - dep_date).days
-                                
-                                # Check if duration is within valid range
-                                if MIN_DURATION_DAYS <= duration_days <= MAX_DURATION_DAYS:
-                                    # Get price (convert from centavos to euros)
-                                    if 'prices' in flight_data and 'totalPrices' in flight_data['prices']:
-                                        total_price_centavos = flight_data['prices']['totalPrices'][0]['total']
-                                        total_price_eur = total_price_centavos / 100  # Convert centavos to euros
-                                        
-                                        if total_price_eur < threshold:
-                                            deal = {
-                                                "outbound_date": departure_date,
-                                                "return_date": return_date,
-                                                "price": total_price_eur,
-                                                "currency": "EUR",
-                                                "type": "aireuropa",
-                                                "duration_days": duration_days,
-                                                "airline": "AirEuropa",
-                                                "route": description,
-                                                "origin": origin,
-                                                "destination": destination,
-                                                "threshold": threshold
-                                            }
-                                            aireuropa_deals.append(deal)
-                                            logging.info(f"Found AirEuropa deal: {description} - {departure_date} -> {return_date} ({duration_days} days) = {total_price_eur} EUR")
-                                            break
-                    
-                except requests.exceptions.RequestException as e:
-                    logging.error(f"Error fetching AirEuropa flights for {description} on {current_date.strftime('%Y-%m-%d')}: {e}")
-                except ValueError as e:
-                    logging.error(f"Error parsing AirEuropa flights JSON for {description} on {current_date.strftime('%Y-%m-%d')}: {e}")
-            
-            # Move to next day
-            current_date += timedelta(days=1)
-    
-    return aireuropa_deals
 
-def fetch_all_flights():
+    name = "aireuropa"
+    watch_types = ("aireuropa",)
+    max_concurrency = 2
+
+    def send(self, session, query):
+        response = session.post(AIR_EUROPA_API_BASE_URL, json=aireuropa_payload(query), headers=get_aireuropa_headers())
+        report_token_status("aireuropa", AIR_EUROPA_D_TOKEN, response)
+        return response
+
+    def extract(self, response):
+        """(departure date, return date, total in centavos) of every priced entry."""
+        data = loads(response.content)
+        return [
+            (flight_data.get('departureDate'), flight_data.get('returnDate'), flight_data['prices']['totalPrices'][0]['total'])
+            for flight_data in data.get('data') or []
+            if 'totalPrices' in (flight_data.get('prices') or {})
+        ]
+
+    def parse(self, watch, responses):
+        aireuropa_deals = []
+        origin = watch.origin
+        destination = watch.destination
+        description = watch.description
+        threshold = watch.threshold
+
+        for query, window in zip(compile_watch(watch), watch.outbound_windows()):
+            data = responses.get(query)
+            outbound_date_str = window.outbound_iso
+            return_date_str = window.max_return_iso
+
+            if not data:
+                continue
+            # Cheapest entry for the searched dates; every price is kept for
+            # the baselines, main.py applies the threshold
+            cheapest = None
+            for departure_date, return_date, total_price_centavos in data:
+                # Check if dates match our search criteria
+                if departure_date == outbound_date_str and return_date == return_date_str:
+                    if cheapest is None or total_price_centavos < cheapest:
+                        cheapest = total_price_centavos
+            if cheapest is None:
+                continue
+
+            # Calculate duration
+            duration_days = window.max_return - window.outbound
+
+            # Check if duration is within valid range
+            if watch.min_duration_days <= duration_days <= watch.max_duration_days:
+                total_price_eur = cheapest / 100  # Convert centavos to euros
+                deal = Deal(
+                    "aireuropa", outbound_date_str, return_date_str, total_price_eur, "EUR",
+                    origin, destination, threshold, duration_days=duration_days,
+                    airline="AirEuropa", route=description
+                )
+                aireuropa_deals.append(deal)
+                request_log.info("Found AirEuropa deal: %s - %s -> %s (%s days) = %s EUR", description, outbound_date_str, return_date_str, duration_days, total_price_eur)
+
+        return aireuropa_deals
+
+for provider in (LevelProvider(), AerolineasProvider(), AirEuropaProvider()):
+    register(provider)
+
+# Shared runtime: every provider's queries go through the one session
+runtime = Runtime(session)
+
+def begin_cycle():
+    """Forgets the responses of the previous cycle."""
+    runtime.begin_cycle()
+
+def fetch_all_flights(plan=None, reuse_responses=False):
     """
-    Fetches all types of flights: round trip, one-way, specific date range, and Aerolíneas Argentinas.
+    Fetches the deals of every enabled watch in the search plan.
+    Queries shared between watches are sent once per cycle. With
+    reuse_responses, responses from the previous cycle are served again and
+    only queries it did not send hit the network.
     """
-    round_trip_deals = fetch_flight_prices()
-    one_way_deals = fetch_one_way_flights()
-    specific_deals = fetch_specific_date_range_flights()
-    # ar_deals = fetch_aerolineas_argentinas_flights()
-    # aireuropa_deals = fetch_aireuropa_flights()
-    
-    # return round_trip_deals + one_way_deals + specific_deals + ar_deals + aireuropa_deals
-    return round_trip_deals + one_way_deals + specific_deals
+    plan = plan or current_plan()
+    if not reuse_responses:
+        begin_cycle()
+    return runtime.run(plan.enabled_watches)
 
 def check_ar_token():
     """
     Check if the Aerolíneas Argentinas token is valid.
+    Uses the local JWT expiry and any 401 seen on real requests, no remote call.
     Returns True if token is valid, False otherwise.
     """
-    try:
-        # Try to make a simple API call to test the token
-        test_params = {
-            'adt': 1,
-            'inf': 0,
-            'chd': 0,
-            'flexDates': 'true',
-            'cabinClass': 'Economy',
-            'flightType': 'ROUND_TRIP',
-            'leg': ['MAD-COR-20241201', 'COR-MAD-20241215']
-        }
-        
-        response = requests.get(AR_API_BASE_URL, params=test_params, headers=get_ar_headers(), timeout=10)
-        
-        # If we get a 401, token is invalid
-        if response.status_code == 401:
-            logging.warning("AR token is invalid (401 Unauthorized)")
-            return False
-        
-        # If we get a 200, token is valid
-        if response.status_code == 200:
-            logging.info("AR token is valid")
-            return True
-        
-        # For other status codes, assume token is valid (might be other API issues)
-        logging.info(f"AR token check returned status {response.status_code}, assuming valid")
-        return True
-        
-    except Exception as e:
-        logging.error(f"Error checking AR token: {e}")
-        return False
+    valid = token_validator.is_valid("ar", AR_AUTH_TOKEN)
+    logging.info(f"AR token is {'valid' if valid else 'invalid'}")
+    return valid
 
 def check_aireuropa_token():
     """
     Check if the AirEuropa tokens are valid.
+    The tokens are opaque, so they are trusted until a real request, in this
+    or any other process (see token_validator.py), gets a 401.
     Returns True if tokens are valid, False otherwise.
     """
-    try:
-        # Try to make a simple API call to test the tokens
-        test_payload = {
-            "origin": "MAD",
-            "destination": "COR",
-            "departureDate": "2024-12-01",
-            "returnDate": "2024-12-15",
-            "adults": 1,
-            "children": 0,
-            "infants": 0,
-            "cabinClass": "economy",
-            "fareFamily": "DIGITAL1"
-        }
-        
-        response = requests.post(
-            AIR_EUROPA_API_BASE_URL,
-            json=test_payload,
-            headers=get_aireuropa_headers(),
-            timeout=10
-        )
-        
-        # If we get a 401, tokens are invalid
-        if response.status_code == 401:
-            logging.warning("AirEuropa tokens are invalid (401 Unauthorized)")
-            return False
-        
-        # If we get a 200, tokens are valid
-        if response.status_code == 200:
-            logging.info("AirEuropa tokens are valid")
-            return True
-        
-        # For other status codes, assume tokens are valid (might be other API issues)
-        logging.info(f"AirEuropa token check returned status {response.status_code}, assuming valid")
-        return True
-        
-    except Exception as e:
-        logging.error(f"Error checking AirEuropa tokens: {e}")
-        return False
\ No newline at end of file
+    valid = token_validator.is_valid("aireuropa", AIR_EUROPA_D_TOKEN)
+    logging.info(f"AirEuropa tokens are {'valid' if valid else 'invalid'}")
+    return valid
@@ -6,7 +6,6 @@ Captures tokens from network requests using browser automation.
 
 import logging
 import time
-import json
 import re
 import base64
 from datetime import datetime
@@ -17,10 +16,17 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException
 import requests
+from log_setup import configure_logging
+from token_capture import (
+    extract_tokens, strip_bearer,
+    AR_API_HOST, AR_TOKEN_HEADERS, AIR_EUROPA_API_HOST, AIR_EUROPA_TOKEN_HEADERS
+)
+from token_providers import HttpTokenProvider, AIR_EUROPA_AUTH, AIR_EUROPA_D_TOKEN
 
 class AutoTokenRefresh:
     def __init__(self):
         self.driver = None
+        self.http_provider = HttpTokenProvider()
         self.ar_token = None
         self.aireuropa_auth = None
         self.aireuropa_d_token = None
@@ -28,10 +34,7 @@ class AutoTokenRefresh:
     
     def setup_logging(self):
         """Setup logging for token refresh."""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        configure_logging()
     
     def setup_driver(self):
         """Setup Chrome driver with network logging enabled."""
@@ -57,37 +60,27 @@ class AutoTokenRefresh:
     def extract_tokens_from_logs(self):
         """Extract tokens from network logs."""
         try:
-            logs = self.driver.get_log('performance')
+            targets = {
+                AR_API_HOST: AR_TOKEN_HEADERS,
+                AIR_EUROPA_API_HOST: AIR_EUROPA_TOKEN_HEADERS
+            }
+            captured = extract_tokens(self.driver.get_log('performance'), targets)
             
-            for log in logs:
-                try:
-                    log_entry = json.loads(log['message'])
-                    
-                    # Check for network requests
-                    if 'message' in log_entry and log_entry['message']['method'] == 'Network.requestWillBeSent':
-                        request = log_entry['message']['params']['request']
-                        url = request['url']
-                        headers = request.get('headers', {})
-                        
-                        # Look for AR API calls
-                        if 'api.aerolineas.com.ar' in url and 'authorization' in headers:
-                            auth_header = headers['authorization']
-                            if auth_header.startswith('Bearer '):
-                                self.ar_token = auth_header.replace('Bearer ', '')
-                                logging.info(f"Captured AR token: {self.ar_token[:50]}...")
-                        
-                        # Look for AirEuropa API calls
-                        elif 'digital.aireuropa.com' in url:
-                            if 'authorization' in headers:
-                                self.aireuropa_auth = headers['authorization']
-                                logging.info(f"Captured AirEuropa auth: {self.aireuropa_auth[:50]}...")
-                            
-                            if 'd-token' in headers:
-                                self.aireuropa_d_token = headers['d-token']
-                                logging.info(f"Captured AirEuropa d-token: {self.aireuropa_d_token[:50]}...")
-                
-                except (json.JSONDecodeError, KeyError):
-                    continue
+            # Look for AR API calls
+            ar_auth = captured[AR_API_HOST].get('authorization', '')
+            if ar_auth.startswith('Bearer '):
+                self.ar_token = strip_bearer(ar_auth)
+                logging.info(f"Captured AR token: {self.ar_token[:50]}...")
+            
+            # Look for AirEuropa API calls
+            ae_headers = captured[AIR_EUROPA_API_HOST]
+            if ae_headers.get('authorization'):
+                self.aireuropa_auth = strip_bearer(ae_headers['authorization'])
+                logging.info(f"Captured AirEuropa auth: {self.aireuropa_auth[:50]}...")
+            
+            if ae_headers.get('x-d-token'):
+                self.aireuropa_d_token = ae_headers['x-d-token']
+                logging.info(f"Captured AirEuropa d-token: {self.aireuropa_d_token[:50]}...")
             
             return True
             
@@ -101,35 +94,8 @@ class AutoTokenRefresh:
         """
         logging.info("Attempting manual AR token refresh...")
         
-        try:
-            # AR uses Auth0, so we need to get a new token from their auth endpoint
-            auth_url = "https://aerolineas-test.auth0.com/oauth/token"
-            
-            payload = {
-                "client_id": "oy81ZUn6IX1gv4eGceSFIyaFfhH6a6G",
-                "client_secret": "YOUR_CLIENT_SECRET",  # This would need to be obtained
-                "audience": "ar-auth",
-                "grant_type": "client_credentials",
-                "scope": "catalog:read catalog:admin rules:payment:read rules:shopping:read rules:checkout:read loyalty:read"
-            }
-            
-            # For now, we'll use a simpler approach - try to get token from their public endpoint
-            response = requests.get("https://www.aerolineas.com.ar/api/v1/flights/search", 
-                                  headers={"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36"})
-            
-            if response.status_code == 401:
-                # Token expired, we need to get a new one
-                logging.info("AR token expired, attempting to get new one...")
-                
-                # This is a simplified approach - in practice you'd need the actual client credentials
-                # For now, we'll return False to indicate manual intervention is needed
-                return False
-            
-            return True
-            
-        except Exception as e:
-            logging.error(f"Error in manual AR token refresh: {e}")
-            return False
+        self.ar_token = self.http_provider.fetch_ar_token()
+        return self.ar_token is not None
     
     def refresh_aireuropa_token_manual(self):
         """
@@ -137,47 +103,10 @@ class AutoTokenRefresh:
         """
         logging.info("Attempting manual AirEuropa token refresh...")
         
-        try:
-            # Try to get tokens from their public endpoints
-            session = requests.Session()
-            
-            # Get initial page to capture tokens
-            response = session.get("https://digital.aireuropa.com/es/vuelos",
-                                 headers={"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36"})
-            
-            # Look for tokens in response headers or cookies
-            if 'authorization' in response.headers:
-                self.aireuropa_auth = response.headers['authorization']
-            
-            if 'd-token' in response.headers:
-                self.aireuropa_d_token = response.headers['d-token']
-            
-            # Try to make a search request to trigger token generation
-            search_url = "https://digital.aireuropa.com/api/v1/flights/search"
-            search_payload = {
-                "origin": "MAD",
-                "destination": "COR",
-                "departureDate": "2025-12-15",
-                "returnDate": "2025-12-22",
-                "adults": 1,
-                "children": 0,
-                "infants": 0
-            }
-            
-            response = session.post(search_url, json=search_payload)
-            
-            # Check for new tokens in response
-            if 'authorization' in response.headers:
-                self.aireuropa_auth = response.headers['authorization']
-            
-            if 'd-token' in response.headers:
-                self.aireuropa_d_token = response.headers['d-token']
-            
-            return True
-            
-        except Exception as e:
-            logging.error(f"Error in manual AirEuropa token refresh: {e}")
-            return False
+        tokens = self.http_provider.fetch_aireuropa_tokens()
+        self.aireuropa_auth = tokens.get(AIR_EUROPA_AUTH)
+        self.aireuropa_d_token = tokens.get(AIR_EUROPA_D_TOKEN)
+        return bool(tokens)
     
     def update_tokens_in_file(self):
         """Update tokens in the api_client.py file."""
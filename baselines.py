@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Rolling price baselines for drop alerts.
+
+Every cell (airline, route, outbound, return) and every route keeps running
+statistics: EWMA, EWMA of the absolute deviation, minimum and a streaming
+quantile estimate. Every cycle folds in the price of each cell it saw,
+changed or not, so the statistics weigh a price by how long it was offered
+and BASELINE_MIN_SAMPLES counts sightings. Each observation updates them in
+O(1); history is never rescanned. A price is a drop when it is at least BASELINE_DROP_PERCENT
+below the baseline of its cell, or of its route while the cell is still new.
+Statistics live in memory and in the price_baselines table.
+"""
+
+import logging
+from typing import NamedTuple
+from config import (
+    BASELINE_ALPHA, BASELINE_QUANTILE, BASELINE_REFERENCE, BASELINE_DROP_PERCENT, BASELINE_MIN_SAMPLES
+)
+from change_tracker import row_key
+import database
+
+# Key columns of the route-level row
+ROUTE_DATE = "*"
+
+class Stats:
+    """Running statistics of one price series."""
+
+    __slots__ = ("count", "ewma", "deviation", "minimum", "quantile")
+
+    def __init__(self, count=0, ewma=0.0, deviation=0.0, minimum=0.0, quantile=0.0):
+        self.count = count
+        self.ewma = ewma
+        self.deviation = deviation
+        self.minimum = minimum
+        self.quantile = quantile
+
+    def update(self, price, alpha=BASELINE_ALPHA, q=BASELINE_QUANTILE):
+        if self.count == 0:
+            self.ewma = self.minimum = self.quantile = price
+        else:
+            self.deviation += alpha * (abs(price - self.ewma) - self.deviation)
+            self.ewma += alpha * (price - self.ewma)
+            self.minimum = min(self.minimum, price)
+            # Stochastic approximation of the q-quantile; the step follows the
+            # series' spread (at least 1 unit so a flat series can still move)
+            step = alpha * max(self.deviation, 1.0)
+            self.quantile += step * (q if price > self.quantile else q - 1)
+        self.count += 1
+
+    def as_row(self):
+        return self.count, self.ewma, self.deviation, self.minimum, self.quantile
+
+class Drop(NamedTuple):
+    """A price below its baseline."""
+    baseline: float
+    percent: float
+    scope: str  # "cell" or "route"
+
+class BaselineEngine:
+    """Per-cell and per-route statistics, updated as prices are observed."""
+
+    def __init__(self, reference=BASELINE_REFERENCE, drop_percent=BASELINE_DROP_PERCENT,
+                 min_samples=BASELINE_MIN_SAMPLES):
+        self.reference = reference
+        self.drop_percent = drop_percent
+        self.min_samples = min_samples
+        self.stats = None
+        self._dirty = set()
+
+    def load(self):
+        """Loads the stored statistics from the database."""
+        self.stats = {}
+        for airline, route, outbound_date, return_date, *row in database.load_baselines():
+            self.stats[(airline, route, outbound_date, return_date)] = Stats(*row)
+        logging.info(f"Loaded {len(self.stats)} price baselines")
+
+    def _drop(self, stats, price, scope):
+        if stats is None or stats.count < self.min_samples:
+            return None
+        baseline = getattr(stats, self.reference)
+        if baseline <= 0:
+            return None
+        percent = (baseline - price) / baseline * 100
+        return Drop(baseline, percent, scope) if percent >= self.drop_percent else None
+
+    def _keys(self, route, cell):
+        if self.stats is None:
+            self.load()
+        return row_key(route, cell), (*route, ROUTE_DATE, ROUTE_DATE)
+
+    def check(self, route, cell, price):
+        """
+        Checks price against the current baselines without folding it in.
+        Returns a Drop, or None if the price is not a drop.
+        """
+        cell_key, route_key = self._keys(route, cell)
+        cell_stats = self.stats.get(cell_key)
+        if cell_stats is not None and cell_stats.count >= self.min_samples:
+            return self._drop(cell_stats, price, "cell")
+        return self._drop(self.stats.get(route_key), price, "route")
+
+    def observe(self, route, cell, price):
+        """
+        Checks price against the current baselines, then folds it into them.
+        Returns a Drop, or None if the price is not a drop.
+        """
+        drop = self.check(route, cell, price)
+        for key in self._keys(route, cell):
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = Stats()
+            stats.update(price)
+            self._dirty.add(key)
+        return drop
+
+    def flush(self):
+        """Writes the statistics updated since the last flush."""
+        if not self._dirty:
+            return
+        database.save_baselines([(*key, *self.stats[key].as_row()) for key in self._dirty])
+        self._dirty.clear()
+
+# Shared engine for the worker process
+baseline_engine = BaselineEngine()
@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the fetch-and-notify pipeline.
+Serves LEVEL calendar, AR calendarOffers and AirEuropa air-calendars payloads
+from a local stub server, runs full check_flights_and_notify cycles against it
+and reports wall time, requests/sec, request latency, DB time and peak RSS.
+
+With --startup it measures cold start instead: it launches the worker in
+fresh interpreters under `-X importtime` and reports import times and the
+time from process start to the first airline request. With --parse it
+times, per generated payload, the full response.json() tree against each
+provider's extract() and reports the tracemalloc peak of both.
+
+Usage:
+    python benchmark.py --cycles 3 --latency-ms 20 --error-rate 0.05
+    python benchmark.py --replay fixtures   # recorded with API_CLIENT_MODE=record
+    python benchmark.py --startup --runs 5 --target-ms 400
+    python benchmark.py --parse
+"""
+
+import argparse
+import calendar
+import contextlib
+import dataclasses
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+import api_client
+import database
+import fixtures
+import main
+import notifier
+import price_history
+import providers
+import search_plan
+
+LEVEL_PATH = "/nwe/flights/api/calendar/"
+AR_PATH = "/v1/flights/offers"
+AIR_EUROPA_PATH = "/v2/search/air-calendars"
+
+# Database writes of a cycle, timed for the "DB time" line
+DB_WRITES = (
+    (database, "save_cell_changes"),
+    (database, "save_baselines"),
+    (price_history, "record_observations"),
+)
+
+# --airlines names -> airline of the search plan watches
+BENCH_AIRLINES = {"level": "level", "ar": "aerolineas_argentinas", "aireuropa": "aireuropa"}
+
+def level_calendar_payload(rng, year, month):
+    """LEVEL calendar response with one price per day of the month."""
+    days = calendar.monthrange(year, month)[1]
+    return {
+        "data": {
+            "dayPrices": [
+                {"date": f"{year}-{month:02d}-{day:02d}", "price": round(rng.uniform(150, 600), 2)}
+                for day in range(1, days + 1)
+            ]
+        }
+    }
+
+def ar_offer(rng, day):
+    return {
+        "departure": day.isoformat(),
+        "leg": {"segments": []},
+        "offerDetails": {"fare": {"total": round(rng.uniform(200, 700), 2)}}
+    }
+
+def ar_calendar_payload(rng, legs):
+    """AR calendarOffers response around the requested outbound and return legs."""
+    outbound = date(int(legs[0][-8:-4]), int(legs[0][-4:-2]), int(legs[0][-2:]))
+    inbound = date(int(legs[1][-8:-4]), int(legs[1][-4:-2]), int(legs[1][-2:]))
+    return {
+        "calendarOffers": {
+            "0": [ar_offer(rng, outbound + timedelta(days=offset)) for offset in range(-3, 4)],
+            "1": [ar_offer(rng, outbound + timedelta(days=offset)) for offset in range((inbound - outbound).days + 1)]
+        }
+    }
+
+def aireuropa_calendar_payload(rng, payload):
+    """AirEuropa air-calendars response with prices in centavos."""
+    itineraries = payload.get("itineraries", [])
+    if len(itineraries) < 2:
+        return {"data": []}
+    outbound = date.fromisoformat(itineraries[0]["departureDateTime"][:10])
+    inbound = itineraries[1]["departureDateTime"][:10]
+    return {
+        "data": [
+            {
+                "departureDate": (outbound + timedelta(days=offset)).isoformat(),
+                "returnDate": inbound,
+                "prices": {"totalPrices": [{"total": rng.randint(40000, 150000)}]}
+            }
+            for offset in range(-7, 8)
+        ]
+    }
+
+class StubServer:
+    """
+    Local HTTP server replaying airline API payloads.
+    Adds a fixed latency per request and fails a share of them with 500.
+    """
+
+    def __init__(self, latency_ms=0, error_rate=0.0, seed=42):
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        # perf_counter() of the first request received
+        self.first_request_at = None
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, body=None):
+                if stub.latency:
+                    time.sleep(stub.latency)
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                with stub.lock:
+                    if stub.first_request_at is None:
+                        stub.first_request_at = time.perf_counter()
+                    if stub.rng.random() < stub.error_rate:
+                        return self._reply(500, {"error": "injected"})
+                    if url.path == LEVEL_PATH:
+                        payload = level_calendar_payload(stub.rng, int(query["year"][0]), int(query["month"][0]))
+                    elif url.path == AR_PATH:
+                        payload = ar_calendar_payload(stub.rng, query["leg"])
+                    elif url.path == AIR_EUROPA_PATH:
+                        payload = aireuropa_calendar_payload(stub.rng, body or {})
+                    else:
+                        return self._reply(404, {"error": "not found"})
+                self._reply(200, payload)
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                self._handle(json.loads(self.rfile.read(length) or b"{}"))
+
+        return Handler
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+class Recorder:
+    """Wraps a callable and records how long each call takes."""
+
+    def __init__(self, func):
+        self.func = func
+        self.durations = []
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            self.durations.append(time.perf_counter() - start)
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+def run_benchmark(cycles=3, latency_ms=0, error_rate=0.0, airlines=("level",), seed=42, replay_dir=None):
+    """
+    Runs the given number of cycles against the stub server, or against
+    recorded fixtures when replay_dir is given.
+    Returns a dict with the collected measurements.
+    """
+    db_dir = tempfile.mkdtemp(prefix="bench-")
+    originals = {
+        (api_client, "API_BASE_URL"): api_client.API_BASE_URL,
+        (api_client, "AR_API_BASE_URL"): api_client.AR_API_BASE_URL,
+        (api_client, "AIR_EUROPA_API_BASE_URL"): api_client.AIR_EUROPA_API_BASE_URL,
+        (api_client, "fetch_all_flights"): api_client.fetch_all_flights,
+        (database, "DB_FILE"): database.DB_FILE,
+        (main, "METRICS_SNAPSHOT_FILE"): main.METRICS_SNAPSHOT_FILE,
+        **{(owner, name): getattr(owner, name) for owner, name in DB_WRITES},
+        (notifier, "send_telegram_notification"): notifier.send_telegram_notification,
+        (requests.Session, "request"): requests.Session.request,
+        (api_client.session, "adapters"): api_client.session.adapters.copy(),
+    }
+
+    request_timer = Recorder(requests.Session.request)
+    db_timers = [Recorder(getattr(owner, name)) for owner, name in DB_WRITES]
+    notifications = []
+
+    # Every watch of the selected airlines, including the ones disabled in the plan
+    selected = {BENCH_AIRLINES[airline] for airline in airlines}
+    bench_plan = search_plan.SearchPlan(
+        dataclasses.replace(watch, enabled=True)
+        for watch in search_plan.current_plan().watches if watch.airline in selected
+    )
+
+    def fetch_selected_flights(plan=None, reuse_responses=False):
+        return originals[(api_client, "fetch_all_flights")](plan or bench_plan, reuse_responses)
+
+    cycle_times = []
+    with contextlib.ExitStack() as stack:
+        try:
+            if replay_dir:
+                # Fixtures are keyed by the real API URLs, so those stay untouched
+                fixtures.install(api_client.session, "replay", replay_dir)
+            else:
+                stub = stack.enter_context(StubServer(latency_ms, error_rate, seed))
+                api_client.API_BASE_URL = stub.url + LEVEL_PATH
+                api_client.AR_API_BASE_URL = stub.url + AR_PATH
+                api_client.AIR_EUROPA_API_BASE_URL = stub.url + AIR_EUROPA_PATH
+            api_client.fetch_all_flights = fetch_selected_flights
+            database.DB_FILE = os.path.join(db_dir, "bench.db")
+            main.METRICS_SNAPSHOT_FILE = os.path.join(db_dir, "metrics.prom")
+            for (owner, name), timer in zip(DB_WRITES, db_timers):
+                setattr(owner, name, timer)
+            notifier.send_telegram_notification = lambda message, **kwargs: notifications.append(message)
+            requests.Session.request = lambda self, *args, **kwargs: request_timer(self, *args, **kwargs)
+
+            database.init_db()
+            for _ in range(cycles):
+                start = time.perf_counter()
+                main.check_flights_and_notify()
+                cycle_times.append(time.perf_counter() - start)
+        finally:
+            for (owner, name), value in originals.items():
+                setattr(owner, name, value)
+
+    latencies = request_timer.durations
+    total_time = sum(cycle_times)
+    return {
+        "cycles": cycles,
+        "cycle_seconds": cycle_times,
+        "requests": len(latencies),
+        "requests_per_second": len(latencies) / total_time if total_time else 0.0,
+        "latency_p50_ms": percentile(latencies, 50) * 1000,
+        "latency_p99_ms": percentile(latencies, 99) * 1000,
+        "db_seconds": sum(sum(timer.durations) for timer in db_timers),
+        "db_calls": sum(len(timer.durations) for timer in db_timers),
+        "notifications": len(notifications),
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+# Run by measure_startup() in a fresh interpreter: points the worker at the
+# stub server, a throwaway database and metrics file, mutes Telegram and starts it
+STARTUP_DRIVER = """
+import sys
+import os
+stub_url, db_file = sys.argv[1:3]
+import main
+import api_client, database, notifier
+main.METRICS_SNAPSHOT_FILE = os.path.join(os.path.dirname(db_file), "metrics.prom")
+api_client.API_BASE_URL = stub_url + %r
+api_client.AR_API_BASE_URL = stub_url + %r
+api_client.AIR_EUROPA_API_BASE_URL = stub_url + %r
+database.DB_FILE = db_file
+notifier.send_telegram_notification = lambda message, **kwargs: None
+main.main()
+""" % (LEVEL_PATH, AR_PATH, AIR_EUROPA_PATH)
+
+def parse_importtime(stderr, max_depth=1):
+    """
+    Returns {module: (depth, cumulative us)} from `-X importtime` output.
+    Depth 0 are top-level imports, depth 1 the modules they import, and so on.
+    """
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        # One space after the bar, then two per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= max_depth:
+            imports[name.strip()] = (depth, int(cumulative_us))
+    return imports
+
+def measure_startup(runs=5, timeout=60):
+    """
+    Starts the worker `runs` times and measures, per run, the import time of
+    main and the time from launching the interpreter to the first request
+    reaching the stub server.
+    """
+    first_request_ms = []
+    import_ms = []
+    slowest = {}
+    for _ in range(runs):
+        db_dir = tempfile.mkdtemp(prefix="bench-startup-")
+        with StubServer() as stub:
+            # The worker is killed mid-response; that is expected here
+            stub.server.handle_error = lambda request, client_address: None
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                [sys.executable, "-X", "importtime", "-c", STARTUP_DRIVER, stub.url, os.path.join(db_dir, "bench.db")],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                env={**os.environ, "TELEGRAM_COMMANDS": "", "METRICS_PORT": "", "LOG_LEVEL": "WARNING"}
+            )
+            while stub.first_request_at is None and process.poll() is None and time.perf_counter() - start < timeout:
+                time.sleep(0.001)
+            process.kill()
+            _, stderr = process.communicate()
+            if stub.first_request_at is None:
+                raise RuntimeError(f"Worker made no request:\n{stderr[-2000:]}")
+            first_request_ms.append((stub.first_request_at - start) * 1000)
+
+        imports = parse_importtime(stderr)
+        import_ms.append(sum(cumulative for depth, cumulative in imports.values() if depth == 0) / 1000)
+        for name, (_, cumulative) in imports.items():
+            slowest.setdefault(name, []).append(cumulative / 1000)
+
+    return {
+        "runs": runs,
+        "first_request_ms": first_request_ms,
+        "first_request_median_ms": statistics.median(first_request_ms),
+        "import_median_ms": statistics.median(import_ms),
+        "slowest_imports_ms": dict(sorted(
+            ((name, statistics.median(values)) for name, values in slowest.items()),
+            key=lambda item: -item[1]
+        )[:10]),
+    }
+
+def print_startup_report(results, target_ms=None):
+    print("🚀 Startup results")
+    print("=" * 40)
+    print(f"Runs:               {results['runs']}")
+    print(f"Imports:            median {results['import_median_ms']:.0f}ms")
+    first_request = results["first_request_ms"]
+    print(f"First request:      median {results['first_request_median_ms']:.0f}ms, min {min(first_request):.0f}ms, max {max(first_request):.0f}ms")
+    if target_ms is not None:
+        verdict = "✅ within" if results["first_request_median_ms"] <= target_ms else "❌ over"
+        print(f"Target:             {verdict} {target_ms:.0f}ms")
+    print("Slowest imports:")
+    for name, ms in results["slowest_imports_ms"].items():
+        print(f"  {ms:7.1f}ms  {name}")
+
+def parse_payloads(seed=42):
+    """One generated response body per provider, as sent by the stub server."""
+    rng = random.Random(seed)
+    itineraries = [{"departureDateTime": "2026-03-15T00:00:00"}, {"departureDateTime": "2026-04-15T00:00:00"}]
+    return {
+        "level": level_calendar_payload(rng, 2026, 3),
+        "aerolineas_argentinas": ar_calendar_payload(rng, ["MAD-COR-20260315", "COR-MAD-20260415"]),
+        "aireuropa": aireuropa_calendar_payload(rng, {"itineraries": itineraries}),
+    }
+
+def _parse_cost(parse, response, runs):
+    """Median seconds of parse(response), and its tracemalloc peak and kept bytes."""
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        parse(response)
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    kept = parse(response)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return statistics.median(seconds), peak, current
+
+def measure_parsing(runs=500, seed=42):
+    """
+    Parses one payload per provider with response.json(), which is what the
+    runtime kept before extract(), and with the provider's extract().
+    """
+    results = {}
+    for name, payload in parse_payloads(seed).items():
+        response = requests.Response()
+        response.status_code = 200
+        response.encoding = "utf-8"
+        response._content = json.dumps(payload).encode("utf-8")
+        full_seconds, full_peak, full_kept = _parse_cost(requests.Response.json, response, runs)
+        seconds, peak, kept = _parse_cost(providers.PROVIDERS[name].extract, response, runs)
+        results[name] = {
+            "bytes": len(response.content),
+            "json_us": full_seconds * 1e6, "json_peak_kb": full_peak / 1024, "json_kept_kb": full_kept / 1024,
+            "extract_us": seconds * 1e6, "extract_peak_kb": peak / 1024, "extract_kept_kb": kept / 1024,
+        }
+    return {"parser": providers.loads.__module__, "runs": runs, "providers": results}
+
+def print_parse_report(results):
+    print(f"🧾 Parse results ({results['parser']}, median of {results['runs']} runs)")
+    print("=" * 40)
+    for name, result in results["providers"].items():
+        print(f"{name} ({result['bytes']} bytes):")
+        print(f"  response.json():  {result['json_us']:7.1f}us, peak {result['json_peak_kb']:6.1f} KB, kept {result['json_kept_kb']:6.1f} KB")
+        print(f"  extract():        {result['extract_us']:7.1f}us, peak {result['extract_peak_kb']:6.1f} KB, kept {result['extract_kept_kb']:6.1f} KB")
+
+def print_report(results):
+    cycle_times = results["cycle_seconds"]
+    print("📊 Benchmark results")
+    print("=" * 40)
+    print(f"Cycles:             {results['cycles']}")
+    print(f"Cycle wall time:    mean {statistics.mean(cycle_times):.3f}s, min {min(cycle_times):.3f}s, max {max(cycle_times):.3f}s")
+    print(f"Requests:           {results['requests']} ({results['requests_per_second']:.1f} req/s)")
+    print(f"Request latency:    p50 {results['latency_p50_ms']:.1f}ms, p99 {results['latency_p99_ms']:.1f}ms")
+    print(f"DB time:            {results['db_seconds']:.3f}s over {results['db_calls']} calls")
+    print(f"Notifications:      {results['notifications']}")
+    print(f"Peak RSS:           {results['peak_rss_mb']:.1f} MB")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the flight check cycle.")
+    parser.add_argument("--cycles", type=int, default=3, help="number of cycles to run")
+    parser.add_argument("--latency-ms", type=float, default=0, help="latency added to every stub response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub responses failing with 500")
+    parser.add_argument("--airlines", default="level", help="comma separated: level,ar,aireuropa")
+    parser.add_argument("--seed", type=int, default=42, help="seed for generated prices and errors")
+    parser.add_argument("--replay", metavar="DIR", help="serve recorded fixtures from DIR instead of the stub server")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--startup", action="store_true", help="measure cold start instead of cycles")
+    parser.add_argument("--runs", type=int, default=5, help="worker launches for --startup")
+    parser.add_argument("--target-ms", type=float, help="with --startup, fail if the median time to the first request is above this")
+    parser.add_argument("--parse", action="store_true", help="measure response parsing instead of cycles")
+    args = parser.parse_args()
+
+    if args.parse:
+        results = measure_parsing(seed=args.seed)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_parse_report(results)
+        return
+
+    if args.startup:
+        results = measure_startup(args.runs)
+        if args.json:
+            print(json.dumps(results, indent=2))
+        else:
+            print_startup_report(results, args.target_ms)
+        if args.target_ms is not None and results["first_request_median_ms"] > args.target_ms:
+            sys.exit(1)
+        return
+
+    # Keep the per-request log lines out of the measurement
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = run_benchmark(args.cycles, args.latency_ms, args.error_rate, tuple(args.airlines.split(",")), args.seed, args.replay)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_report(results)
+
+if __name__ == "__main__":
+    main_cli()
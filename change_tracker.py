@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Incremental change detection over calendar cells.
+
+A cell is one (airline, route, outbound date, return date) combination. The
+tracker keeps the last seen price of every cell in memory, loaded once from
+the cell_prices table, and diffs each cycle's deals against it. Only cells
+that are new, got cheaper, got more expensive or disappeared are passed on,
+so DB writes and notifications follow market churn rather than the size of
+the search space.
+"""
+
+import logging
+from typing import NamedTuple
+from dates import date_ordinal, ordinal_iso
+import database
+from metrics import CELL_CHANGES
+
+# Airline name stored for LEVEL deals, which carry no airline of their own
+DEFAULT_AIRLINE = "LEVEL"
+
+class Change(NamedTuple):
+    """One changed cell. deal is None for dropped cells."""
+    kind: str  # "new", "fell", "rose" or "dropped"
+    route: tuple
+    cell: tuple
+    deal: object
+    previous_price: float
+
+def route_key(deal):
+    return deal.airline or DEFAULT_AIRLINE, f"{deal.origin}-{deal.destination}"
+
+def cell_key(deal):
+    # One-way deals have no return date; 0 keeps the key an int pair
+    return deal.outbound, deal.inbound or 0
+
+def row_key(route, cell):
+    """(airline, route) + (outbound, inbound) ordinals -> DB key columns."""
+    airline, route_name = route
+    outbound, inbound = cell
+    return airline, route_name, ordinal_iso(outbound), ordinal_iso(inbound) if inbound else 'ONE_WAY'
+
+class ChangeTracker:
+    """Last seen price per cell, grouped by route."""
+
+    def __init__(self):
+        self.routes = None
+
+    def load(self):
+        """Loads the stored cell prices from the database."""
+        self.routes = {}
+        for airline, route, outbound_date, return_date, price in database.load_cell_prices():
+            inbound = date_ordinal(return_date) if return_date != 'ONE_WAY' else 0
+            self.routes.setdefault((airline, route), {})[(date_ordinal(outbound_date), inbound)] = price
+        logging.info(f"Loaded {sum(len(cells) for cells in self.routes.values())} cell prices")
+
+    def diff(self, deals, detect_drops=True):
+        """
+        Compares a cycle's deals with the last seen prices and returns the
+        changed cells. Cells of a route that produced deals this cycle but are
+        missing now are reported as dropped; routes without any deal (e.g. a
+        failed request) are left untouched. Pass detect_drops=False when
+        only some watches ran.
+        The new state is applied in memory and persisted before returning.
+        """
+        if self.routes is None:
+            self.load()
+
+        changes = []
+        current = {}
+        for deal in deals:
+            route = route_key(deal)
+            cell = cell_key(deal)
+            cells = current.setdefault(route, {})
+            if cell in cells:
+                # Same cell reported by another watch: follow the first verdict
+                kind = cells[cell]
+                if kind:
+                    changes.append(Change(kind, route, cell, deal, self.routes.get(route, {}).get(cell)))
+                continue
+
+            previous = self.routes.get(route, {}).get(cell)
+            if previous is None:
+                kind = "new"
+            elif deal.price < previous:
+                kind = "fell"
+            elif deal.price > previous:
+                kind = "rose"
+            else:
+                kind = None
+            cells[cell] = kind
+            if kind:
+                changes.append(Change(kind, route, cell, deal, previous))
+
+        if detect_drops:
+            for route, cells in current.items():
+                for cell, price in self.routes.get(route, {}).items():
+                    if cell not in cells:
+                        changes.append(Change("dropped", route, cell, None, price))
+
+        self._apply(changes)
+        return changes
+
+    def _apply(self, changes):
+        upserts = []
+        deletes = []
+        for change in changes:
+            key = row_key(change.route, change.cell)
+            cells = self.routes.setdefault(change.route, {})
+            if change.kind == "dropped":
+                cells.pop(change.cell, None)
+                deletes.append(key)
+            elif cells.get(change.cell) != change.deal.price:
+                cells[change.cell] = change.deal.price
+                upserts.append((*key, change.deal.price, change.deal.currency))
+            CELL_CHANGES.inc(kind=change.kind)
+
+        if upserts or deletes:
+            database.save_cell_changes(upserts, deletes)
+
+# Shared tracker for the worker process
+change_tracker = ChangeTracker()
@@ -74,5 +74,57 @@ BASE_HEADERS = {
 # Price threshold for round trip notifications
 PRICE_THRESHOLD_EUR = 700
 
+# Price baselines for drop alerts: EWMA smoothing factor, quantile tracked,
+# statistic used as the baseline ("ewma", "quantile" or "minimum"), how far
+# below it a price must be to alert, and observations needed before alerting
+BASELINE_ALPHA = 0.2
+BASELINE_QUANTILE = 0.25
+BASELINE_REFERENCE = "ewma"
+BASELINE_DROP_PERCENT = 15
+BASELINE_MIN_SAMPLES = 3
+
+# How long a token validity verdict is cached, in seconds
+TOKEN_STATUS_TTL_SECONDS = 60
+
+# Tokens rejected with 401 Unauthorized, shared by the worker and the refresh scripts
+TOKEN_STATUS_FILE = "token_status.json"
+
+# Declarative search plan (routes, date windows, thresholds). If the file is
+# missing, the plan is built from the constants above.
+SEARCH_PLAN_FILE = "search_plan.toml"
+
 # Database file name
-DB_FILE = "flight_prices.db" 
\ No newline at end of file
+DB_FILE = "flight_prices.db"
+
+# Price history retention: raw observations and hourly rollups, in days.
+# Daily rollups are kept until the outbound date has passed.
+HISTORY_RAW_RETENTION_DAYS = 14
+HISTORY_HOURLY_RETENTION_DAYS = 90
+
+# Database maintenance between cycles: how often it runs, rows deleted per
+# transaction and the time it may take before yielding to the next cycle
+MAINTENANCE_INTERVAL_MINUTES = 60
+MAINTENANCE_BATCH_SIZE = 500
+MAINTENANCE_BUDGET_SECONDS = 30
+
+# Threads sending airline API requests; each provider also caps its own
+# concurrency and request rate (providers.py)
+FETCH_WORKERS = 8
+
+# Telegram subscriptions: width of the price buckets of the subscription
+# index, and the timezone of quiet hours unless a chat sets its own
+SUBSCRIPTION_PRICE_BUCKET = 50
+SUBSCRIPTION_TIMEZONE = "Europe/Madrid"
+
+# Directory for recorded API fixtures (API_CLIENT_MODE=record|replay)
+FIXTURES_DIR = "fixtures"
+
+# Metrics snapshot written after every cycle (Prometheus text format)
+METRICS_SNAPSHOT_FILE = "metrics.prom"
+
+# Exchange rates snapshot file and how long it is considered fresh, in seconds
+EXCHANGE_RATES_FILE = "exchange_rates.json"
+EXCHANGE_RATES_TTL_SECONDS = 6 * 60 * 60
+
+# Seconds to wait after a failed rates refresh before trying again
+EXCHANGE_RATES_RETRY_SECONDS = 15 * 60
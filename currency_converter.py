@@ -1,34 +1,161 @@
 import os
-import requests
+import json
+import time
 import logging
+import threading
+import requests
+from config import EXCHANGE_RATES_FILE, EXCHANGE_RATES_TTL_SECONDS, EXCHANGE_RATES_RETRY_SECONDS
+from metrics import CACHE_LOOKUPS
 
 # A fixed conversion rate as a fallback
 FIXED_EUR_TO_USD = 1.08
 
+EXCHANGE_RATES_URL = "https://v6.exchangerate-api.com/v6/{api_key}/latest/{base}"
+
+class RatesService:
+    """
+    Serves exchange rates from one cached `conversion_rates` table.
+
+    The table is kept in memory and on disk. Once it is older than the TTL it
+    is still served while a background refresh runs (stale-while-revalidate),
+    and the last snapshot on disk keeps conversions working offline. After a
+    failed refresh no other is tried for retry_after seconds; without any
+    table the fixed fallback rate is served meanwhile.
+    """
+
+    def __init__(self, base="EUR", ttl=EXCHANGE_RATES_TTL_SECONDS, cache_file=EXCHANGE_RATES_FILE, timeout=10,
+                 retry_after=EXCHANGE_RATES_RETRY_SECONDS):
+        self.base = base
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.cache_file = cache_file
+        self.timeout = timeout
+        self._rates = None
+        self._fetched_at = 0
+        self._failed_at = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def _fetch(self):
+        """Downloads the full rates table. Returns None on failure."""
+        api_key = os.getenv("EXCHANGERATE_API_KEY")
+        if not api_key:
+            logging.info("EXCHANGERATE_API_KEY not found. Using cached or fixed conversion rates.")
+            return None
+
+        url = EXCHANGE_RATES_URL.format(api_key=api_key, base=self.base)
+        try:
+            response = requests.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+            if data.get("result") == "success":
+                return data["conversion_rates"]
+            logging.error(f"Failed to get conversion rates from API: {data.get('error-type')}")
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Error fetching conversion rates: {e}")
+        except ValueError as e:
+            logging.error(f"Error parsing conversion rates JSON: {e}")
+        return None
+
+    def _load_snapshot(self):
+        """Loads the last rates snapshot from disk into memory."""
+        try:
+            with open(self.cache_file, 'r') as file:
+                snapshot = json.load(file)
+            if snapshot.get("base") == self.base:
+                self._rates = snapshot["conversion_rates"]
+                self._fetched_at = snapshot["fetched_at"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def _save_snapshot(self):
+        """Writes the current rates table to disk atomically."""
+        snapshot = {"base": self.base, "fetched_at": self._fetched_at, "conversion_rates": self._rates}
+        tmp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_file, 'w') as file:
+                json.dump(snapshot, file)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logging.error(f"Failed to save conversion rates snapshot: {e}")
+
+    def refresh(self):
+        """Fetches a fresh table and stores it. Returns True on success."""
+        rates = self._fetch()
+        with self._lock:
+            self._refreshing = False
+            if rates is None:
+                self._failed_at = time.time()
+                return False
+            self._failed_at = None
+            self._rates = rates
+            self._fetched_at = time.time()
+            self._save_snapshot()
+        return True
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, name="rates-refresh", daemon=True).start()
+
+    def _backing_off(self):
+        return self._failed_at is not None and time.time() - self._failed_at < self.retry_after
+
+    def get_rates(self):
+        """
+        Returns the rates table, a dict of currency code -> rate from the base.
+        Never blocks on the network once any table has been loaded.
+        """
+        if self._rates is None:
+            self._load_snapshot()
+
+        if self._rates is None:
+            CACHE_LOOKUPS.inc(cache="exchange_rates", result="miss")
+            if self._backing_off() or not self.refresh():
+                return {self.base: 1.0, "USD": FIXED_EUR_TO_USD} if self.base == "EUR" else {self.base: 1.0}
+        elif time.time() - self._fetched_at >= self.ttl:
+            CACHE_LOOKUPS.inc(cache="exchange_rates", result="stale")
+            if not self._backing_off():
+                self._refresh_in_background()
+        else:
+            CACHE_LOOKUPS.inc(cache="exchange_rates", result="hit")
+
+        return self._rates
+
+    def get_rate(self, to_currency, from_currency=None):
+        """Returns the rate to convert from from_currency (default: base) to to_currency."""
+        rates = self.get_rates()
+        from_currency = from_currency or self.base
+        if to_currency == from_currency:
+            return 1.0
+        if to_currency not in rates or from_currency not in rates:
+            raise KeyError(f"No conversion rate for {from_currency} -> {to_currency}")
+        return rates[to_currency] / rates[from_currency]
+
+    def convert(self, amounts, to_currency, from_currency=None):
+        """Converts a list of amounts in one pass with a single rate lookup."""
+        rate = self.get_rate(to_currency, from_currency)
+        return [round(amount * rate, 2) for amount in amounts]
+
+    def convert_many(self, amounts, currencies, from_currency=None):
+        """
+        Converts a list of amounts into several currencies.
+        Returns a dict of currency code -> list of converted amounts.
+        """
+        return {currency: self.convert(amounts, currency, from_currency) for currency in currencies}
+
+# Shared service, so the whole process reuses one rates table
+rates_service = RatesService()
+
 def get_eur_to_usd_rate():
     """
-    Fetches the EUR to USD conversion rate from an API.
+    Returns the EUR to USD conversion rate from the cached rates table.
     Falls back to a fixed rate if the API key is not set or the request fails.
     """
-    api_key = os.getenv("EXCHANGERATE_API_KEY")
-    if not api_key:
-        logging.info("EXCHANGERATE_API_KEY not found. Using fixed conversion rate.")
-        return FIXED_EUR_TO_USD
-
-    url = f"https://v6.exchangerate-api.com/v6/{api_key}/latest/EUR"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        if data.get("result") == "success":
-            return data["conversion_rates"]["USD"]
-        else:
-            logging.error(f"Failed to get conversion rate from API: {data.get('error-type')}")
-            return FIXED_EUR_TO_USD
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error fetching conversion rate: {e}")
-        return FIXED_EUR_TO_USD
+    return rates_service.get_rates().get("USD", FIXED_EUR_TO_USD)
 
 def convert_eur_to_usd(amount_eur, rate):
     """Converts an amount from EUR to USD using the provided rate."""
-    return amount_eur * rate 
\ No newline at end of file
+    return amount_eur * rate
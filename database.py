@@ -1,14 +1,33 @@
 import sqlite3
 import logging
 from config import DB_FILE
+from metrics import DB_WRITE_SECONDS
+from profiling import span
+from log_setup import configure_logging
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Bump when the schema below changes; init_db() skips it for current files
+SCHEMA_VERSION = 1
 
 def init_db():
-    """Initializes the database and creates the flights table if it doesn't exist."""
+    """
+    Initializes the database and creates the flights table if it doesn't exist.
+    Expired rows are left to maintenance.py, so a restart does not wait on them.
+    """
     try:
         conn = sqlite3.connect(DB_FILE)
         cursor = conn.cursor()
+        # Restarts on an up-to-date file only read this pragma
+        if cursor.execute('PRAGMA user_version').fetchone()[0] == SCHEMA_VERSION:
+            conn.close()
+            logging.info("Database is up to date.")
+            return
+        # Incremental auto-vacuum lets retention give pages back without a full
+        # VACUUM; switching an existing file needs one VACUUM, done once here
+        if cursor.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            cursor.execute('VACUUM')
+        # WAL lets history readers run while the worker writes
+        cursor.execute('PRAGMA journal_mode = WAL')
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS flights (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -20,8 +39,92 @@ def init_db():
                 UNIQUE(outbound_date, return_date, price)
             )
         ''')
+        # Last seen price per calendar cell, for change detection between cycles
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS cell_prices (
+                airline TEXT NOT NULL,
+                route TEXT NOT NULL,
+                outbound_date TEXT NOT NULL,
+                return_date TEXT NOT NULL,
+                price REAL NOT NULL,
+                currency TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (airline, route, outbound_date, return_date)
+            ) WITHOUT ROWID
+        ''')
+        # Rolling price statistics per cell, and per route with '*' dates
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS price_baselines (
+                airline TEXT NOT NULL,
+                route TEXT NOT NULL,
+                outbound_date TEXT NOT NULL,
+                return_date TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                ewma REAL NOT NULL,
+                deviation REAL NOT NULL,
+                min_price REAL NOT NULL,
+                quantile REAL NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (airline, route, outbound_date, return_date)
+            ) WITHOUT ROWID
+        ''')
+        # Price history: raw observations plus hourly/daily rollups (see price_history.py)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS price_observations (
+                airline TEXT NOT NULL,
+                route TEXT NOT NULL,
+                outbound_date TEXT NOT NULL,
+                return_date TEXT NOT NULL,
+                observed_at INTEGER NOT NULL,
+                price REAL NOT NULL,
+                PRIMARY KEY (airline, route, outbound_date, return_date, observed_at)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS price_rollups (
+                resolution TEXT NOT NULL,
+                airline TEXT NOT NULL,
+                route TEXT NOT NULL,
+                outbound_date TEXT NOT NULL,
+                return_date TEXT NOT NULL,
+                bucket INTEGER NOT NULL,
+                min_price REAL NOT NULL,
+                max_price REAL NOT NULL,
+                last_price REAL NOT NULL,
+                samples INTEGER NOT NULL,
+                PRIMARY KEY (resolution, airline, route, outbound_date, return_date, bucket)
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_price_observations_time ON price_observations (observed_at)
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_price_rollups_bucket ON price_rollups (resolution, bucket)
+        ''')
+        # Telegram subscribers (quiet hours) and their per-route price limits
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS subscribers (
+                chat_id TEXT PRIMARY KEY,
+                quiet_start INTEGER,
+                quiet_end INTEGER,
+                timezone TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                chat_id TEXT NOT NULL REFERENCES subscribers (chat_id),
+                route TEXT NOT NULL,
+                max_price REAL NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (chat_id, route)
+            ) WITHOUT ROWID
+        ''')
+        # Route queries of history.py
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_price_rollups_route ON price_rollups (resolution, route, outbound_date, bucket)
+        ''')
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
         conn.commit()
-        cleanup_old_flights()
         conn.close()
         logging.info("Database initialized successfully.")
     except sqlite3.Error as e:
@@ -29,34 +132,174 @@ def init_db():
 
 def save_flight_price(outbound_date, return_date, price, currency):
     """Saves a flight price record to the database."""
+    try:
+        with span("phase:db"), DB_WRITE_SECONDS.time():
+            conn = sqlite3.connect(DB_FILE)
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR IGNORE INTO flights (outbound_date, return_date, price, currency)
+                VALUES (?, ?, ?, ?)
+            ''', (outbound_date, return_date, price, currency))
+            conn.commit()
+            conn.close()
+        logging.debug("Saved flight: %s -> %s for %s %s", outbound_date, return_date, price, currency)
+    except sqlite3.Error as e:
+        logging.error(f"Failed to save flight price: {e}")
+
+def flight_price_exists(outbound_date, return_date, price):
+    """Checks if a flight price already exists in the database."""
+    try:
+        with span("phase:db"):
+            conn = sqlite3.connect(DB_FILE)
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) FROM flights 
+                WHERE outbound_date = ? AND return_date = ? AND price = ?
+            ''', (outbound_date, return_date, price))
+            count = cursor.fetchone()[0]
+            conn.close()
+        return count > 0
+    except sqlite3.Error as e:
+        logging.error(f"Failed to check flight price existence: {e}")
+        return False
+
+def load_cell_prices():
+    """
+    Returns every stored cell price as a list of
+    (airline, route, outbound_date, return_date, price) rows.
+    """
     try:
         conn = sqlite3.connect(DB_FILE)
         cursor = conn.cursor()
         cursor.execute('''
-            INSERT INTO flights (outbound_date, return_date, price, currency)
-            VALUES (?, ?, ?, ?)
-        ''', (outbound_date, return_date, price, currency))
-        conn.commit()
+            SELECT airline, route, outbound_date, return_date, price FROM cell_prices
+        ''')
+        rows = cursor.fetchall()
         conn.close()
-        logging.info(f"Saved flight: {outbound_date} -> {return_date} for {price} {currency}")
+        return rows
     except sqlite3.Error as e:
-        logging.error(f"Failed to save flight price: {e}")
+        logging.error(f"Failed to load cell prices: {e}")
+        return []
 
-def flight_price_exists(outbound_date, return_date, price):
-    """Checks if a flight price already exists in the database."""
+def save_cell_changes(upserts, deletes):
+    """
+    Applies one cycle of cell price changes in a single transaction.
+    upserts: (airline, route, outbound_date, return_date, price, currency) rows
+    deletes: (airline, route, outbound_date, return_date) keys
+    """
+    try:
+        with span("phase:db"), DB_WRITE_SECONDS.time():
+            conn = sqlite3.connect(DB_FILE)
+            with conn:
+                conn.executemany('''
+                    INSERT INTO cell_prices (airline, route, outbound_date, return_date, price, currency)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (airline, route, outbound_date, return_date)
+                    DO UPDATE SET price = excluded.price, currency = excluded.currency, updated_at = CURRENT_TIMESTAMP
+                ''', upserts)
+                conn.executemany('''
+                    DELETE FROM cell_prices
+                    WHERE airline = ? AND route = ? AND outbound_date = ? AND return_date = ?
+                ''', deletes)
+            conn.close()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to save cell price changes: {e}")
+
+def load_baselines():
+    """
+    Returns every stored baseline as a list of (airline, route, outbound_date,
+    return_date, count, ewma, deviation, min_price, quantile) rows.
+    """
     try:
         conn = sqlite3.connect(DB_FILE)
         cursor = conn.cursor()
         cursor.execute('''
-            SELECT COUNT(*) FROM flights 
-            WHERE outbound_date = ? AND return_date = ? AND price = ?
-        ''', (outbound_date, return_date, price))
-        count = cursor.fetchone()[0]
+            SELECT airline, route, outbound_date, return_date, count, ewma, deviation, min_price, quantile
+            FROM price_baselines
+        ''')
+        rows = cursor.fetchall()
         conn.close()
-        return count > 0
+        return rows
     except sqlite3.Error as e:
-        logging.error(f"Failed to check flight price existence: {e}")
-        return False
+        logging.error(f"Failed to load price baselines: {e}")
+        return []
+
+def save_baselines(rows):
+    """Upserts baseline rows in the load_baselines() layout in one transaction."""
+    try:
+        with span("phase:db"), DB_WRITE_SECONDS.time():
+            conn = sqlite3.connect(DB_FILE)
+            with conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO price_baselines
+                        (airline, route, outbound_date, return_date, count, ewma, deviation, min_price, quantile)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+            conn.close()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to save price baselines: {e}")
+
+def load_subscriptions():
+    """
+    Returns (subscribers, subscriptions): (chat_id, quiet_start, quiet_end,
+    timezone) rows and (chat_id, route, max_price) rows.
+    """
+    try:
+        conn = sqlite3.connect(DB_FILE)
+        cursor = conn.cursor()
+        subscribers = cursor.execute('''
+            SELECT chat_id, quiet_start, quiet_end, timezone FROM subscribers
+        ''').fetchall()
+        subscriptions = cursor.execute('''
+            SELECT chat_id, route, max_price FROM subscriptions
+        ''').fetchall()
+        conn.close()
+        return subscribers, subscriptions
+    except sqlite3.Error as e:
+        logging.error(f"Failed to load subscriptions: {e}")
+        return [], []
+
+def save_subscription(chat_id, route, max_price, quiet_start, quiet_end, timezone):
+    """Adds or replaces a subscription, registering its chat if it is new."""
+    try:
+        conn = sqlite3.connect(DB_FILE)
+        with conn:
+            conn.execute('''
+                INSERT OR IGNORE INTO subscribers (chat_id, quiet_start, quiet_end, timezone)
+                VALUES (?, ?, ?, ?)
+            ''', (chat_id, quiet_start, quiet_end, timezone))
+            conn.execute('''
+                INSERT OR REPLACE INTO subscriptions (chat_id, route, max_price)
+                VALUES (?, ?, ?)
+            ''', (chat_id, route, max_price))
+        conn.close()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to save subscription: {e}")
+
+def delete_subscription(chat_id, route):
+    """Removes one subscription of a chat."""
+    try:
+        conn = sqlite3.connect(DB_FILE)
+        with conn:
+            conn.execute('''
+                DELETE FROM subscriptions WHERE chat_id = ? AND route = ?
+            ''', (chat_id, route))
+        conn.close()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to delete subscription: {e}")
+
+def save_subscriber(chat_id, quiet_start, quiet_end, timezone):
+    """Stores the quiet hours of a chat."""
+    try:
+        conn = sqlite3.connect(DB_FILE)
+        with conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO subscribers (chat_id, quiet_start, quiet_end, timezone)
+                VALUES (?, ?, ?, ?)
+            ''', (chat_id, quiet_start, quiet_end, timezone))
+        conn.close()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to save subscriber: {e}")
 
 from datetime import datetime
 
@@ -71,6 +314,14 @@ def cleanup_old_flights():
             WHERE outbound_date < ?
         ''', (today,))
         deleted = cursor.rowcount
+        cursor.execute('''
+            DELETE FROM cell_prices
+            WHERE outbound_date < ?
+        ''', (today,))
+        cursor.execute('''
+            DELETE FROM price_baselines
+            WHERE outbound_date < ? AND outbound_date != '*'
+        ''', (today,))
         conn.commit()
         conn.close()
         logging.info(f"Cleaned up {deleted} old flight(s).")
@@ -79,4 +330,5 @@ def cleanup_old_flights():
 
 if __name__ == '__main__':
     # This allows creating the database manually by running `python database.py`
+    configure_logging()
     init_db() 
\ No newline at end of file
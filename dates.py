@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Date helpers for the fetcher loops.
+
+Calendar payloads repeat the same few hundred ISO dates every cycle, so
+parsing and formatting go through memoized lookups, and filtering code works
+on integer day ordinals (date.toordinal) instead of date objects.
+"""
+
+import calendar
+from datetime import date
+from functools import lru_cache
+from typing import NamedTuple
+
+@lru_cache(maxsize=8192)
+def date_ordinal(iso_date):
+    """'2026-03-10' -> proleptic Gregorian ordinal."""
+    return date.fromisoformat(iso_date).toordinal()
+
+@lru_cache(maxsize=8192)
+def ordinal_iso(ordinal):
+    """Proleptic Gregorian ordinal -> '2026-03-10'."""
+    return date.fromordinal(ordinal).isoformat()
+
+def iso_month(iso_date):
+    """'2026-03-10' -> (2026, 3)."""
+    return int(iso_date[:4]), int(iso_date[5:7])
+
+@lru_cache(maxsize=256)
+def month_bounds(year, month):
+    """Returns the ordinals of the first and last day of a month."""
+    first = date(year, month, 1).toordinal()
+    return first, first + calendar.monthrange(year, month)[1] - 1
+
+class Window(NamedTuple):
+    """One outbound date and its valid return range, as ordinals and ISO strings."""
+    outbound: int
+    min_return: int
+    max_return: int
+    outbound_iso: str
+    max_return_iso: str
+
+@lru_cache(maxsize=256)
+def date_grid(start_date, end_date, min_duration_days, max_duration_days):
+    """
+    Returns the Windows for every outbound date between start_date and
+    end_date (inclusive) whose return range [outbound + min, min(outbound + max, end)]
+    is not empty. Computed once per distinct range.
+    """
+    start = date_ordinal(start_date)
+    end = date_ordinal(end_date)
+    windows = []
+    for outbound in range(start, end + 1):
+        min_return = outbound + min_duration_days
+        max_return = min(outbound + max_duration_days, end)
+        if min_return <= max_return:
+            windows.append(Window(outbound, min_return, max_return, ordinal_iso(outbound), ordinal_iso(max_return)))
+    return tuple(windows)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Compact deal records.
+
+A cycle can track tens of thousands of date pairs, so deals are slotted
+objects instead of dicts. Dates are kept as day ordinals. Type, airline,
+route and airport codes are interned, so every deal on a route shares one
+string object.
+"""
+
+import sys
+from dates import date_ordinal, ordinal_iso
+
+def _intern(value):
+    return sys.intern(value) if value is not None else None
+
+class Deal:
+    """One priced itinerary found by a fetcher."""
+
+    __slots__ = (
+        "type", "outbound", "inbound", "price", "currency", "duration_days",
+        "airline", "route", "origin", "destination", "threshold"
+    )
+
+    def __init__(self, type, outbound_date, return_date, price, currency, origin, destination, threshold,
+                 duration_days=None, airline=None, route=None):
+        self.type = sys.intern(type)
+        self.outbound = date_ordinal(outbound_date)
+        self.inbound = date_ordinal(return_date) if return_date else None
+        self.price = price
+        self.currency = sys.intern(currency)
+        self.duration_days = duration_days
+        self.airline = _intern(airline)
+        self.route = _intern(route)
+        self.origin = sys.intern(origin)
+        self.destination = sys.intern(destination)
+        self.threshold = threshold
+
+    @property
+    def outbound_date(self):
+        return ordinal_iso(self.outbound)
+
+    @property
+    def return_date(self):
+        """ISO return date, or None for one-way deals."""
+        return ordinal_iso(self.inbound) if self.inbound is not None else None
+
+    def __repr__(self):
+        return (f"Deal({self.type}, {self.origin}-{self.destination}, {self.outbound_date} -> {self.return_date}, "
+                f"{self.price} {self.currency})")
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Record/replay of api_client traffic.
+
+In record mode every request/response pair made through api_client.session is
+saved to a fixture store: response bodies are gzip-compressed and addressed by
+their SHA-256, and a small index entry maps each request to its body. Tokens
+and cookies are redacted before anything touches disk.
+
+In replay mode the same requests are served from the store without network,
+so full cycles can be benchmarked and profiled offline.
+
+Enable it with API_CLIENT_MODE=record|replay and optionally FIXTURES_DIR.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+from urllib.parse import urlsplit, parse_qsl, urlencode
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+from config import FIXTURES_DIR
+
+REDACTED = "REDACTED"
+SENSITIVE_HEADERS = {"authorization", "x-d-token", "cookie", "set-cookie", "ama-client-ref"}
+
+# Headers that no longer apply once the body is stored decoded
+DROPPED_RESPONSE_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+def redact_headers(headers):
+    """Returns a plain dict of headers with tokens and cookies redacted."""
+    return {
+        name: REDACTED if name.lower() in SENSITIVE_HEADERS else value
+        for name, value in headers.items()
+    }
+
+def canonical_body(body):
+    """Normalizes a request body so equivalent JSON payloads hash the same."""
+    if not body:
+        return ""
+    if isinstance(body, bytes):
+        body = body.decode("utf-8", errors="replace")
+    try:
+        return json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        return body
+
+def request_key(method, url, body=None):
+    """
+    Deterministic key for a request: method, URL with sorted query and
+    canonical body. Headers are left out so token changes don't matter.
+    """
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    canonical = "\n".join([method.upper(), f"{parts.scheme}://{parts.netloc}{parts.path}", query, canonical_body(body)])
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class FixtureStore:
+    """Content-addressed, compressed store of recorded responses."""
+
+    def __init__(self, directory=FIXTURES_DIR):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.requests_dir = os.path.join(directory, "requests")
+        self._index = {}
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, path)
+
+    def put_body(self, content):
+        """Stores a response body once and returns its content hash."""
+        digest = hashlib.sha256(content).hexdigest()
+        path = os.path.join(self.objects_dir, digest[:2], f"{digest}.gz")
+        if not os.path.exists(path):
+            self._write(path, gzip.compress(content, mtime=0))
+        return digest
+
+    def get_body(self, digest):
+        path = os.path.join(self.objects_dir, digest[:2], f"{digest}.gz")
+        with open(path, "rb") as file:
+            return gzip.decompress(file.read())
+
+    def record(self, request, response):
+        """Saves a request/response pair, redacting tokens."""
+        key = request_key(request.method, request.url, request.body)
+        entry = {
+            "request": {
+                "method": request.method,
+                "url": request.url,
+                "headers": redact_headers(request.headers),
+                "body": canonical_body(request.body)
+            },
+            "response": {
+                "status": response.status_code,
+                "reason": response.reason,
+                "headers": {
+                    name: value for name, value in redact_headers(response.headers).items()
+                    if name.lower() not in DROPPED_RESPONSE_HEADERS
+                },
+                "body": self.put_body(response.content)
+            }
+        }
+        self._write(os.path.join(self.requests_dir, f"{key}.json"), json.dumps(entry, indent=2).encode("utf-8"))
+        self._index[key] = entry
+        return key
+
+    def lookup(self, method, url, body=None):
+        """Returns the recorded entry for a request, or None."""
+        key = request_key(method, url, body)
+        if key not in self._index:
+            try:
+                with open(os.path.join(self.requests_dir, f"{key}.json"), "r") as file:
+                    self._index[key] = json.load(file)
+            except OSError:
+                return None
+        return self._index[key]
+
+class RecordingAdapter(HTTPAdapter):
+    """Transport adapter that performs real requests and records them."""
+
+    def __init__(self, store, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.store = store
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        try:
+            self.store.record(request, response)
+        except OSError as e:
+            logging.error(f"Failed to record fixture for {request.url}: {e}")
+        return response
+
+class ReplayAdapter(BaseAdapter):
+    """Transport adapter serving recorded responses without network access."""
+
+    def __init__(self, store):
+        super().__init__()
+        self.store = store
+        self._bodies = {}
+
+    def send(self, request, **kwargs):
+        entry = self.store.lookup(request.method, request.url, request.body)
+
+        response = Response()
+        response.request = request
+        response.url = request.url
+        response.encoding = "utf-8"
+
+        if entry is None:
+            response.status_code = 404
+            response.reason = "Fixture Not Found"
+            response.headers = CaseInsensitiveDict({"Content-Type": "application/json"})
+            response._content = b'{"error": "no recorded fixture"}'
+            return response
+
+        recorded = entry["response"]
+        digest = recorded["body"]
+        if digest not in self._bodies:
+            self._bodies[digest] = self.store.get_body(digest)
+
+        response.status_code = recorded["status"]
+        response.reason = recorded["reason"]
+        response.headers = CaseInsensitiveDict(recorded["headers"])
+        response._content = self._bodies[digest]
+        return response
+
+    def close(self):
+        pass
+
+def install(session, mode, directory=FIXTURES_DIR):
+    """Mounts the record or replay adapter for all URLs on session."""
+    store = FixtureStore(directory)
+    if mode == "record":
+        adapter = RecordingAdapter(store)
+    elif mode == "replay":
+        adapter = ReplayAdapter(store)
+    else:
+        raise ValueError(f"Unknown fixture mode: {mode}")
+
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    logging.info(f"API client {mode} mode enabled, fixtures in {directory}")
+    return store
+
+def install_from_env(session):
+    """Enables record/replay on session if API_CLIENT_MODE is set."""
+    mode = os.getenv("API_CLIENT_MODE")
+    if mode:
+        return install(session, mode, os.getenv("FIXTURES_DIR", FIXTURES_DIR))
+    return None
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Read-only queries over the price history.
+
+Queries read the daily/hourly rollups through idx_price_rollups_route, open the
+database read-only (so they never take a write lock, and run alongside the
+worker under WAL) and yield rows straight from the cursor. cheapest and
+durations also read cell_prices, the price every cell has right now, so a
+cell is never missing while it is still on sale.
+
+Usage:
+    python -m history cheapest BCN-EZE --by week --since-days 30
+    python -m history trend BCN-EZE --outbound 2026-03-10 --return 2026-04-05
+    python -m history durations BCN-EZE --from 2026-03-01 --to 2026-03-31
+"""
+
+import argparse
+import json
+import sqlite3
+import time
+from contextlib import closing
+import database
+
+DAY_SECONDS = 24 * 60 * 60
+
+# --by value -> SQL expression grouping outbound dates
+OUTBOUND_GROUPS = {
+    "day": "outbound_date",
+    "week": "date(outbound_date, '-6 days', 'weekday 1')",  # Monday starting the week
+    "month": "substr(outbound_date, 1, 7)",
+}
+
+def connect_readonly():
+    """Opens the database read-only; it never blocks the worker's writes."""
+    return sqlite3.connect(f"file:{database.DB_FILE}?mode=ro", uri=True)
+
+def _cell_filters(route, airline, outbound_from, outbound_to):
+    conditions = ["route = ?"]
+    params = [route]
+    if airline:
+        conditions.append("airline = ?")
+        params.append(airline)
+    if outbound_from:
+        conditions.append("outbound_date >= ?")
+        params.append(outbound_from)
+    if outbound_to:
+        conditions.append("outbound_date <= ?")
+        params.append(outbound_to)
+    return conditions, params
+
+def _filters(route, airline, outbound_from, outbound_to, since, resolution="day"):
+    conditions, params = _cell_filters(route, airline, outbound_from, outbound_to)
+    bucket = since - since % (DAY_SECONDS if resolution == "day" else 3600)
+    return " AND ".join(["resolution = ?", *conditions, "bucket >= ?"]), [resolution, *params, bucket]
+
+def _with_current_prices(route, airline, outbound_from, outbound_to, since):
+    """
+    SQL of (outbound_date, return_date, airline, price) rows: the daily
+    rollups since the given epoch seconds plus the current cell prices.
+    """
+    where, params = _filters(route, airline, outbound_from, outbound_to, since)
+    current_conditions, current_params = _cell_filters(route, airline, outbound_from, outbound_to)
+    current_where = " AND ".join(current_conditions)
+    sql = f'''
+        SELECT outbound_date, return_date, airline, min_price AS price FROM price_rollups WHERE {where}
+        UNION ALL
+        SELECT outbound_date, return_date, airline, price FROM cell_prices WHERE {current_where}
+    '''
+    return sql, params + current_params
+
+def _stream(sql, params):
+    with closing(connect_readonly()) as conn:
+        yield from conn.execute(sql, params)
+
+def cheapest(route, by="day", airline=None, outbound_from=None, outbound_to=None, since_days=30):
+    """
+    Yields (outbound group, cheapest price, outbound date, return date, airline)
+    for every outbound day/week/month, over prices seen in the last since_days.
+    """
+    prices, params = _with_current_prices(route, airline, outbound_from, outbound_to, time.time() - since_days * DAY_SECONDS)
+    # SQLite returns the bare columns of the row holding min()
+    yield from _stream(f'''
+        SELECT {OUTBOUND_GROUPS[by]} AS period, min(price), outbound_date, return_date, airline
+        FROM ({prices})
+        GROUP BY period
+        ORDER BY period
+    ''', params)
+
+def trend(route, outbound_date=None, return_date=None, airline=None, since_days=30, resolution="day"):
+    """
+    Yields (bucket start, min, max, last) per hour or day, for one cell when
+    outbound/return dates are given, else for the cheapest cell of the route.
+    """
+    where, params = _filters(route, airline, outbound_date, outbound_date, time.time() - since_days * DAY_SECONDS, resolution)
+    if return_date:
+        where += " AND return_date = ?"
+        params.append(return_date)
+    yield from _stream(f'''
+        SELECT datetime(bucket, 'unixepoch'), min(min_price), max(max_price), min(last_price)
+        FROM price_rollups
+        WHERE {where}
+        GROUP BY bucket
+        ORDER BY bucket
+    ''', params)
+
+def durations(route, airline=None, outbound_from=None, outbound_to=None, since_days=30):
+    """Yields (duration in days, cheapest price, outbound date, return date) per trip length."""
+    prices, params = _with_current_prices(route, airline, outbound_from, outbound_to, time.time() - since_days * DAY_SECONDS)
+    yield from _stream(f'''
+        SELECT CAST(julianday(return_date) - julianday(outbound_date) AS INTEGER) AS days,
+               min(price), outbound_date, return_date
+        FROM ({prices})
+        WHERE return_date != 'ONE_WAY'
+        GROUP BY days
+        ORDER BY days
+    ''', params)
+
+COLUMNS = {
+    "cheapest": ("period", "price", "outbound", "return", "airline"),
+    "trend": ("time", "min", "max", "last"),
+    "durations": ("days", "price", "outbound", "return"),
+}
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Query the price history.")
+    subparsers = parser.add_subparsers(dest="query", required=True)
+    for name, help_text in (("cheapest", "cheapest price per outbound day/week/month"),
+                            ("trend", "price trend over time"),
+                            ("durations", "cheapest price per trip length")):
+        subparser = subparsers.add_parser(name, help=help_text)
+        subparser.add_argument("route", help="ORIGIN-DESTINATION, e.g. BCN-EZE")
+        subparser.add_argument("--airline", help="LEVEL, Aerolíneas Argentinas, AirEuropa")
+        subparser.add_argument("--since-days", type=int, default=30, help="only prices seen in the last N days")
+        subparser.add_argument("--json", action="store_true", help="print one JSON object per line")
+        if name == "trend":
+            subparser.add_argument("--outbound", help="outbound date of the cell (YYYY-MM-DD)")
+            subparser.add_argument("--return", dest="return_date", help="return date of the cell (YYYY-MM-DD)")
+            subparser.add_argument("--resolution", choices=("hour", "day"), default="day")
+        else:
+            subparser.add_argument("--from", dest="outbound_from", help="first outbound date (YYYY-MM-DD)")
+            subparser.add_argument("--to", dest="outbound_to", help="last outbound date (YYYY-MM-DD)")
+        if name == "cheapest":
+            subparser.add_argument("--by", choices=OUTBOUND_GROUPS, default="day")
+    args = parser.parse_args()
+
+    if args.query == "cheapest":
+        rows = cheapest(args.route, args.by, args.airline, args.outbound_from, args.outbound_to, args.since_days)
+    elif args.query == "trend":
+        rows = trend(args.route, args.outbound, args.return_date, args.airline, args.since_days, args.resolution)
+    else:
+        rows = durations(args.route, args.airline, args.outbound_from, args.outbound_to, args.since_days)
+
+    columns = COLUMNS[args.query]
+    if not args.json:
+        print("\t".join(columns))
+    for row in rows:
+        if args.json:
+            print(json.dumps(dict(zip(columns, row)), ensure_ascii=False), flush=True)
+        else:
+            print("\t".join(f"{value:.2f}" if isinstance(value, float) else str(value) for value in row), flush=True)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Logging setup shared by the bot and the token refresh scripts.
+
+- Records are handed to a queue and written by a background thread, so the
+  flight check never blocks on I/O or pays for formatting.
+- Output is JSON lines by default (LOG_FORMAT=text for the classic format).
+- Per-request/per-deal events go to the "requests" loggers and are sampled
+  (LOG_SAMPLE_RATE, default 0.1); warnings and errors are always kept.
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+REQUEST_LOGGER = "api_client.requests"
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+# Argument types that cannot change between the logging call and the listener
+# formatting the record
+IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Keeps a share of INFO/DEBUG records from the given logger; keeps all others."""
+
+    def __init__(self, name, rate):
+        super().__init__()
+        self.prefix = name
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not record.name.startswith(self.prefix):
+            return True
+        return random.random() < self.rate
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that defers message formatting to the listener thread when it
+    is safe: records whose arguments are all immutable are enqueued untouched.
+    Any other record (dict, list or object arguments) has its message frozen
+    here, like QueueHandler.prepare does, so later changes to the arguments
+    cannot leak into it.
+    """
+
+    def prepare(self, record):
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, IMMUTABLE_ARGS) for arg in args)):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+def configure_logging():
+    """Sets up queued, structured logging once per process. Safe to call repeatedly."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler()
+    if os.getenv("LOG_FORMAT", "json") == "text":
+        stream_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    else:
+        stream_handler.setFormatter(JsonFormatter())
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(REQUEST_LOGGER, float(os.getenv("LOG_SAMPLE_RATE", "0.1"))))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,19 +1,29 @@
-import schedule
+import os
 import time
 import logging
+from datetime import datetime
 from dotenv import load_dotenv
 
 import api_client
 import database
 import notifier
+import metrics
+import profiling
+import search_plan
+import price_history
+import snapshot
+import subscriptions
+from change_tracker import change_tracker, cell_key, route_key, row_key
+from baselines import baseline_engine
+from log_setup import configure_logging
 #from currency_converter import get_eur_to_usd_rate, convert_eur_to_usd
-from config import PRICE_THRESHOLD_EUR, ONE_WAY_THRESHOLD_EUR, SPECIFIC_THRESHOLD_EUR
+from config import METRICS_SNAPSHOT_FILE, MAINTENANCE_INTERVAL_MINUTES, MAINTENANCE_BUDGET_SECONDS
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Setup logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+configure_logging()
 
 def refresh_tokens_if_needed():
     """
@@ -42,130 +52,188 @@ def check_flights_and_notify():
     Main job function to be scheduled.
     It fetches flights, saves them, and sends notifications for cheap deals.
     """
+    with profiling.profile_cycle(), metrics.CYCLE_SECONDS.time():
+        run_flight_check()
+    metrics.REGISTRY.write_snapshot(METRICS_SNAPSHOT_FILE)
+
+def run_maintenance_between_cycles(cycle_job):
+    """
+    Runs database maintenance unless the next flight check is due before its
+    time budget would run out; it is then retried on the next interval.
+    """
+    if (cycle_job.next_run - datetime.now()).total_seconds() < MAINTENANCE_BUDGET_SECONDS:
+        logging.info("Skipping database maintenance, a flight check is due")
+        return
+    import maintenance
+    maintenance.run_maintenance()
+
+def apply_plan_changes(plan_watcher):
+    """
+    Reloads the search plan if it changed and searches only the added or
+    changed watches right away. Queries already answered this cycle are
+    served from memory; the rest of the plan waits for the next cycle.
+    """
+    diff = plan_watcher.poll()
+    if not diff or not diff.watches_to_run:
+        return
+    run_flight_check(search_plan.SearchPlan(diff.watches_to_run), reuse_responses=True)
+
+def run_flight_check(plan=None, reuse_responses=False):
+    """Runs one flight check: fetch, save and notify."""
     logging.info("Starting flight check job...")
 
     # Refresh tokens if needed before starting flight search
     # refresh_tokens_if_needed()  # DESHABILITADO: Renovación automática de tokens
 
     # 1. Fetch all flight prices (round trip, one-way, and specific date range)
-    deals = api_client.fetch_all_flights()
+    with profiling.span("phase:fetch"):
+        deals = api_client.fetch_all_flights(plan, reuse_responses)
     
+    # Telegram commands answer from this cycle's deals
+    snapshot.publish(deals, partial=plan is not None)
+
     if not deals:
         logging.info("No flight deals found in this run.")
         return
 
-    # 2. Process and save deals
     for deal in deals:
-        # Skip saving if this deal already exists
-        if database.flight_price_exists(
-            deal['outbound_date'],
-            deal['return_date'] or 'ONE_WAY',
-            deal['price']
-        ):
+        metrics.DEALS_FOUND.inc(type=deal.type)
+
+    # 2. Record every cell's price and fold it into its baselines, once per
+    # cell even if several watches reported it, so the history and the
+    # baselines also sample prices that hold steady. Reruns after a plan
+    # reload serve this cycle's responses again: their prices were already
+    # counted, so they are only checked against the baselines and the next
+    # full cycle records them.
+    observations = []
+    drops = {}
+    for deal in deals:
+        key = (route_key(deal), cell_key(deal))
+        if key in drops:
+            continue
+        if reuse_responses:
+            drops[key] = baseline_engine.check(*key, deal.price)
+        else:
+            observations.append((*row_key(*key), deal.price))
+            drops[key] = baseline_engine.observe(*key, deal.price)
+
+    # 3. Keep only the cells whose price changed since the last cycle. Drops
+    # are only detected on full cycles, where every watch of a route ran.
+    changes = change_tracker.diff(deals, detect_drops=plan is None)
+    logging.info(f"{len(changes)} changed cells out of {len(deals)} deals")
+
+    for change in changes:
+        # Disappeared cells and price rises are not notified
+        if change.kind not in ("new", "fell"):
             continue
+        deal = change.deal
+        drop = drops[(change.route, change.cell)]
 
-        # Save every found deal to the database
-        database.save_flight_price(
-            deal['outbound_date'],
-            deal['return_date'] or 'ONE_WAY',
-            deal['price'],
-            deal['currency']
-        )
-
-        # 3. Check for deals below the threshold in EUR
-        if deal['currency'] == 'EUR':
-            if deal['type'] == 'one_way' and deal['price'] < ONE_WAY_THRESHOLD_EUR:
-                logging.info(f"Found a cheap one-way flight! Price: €{deal['price']:.2f}")
+        # 4. Alert the default chat on prices below the watch's threshold or well
+        # below their baseline, and every subscriber whose filters match
+        alert = deal.price < deal.threshold or drop is not None
+        chats = subscriptions.registry.recipients(deal, alert)
+        if not chats:
+            continue
+        drop_note = f"📉 *{drop.percent:.0f}% por debajo del precio habitual* ({drop.baseline:.2f} EUR)\n" if drop else ""
+        if deal.currency == 'EUR':
+            if deal.type == 'one_way':
+                logging.info("Found a cheap one-way flight! Price: €%.2f", deal.price)
                 # Format the message for one-way flights
-                booking_url = f"https://www.flylevel.com/Flight/Select?culture=es-ES&triptype=OW&o1={api_client.ONE_WAY_ORIGIN}&d1={api_client.ONE_WAY_DESTINATION}&dd1={deal['outbound_date']}&ADT=1&CHD=0&INL=0&forcedCurrency=EUR&forcedCulture=es-ES&newecom=true&currency=EUR"
+                origin, destination = deal.origin, deal.destination
+                booking_url = f"https://www.flylevel.com/Flight/Select?culture=es-ES&triptype=OW&o1={origin}&d1={destination}&dd1={deal.outbound_date}&ADT=1&CHD=0&INL=0&forcedCurrency=EUR&forcedCulture=es-ES&newecom=true&currency=EUR"
 
                 message = (
                     f"✈️ *¡Vuelo de IDA barato encontrado!*\n\n"
-                    f"*Ruta:* {api_client.ONE_WAY_ORIGIN} ➔ {api_client.ONE_WAY_DESTINATION} (Buenos Aires)\n"
-                    f"*Fecha:* {deal['outbound_date']}\n"
-                    f"*Precio:* *{deal['price']} EUR*\n\n"
+                    f"*Ruta:* {origin} ➔ {destination}\n"
+                    f"*Fecha:* {deal.outbound_date}\n"
+                    f"*Precio:* *{deal.price} EUR*\n{drop_note}\n"
                     f"[¡Reserva ahora!]({booking_url})"
                 )
                 # Send notification
-                notifier.send_telegram_notification(message)
+                notifier.send_to_chats(message, chats)
                 
-            elif deal['type'] == 'round_trip' and deal['price'] < PRICE_THRESHOLD_EUR:
-                logging.info(f"Found a cheap round trip flight! Price: €{deal['price']:.2f}")
+            elif deal.type == 'round_trip':
+                logging.info("Found a cheap round trip flight! Price: €%.2f", deal.price)
                 # Format the message for round trip flights
-                booking_url = f"https://www.flylevel.com/Flight/Select?culture=es-ES&triptype=RT&o1={api_client.ORIGIN}&d1={api_client.DESTINATION}&dd1={deal['outbound_date']}&ADT=1&CHD=0&INL=0&r=true&mm=true&dd2={deal['return_date']}&forcedCurrency=EUR&forcedCulture=es-ES&newecom=true&currency=EUR"
+                origin, destination = deal.origin, deal.destination
+                booking_url = f"https://www.flylevel.com/Flight/Select?culture=es-ES&triptype=RT&o1={origin}&d1={destination}&dd1={deal.outbound_date}&ADT=1&CHD=0&INL=0&r=true&mm=true&dd2={deal.return_date}&forcedCurrency=EUR&forcedCulture=es-ES&newecom=true&currency=EUR"
 
                 message = (
                     f"✈️ *¡Vuelo redondo barato encontrado!*\n\n"
-                    f"*Ruta:* {api_client.ORIGIN} ➔ {api_client.DESTINATION}\n"
-                    f"*Salida:* {deal['outbound_date']}\n"
-                    f"*Regreso:* {deal['return_date']}\n"
-                    f"*Precio:* *{deal['price']} EUR*\n\n"
+                    f"*Ruta:* {origin} ➔ {destination}\n"
+                    f"*Salida:* {deal.outbound_date}\n"
+                    f"*Regreso:* {deal.return_date}\n"
+                    f"*Precio:* *{deal.price} EUR*\n{drop_note}\n"
                     f"[¡Reserva ahora!]({booking_url})"
                 )
                 # Send notification
-                notifier.send_telegram_notification(message)
+                notifier.send_to_chats(message, chats)
                 
-            elif deal['type'] == 'specific_range' and deal['price'] < SPECIFIC_THRESHOLD_EUR:
-                logging.info(f"Found a cheap specific range flight! Price: €{deal['price']:.2f}")
+            elif deal.type == 'specific_range':
+                logging.info("Found a cheap specific range flight! Price: €%.2f", deal.price)
                 # Format the message for specific date range flights
-                booking_url = f"https://www.flylevel.com/Flight/Select?culture=es-ES&triptype=RT&o1={api_client.SPECIFIC_ORIGIN}&d1={api_client.SPECIFIC_DESTINATION}&dd1={deal['outbound_date']}&ADT=1&CHD=0&INL=0&r=true&mm=true&dd2={deal['return_date']}&forcedCurrency=EUR&forcedCulture=es-ES&newecom=true&currency=EUR"
+                origin, destination = deal.origin, deal.destination
+                booking_url = f"https://www.flylevel.com/Flight/Select?culture=es-ES&triptype=RT&o1={origin}&d1={destination}&dd1={deal.outbound_date}&ADT=1&CHD=0&INL=0&r=true&mm=true&dd2={deal.return_date}&forcedCurrency=EUR&forcedCulture=es-ES&newecom=true&currency=EUR"
 
                 message = (
                     f"🎯 *¡Vuelo específico barato encontrado!*\n\n"
-                    f"*Ruta:* {api_client.SPECIFIC_ORIGIN} ➔ {api_client.SPECIFIC_DESTINATION}\n"
-                    f"*Salida:* {deal['outbound_date']}\n"
-                    f"*Regreso:* {deal['return_date']}\n"
-                    f"*Duración:* {deal['duration_days']} días\n"
-                    f"*Precio:* *{deal['price']} EUR*\n\n"
+                    f"*Ruta:* {origin} ➔ {destination}\n"
+                    f"*Salida:* {deal.outbound_date}\n"
+                    f"*Regreso:* {deal.return_date}\n"
+                    f"*Duración:* {deal.duration_days} días\n"
+                    f"*Precio:* *{deal.price} EUR*\n{drop_note}\n"
                     f"[¡Reserva ahora!]({booking_url})"
                 )
                 # Send notification
-                notifier.send_telegram_notification(message)
+                notifier.send_to_chats(message, chats)
                 
-            elif deal['type'] == 'aerolineas_argentinas' and deal['price'] < deal.get('threshold', SPECIFIC_THRESHOLD_EUR):
-                logging.info(f"Found a cheap Aerolíneas Argentinas flight! Price: €{deal['price']:.2f}")
+            elif deal.type == 'aerolineas_argentinas':
+                logging.info("Found a cheap Aerolíneas Argentinas flight! Price: €%.2f", deal.price)
                 # Format the message for Aerolíneas Argentinas flights
                 # Create booking URL for Aerolíneas Argentinas
-                outbound_date_formatted = deal['outbound_date'].replace('-', '')
-                return_date_formatted = deal['return_date'].replace('-', '')
-                origin = deal.get('origin', 'MAD')
-                destination = deal.get('destination', 'COR')
+                outbound_date_formatted = deal.outbound_date.replace('-', '')
+                return_date_formatted = deal.return_date.replace('-', '')
+                origin = deal.origin
+                destination = deal.destination
                 booking_url = f"https://www.aerolineas.com.ar/es-ar/vuelos/buscar?adt=1&inf=0&chd=0&flexDates=true&cabinClass=Economy&flightType=ROUND_TRIP&leg={origin}-{destination}-{outbound_date_formatted}&leg={destination}-{origin}-{return_date_formatted}"
 
                 message = (
                     f"🇦🇷 *¡Vuelo Aerolíneas Argentinas barato encontrado!*\n\n"
-                    f"*Aerolínea:* {deal.get('airline', 'Aerolíneas Argentinas')}\n"
-                    f"*Ruta:* {deal.get('route', f'{origin} ➔ {destination}')}\n"
-                    f"*Salida:* {deal['outbound_date']}\n"
-                    f"*Regreso:* {deal['return_date']}\n"
-                    f"*Duración:* {deal['duration_days']} días\n"
-                    f"*Precio:* *{deal['price']} EUR*\n\n"
+                    f"*Aerolínea:* {deal.airline}\n"
+                    f"*Ruta:* {deal.route or f'{origin} ➔ {destination}'}\n"
+                    f"*Salida:* {deal.outbound_date}\n"
+                    f"*Regreso:* {deal.return_date}\n"
+                    f"*Duración:* {deal.duration_days} días\n"
+                    f"*Precio:* *{deal.price} EUR*\n{drop_note}\n"
                     f"[¡Reserva ahora!]({booking_url})"
                 )
                 # Send notification
-                notifier.send_telegram_notification(message)
+                notifier.send_to_chats(message, chats)
 
-            elif deal['type'] == 'aireuropa' and deal['price'] < deal.get('threshold', SPECIFIC_THRESHOLD_EUR):
-                logging.info(f"Found a cheap AirEuropa flight! Price: €{deal['price']:.2f}")
+            elif deal.type == 'aireuropa':
+                logging.info("Found a cheap AirEuropa flight! Price: €%.2f", deal.price)
                 # Format the message for AirEuropa flights
                 # Create booking URL for AirEuropa
-                origin = deal.get('origin', 'MAD')
-                destination = deal.get('destination', 'COR')
-                booking_url = f"https://digital.aireuropa.com/es/vuelos/buscar?origin={origin}&destination={destination}&departureDate={deal['outbound_date']}&returnDate={deal['return_date']}&adults=1&children=0&infants=0&cabinClass=economy&fareFamily=DIGITAL1"
+                origin = deal.origin
+                destination = deal.destination
+                booking_url = f"https://digital.aireuropa.com/es/vuelos/buscar?origin={origin}&destination={destination}&departureDate={deal.outbound_date}&returnDate={deal.return_date}&adults=1&children=0&infants=0&cabinClass=economy&fareFamily=DIGITAL1"
 
                 message = (
                     f"✈️ *¡Vuelo AirEuropa barato encontrado!*\n\n"
-                    f"*Aerolínea:* {deal.get('airline', 'AirEuropa')}\n"
-                    f"*Ruta:* {deal.get('route', f'{origin} ➔ {destination}')}\n"
-                    f"*Salida:* {deal['outbound_date']}\n"
-                    f"*Regreso:* {deal['return_date']}\n"
-                    f"*Duración:* {deal['duration_days']} días\n"
-                    f"*Precio:* *{deal['price']} EUR*\n\n"
+                    f"*Aerolínea:* {deal.airline}\n"
+                    f"*Ruta:* {deal.route or f'{origin} ➔ {destination}'}\n"
+                    f"*Salida:* {deal.outbound_date}\n"
+                    f"*Regreso:* {deal.return_date}\n"
+                    f"*Duración:* {deal.duration_days} días\n"
+                    f"*Precio:* *{deal.price} EUR*\n{drop_note}\n"
                     f"[¡Reserva ahora!]({booking_url})"
                 )
                 # Send notification
-                notifier.send_telegram_notification(message)
+                notifier.send_to_chats(message, chats)
 
+    price_history.record_observations(observations)
+    baseline_engine.flush()
     logging.info("Flight check job finished.")
 
 
@@ -176,16 +244,47 @@ def main():
     # Initialize the database
     database.init_db()
 
-    # Run the job immediately at startup
+    # Compile the search plan up front so a broken plan fails at startup
+    search_plan.current_plan()
+
+    # Edits to the plan file (or SIGHUP) are picked up without a restart
+    plan_watcher = search_plan.PlanWatcher()
+    plan_watcher.install_signal_handler()
+
+    # Serve metrics if a port is configured
+    metrics_port = os.getenv("METRICS_PORT")
+    if metrics_port:
+        metrics.start_http_server(int(metrics_port))
+
+    # SIGUSR1 profiles the next cycle
+    profiling.install_signal_handler()
+
+    # Run the job immediately at startup. Modules only needed after it
+    # (scheduler, maintenance, bot commands) are imported later, so a restart
+    # gets to its first request sooner.
     check_flights_and_notify()
-    
+
+    # Answer Telegram commands (/best, /route, /history) on a background
+    # thread, from the snapshot the first check just published
+    if os.getenv("TELEGRAM_COMMANDS") == "1":
+        import telegram_bot
+        telegram_bot.CommandBot().start()
+
+    import schedule
+
     # Schedule the job to run every 15 minutes
-    schedule.every(15).minutes.do(check_flights_and_notify)
+    cycle_job = schedule.every(15).minutes.do(check_flights_and_notify)
+
+    # Database maintenance between cycles, and once now: init_db() no longer
+    # cleans up at startup, and restarts may come sooner than the interval
+    schedule.every(MAINTENANCE_INTERVAL_MINUTES).minutes.do(run_maintenance_between_cycles, cycle_job)
+    run_maintenance_between_cycles(cycle_job)
     
     logging.info("Scheduler started. Will run every 15 minutes.")
 
     while True:
         schedule.run_pending()
+        apply_plan_changes(plan_watcher)
         time.sleep(1)
 
 if __name__ == "__main__":
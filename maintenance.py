@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Periodic database maintenance, run by the scheduler between flight checks.
+
+- Expired rows (past outbound dates, history beyond its retention tier) are
+  deleted in small batches, each in its own short transaction, so no write
+  lock is held for long.
+- Freed pages are returned with an incremental vacuum.
+- ANALYZE keeps the query planner's statistics current.
+- A WAL checkpoint folds the write-ahead log back into the database file.
+
+Work is bounded by MAINTENANCE_BUDGET_SECONDS; whatever is left over is
+picked up by the next run.
+"""
+
+import logging
+import sqlite3
+import time
+from datetime import date
+import database
+from config import (
+    HISTORY_RAW_RETENTION_DAYS, HISTORY_HOURLY_RETENTION_DAYS,
+    MAINTENANCE_BATCH_SIZE, MAINTENANCE_BUDGET_SECONDS
+)
+from metrics import MAINTENANCE_SECONDS, MAINTENANCE_ROWS
+
+DAY_SECONDS = 24 * 60 * 60
+
+# Pages released per incremental_vacuum step
+VACUUM_PAGES = 256
+
+def expiry_rules(now):
+    """Returns (table, key columns, condition, params) for every expired row set."""
+    today = date.fromtimestamp(now).isoformat()
+    cell = "airline, route, outbound_date, return_date"
+    return [
+        ("flights", "id", "outbound_date < ?", (today,)),
+        ("cell_prices", cell, "outbound_date < ?", (today,)),
+        ("price_baselines", cell, "outbound_date < ? AND outbound_date != '*'", (today,)),
+        ("price_observations", f"{cell}, observed_at", "outbound_date < ? OR observed_at < ?",
+         (today, now - HISTORY_RAW_RETENTION_DAYS * DAY_SECONDS)),
+        ("price_rollups", f"resolution, {cell}, bucket", "outbound_date < ? OR (resolution = 'hour' AND bucket < ?)",
+         (today, now - HISTORY_HOURLY_RETENTION_DAYS * DAY_SECONDS)),
+    ]
+
+def delete_expired(conn, now, deadline, batch_size=MAINTENANCE_BATCH_SIZE):
+    """
+    Deletes expired rows batch by batch until none are left or the deadline
+    passes. Returns {table: deleted rows}.
+    """
+    deleted = {}
+    for table, key, condition, params in expiry_rules(now):
+        deleted[table] = 0
+        while time.monotonic() < deadline:
+            with conn:
+                count = conn.execute(f'''
+                    DELETE FROM {table} WHERE ({key}) IN (
+                        SELECT {key} FROM {table} WHERE {condition} LIMIT ?
+                    )
+                ''', (*params, batch_size)).rowcount
+            deleted[table] += count
+            if count < batch_size:
+                break
+        MAINTENANCE_ROWS.inc(deleted[table], table=table)
+    return deleted
+
+def incremental_vacuum(conn, deadline):
+    """Releases free pages in steps until none are left or the deadline passes."""
+    while time.monotonic() < deadline:
+        if conn.execute('PRAGMA freelist_count').fetchone()[0] == 0:
+            break
+        conn.execute(f'PRAGMA incremental_vacuum({VACUUM_PAGES})').fetchall()
+
+def run_maintenance(budget=MAINTENANCE_BUDGET_SECONDS, now=None):
+    """
+    Runs one maintenance pass and logs how long each step took.
+    Returns {step: seconds}.
+    """
+    now = int(now if now is not None else time.time())
+    deadline = time.monotonic() + budget
+    timings = {}
+    try:
+        conn = sqlite3.connect(database.DB_FILE)
+        try:
+            for step in ("delete", "vacuum", "analyze", "checkpoint"):
+                start = time.perf_counter()
+                if step == "delete":
+                    deleted = delete_expired(conn, now, deadline)
+                elif step == "vacuum":
+                    incremental_vacuum(conn, deadline)
+                elif step == "analyze":
+                    conn.execute('ANALYZE')
+                else:
+                    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+                timings[step] = time.perf_counter() - start
+                MAINTENANCE_SECONDS.observe(timings[step], step=step)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        logging.error(f"Database maintenance failed: {e}")
+        return timings
+
+    logging.info(
+        f"Database maintenance: deleted {sum(deleted.values())} row(s) "
+        + ", ".join(f"{step} {seconds:.3f}s" for step, seconds in timings.items())
+    )
+    return timings
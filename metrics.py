@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+In-process metrics for the bot: counters and histograms rendered in the
+Prometheus text format. They can be served on /metrics or written to a
+snapshot file after every cycle.
+"""
+
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(label_names, label_values, extra=None):
+    pairs = list(zip(label_names, label_values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+class Counter:
+    """Monotonic counter, optionally split by labels."""
+    kind = "counter"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(name, "") for name in self.label_names), 0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {value}" for key, value in items]
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, optionally split by labels."""
+    kind = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, "") for name in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the wall time spent inside the with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            items = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', bound))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, ('le', '+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+class MetricsRegistry:
+    """Holds every metric and renders them together."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _register(self, metric):
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text, label_names=()):
+        return self._register(Counter(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, label_names, buckets))
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, path):
+        """Atomically writes the current metrics to path."""
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w") as file:
+                file.write(self.render())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Failed to write metrics snapshot: {e}")
+
+def start_http_server(port, host="0.0.0.0", registry=None):
+    """Serves the registry on http://host:port/metrics from a daemon thread."""
+    registry = registry or REGISTRY
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Metrics available on http://{host}:{port}/metrics")
+    return server
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.counter("bot_http_requests_total", "Airline API requests.", ("host", "status"))
+HTTP_LATENCY = REGISTRY.histogram("bot_http_request_seconds", "Airline API request latency.", ("host",))
+HTTP_BYTES = REGISTRY.histogram("bot_http_response_bytes", "Airline API response size.", ("host",), BYTES_BUCKETS)
+CACHE_LOOKUPS = REGISTRY.counter("bot_cache_lookups_total", "Cache lookups by cache and result.", ("cache", "result"))
+DEALS_FOUND = REGISTRY.counter("bot_deals_found_total", "Deals returned by the fetchers.", ("type",))
+CELL_CHANGES = REGISTRY.counter("bot_cell_changes_total", "Calendar cells that changed since the last cycle.", ("kind",))
+DB_WRITE_SECONDS = REGISTRY.histogram("bot_db_write_seconds", "Time spent writing flight prices.")
+MAINTENANCE_SECONDS = REGISTRY.histogram("bot_maintenance_seconds", "Duration of database maintenance steps.", ("step",))
+MAINTENANCE_ROWS = REGISTRY.counter("bot_maintenance_deleted_rows_total", "Expired rows deleted by maintenance.", ("table",))
+NOTIFICATION_SECONDS = REGISTRY.histogram("bot_notification_seconds", "Telegram notification latency.", ("status",))
+COMMAND_SECONDS = REGISTRY.histogram("bot_command_seconds", "Time to build the reply to a Telegram command.", ("command",))
+CYCLE_SECONDS = REGISTRY.histogram("bot_cycle_seconds", "Duration of a full flight check cycle.")
@@ -1,34 +1,65 @@
 import os
+import time
 import logging
 import requests
+from metrics import NOTIFICATION_SECONDS
+from profiling import span
 
-def send_telegram_notification(message):
+# Reused connection to the Bot API, for fanning one deal out to many chats
+_session = requests.Session()
+
+# Read when used, so values loaded from .env after import still apply
+def bot_token():
+    return os.getenv("TELEGRAM_BOT_TOKEN", "7679580588:AAHdMgZKVieTm2C7q42Wr18IbsOYohvcfR8")
+
+def chat_id():
+    return os.getenv("TELEGRAM_CHAT_ID", "-4936979548")
+
+def api_url():
+    """Base URL of the Bot API; TELEGRAM_API_URL points it at a local fake server."""
+    return os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+def bot_url(method, token=None, base_url=None):
+    """Returns the Bot API URL of a method, e.g. bot_url("sendMessage")."""
+    return f"{base_url or api_url()}/bot{token or bot_token()}/{method}"
+
+def send_telegram_notification(message, to_chat=None, base_url=None, token=None):
     """
     Sends a message to a Telegram user or group using the Telegram HTTP API.
 
-    It reads the bot token and chat ID from environment variables.
+    The bot token and chat ID come from TELEGRAM_BOT_TOKEN / TELEGRAM_CHAT_ID;
+    to_chat overrides the chat, e.g. to answer a command.
     """
-    bot_token = "7679580588:AAHdMgZKVieTm2C7q42Wr18IbsOYohvcfR8"
-    chat_id = "-4936979548"
+    token = token or bot_token()
+    to_chat = to_chat or chat_id()
 
-    if not bot_token or not chat_id:
+    if not token or not to_chat:
         logging.error("Telegram bot token or chat ID is not configured. Skipping notification.")
         return
 
-    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+    url = bot_url("sendMessage", token, base_url)
     payload = {
-        "chat_id": chat_id,
+        "chat_id": to_chat,
         "text": message,
         "parse_mode": "Markdown"
     }
 
+    start = time.perf_counter()
     try:
-        response = requests.post(url, json=payload)
-        response.raise_for_status()
+        with span("phase:notify"):
+            response = _session.post(url, json=payload, timeout=10)
+            response.raise_for_status()
+        NOTIFICATION_SECONDS.observe(time.perf_counter() - start, status="sent")
         logging.info("Telegram notification sent successfully.")
     except Exception as e:
+        NOTIFICATION_SECONDS.observe(time.perf_counter() - start, status="failed")
         logging.error(f"Failed to send Telegram notification: {e}")
 
+def send_to_chats(message, chats):
+    """Sends one message to every chat in chats (see subscriptions.py)."""
+    for chat in chats:
+        send_telegram_notification(message, to_chat=chat)
+
 # Send startup message when the module is run directly
 if __name__ == "__main__":
     send_telegram_notification("🤖 Bot is online and ready to check flights!")
\ No newline at end of file
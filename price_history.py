@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Time-series store for price observations.
+
+Every cell price seen in a cycle, changed or not, is written once as a raw
+observation and folded into hourly and daily rollups (min/max/last/samples)
+in the same transaction, so each bucket aggregates every sighting. Retention is tiered: raw rows are kept for
+HISTORY_RAW_RETENTION_DAYS, hourly rollups for HISTORY_HOURLY_RETENTION_DAYS
+and daily rollups until the outbound date has passed; maintenance.py
+deletes what expired.
+"""
+
+import logging
+import sqlite3
+import time
+import database
+from config import HISTORY_RAW_RETENTION_DAYS, HISTORY_HOURLY_RETENTION_DAYS
+from metrics import DB_WRITE_SECONDS
+from profiling import span
+
+DAY_SECONDS = 24 * 60 * 60
+
+# Rollup resolution -> bucket width in seconds
+RESOLUTIONS = {"hour": 60 * 60, "day": DAY_SECONDS}
+
+def record_observations(rows, observed_at=None):
+    """
+    Stores one cycle of observations and updates their rollups.
+    rows: (airline, route, outbound_date, return_date, price) tuples
+    """
+    if not rows:
+        return
+    now = int(observed_at if observed_at is not None else time.time())
+    try:
+        with span("phase:db"), DB_WRITE_SECONDS.time():
+            conn = sqlite3.connect(database.DB_FILE)
+            with conn:
+                conn.executemany('''
+                    INSERT OR REPLACE INTO price_observations
+                        (airline, route, outbound_date, return_date, observed_at, price)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [(*row[:4], now, row[4]) for row in rows])
+                for resolution, seconds in RESOLUTIONS.items():
+                    bucket = now - now % seconds
+                    conn.executemany('''
+                        INSERT INTO price_rollups
+                            (resolution, airline, route, outbound_date, return_date, bucket,
+                             min_price, max_price, last_price, samples)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+                        ON CONFLICT (resolution, airline, route, outbound_date, return_date, bucket)
+                        DO UPDATE SET
+                            min_price = min(min_price, excluded.min_price),
+                            max_price = max(max_price, excluded.max_price),
+                            last_price = excluded.last_price,
+                            samples = samples + 1
+                    ''', [(resolution, *row[:4], bucket, row[4], row[4], row[4]) for row in rows])
+            conn.close()
+    except sqlite3.Error as e:
+        logging.error(f"Failed to record price observations: {e}")
+
+def price_series(airline, route, outbound_date, return_date, since=None):
+    """
+    Yields (timestamp, min, max, last) for one cell since the given epoch
+    seconds, from the finest tier that still covers that period.
+    """
+    now = time.time()
+    since = int(since if since is not None else now - HISTORY_RAW_RETENTION_DAYS * DAY_SECONDS)
+    conn = sqlite3.connect(database.DB_FILE)
+    try:
+        if since >= now - HISTORY_RAW_RETENTION_DAYS * DAY_SECONDS:
+            cursor = conn.execute('''
+                SELECT observed_at, price, price, price FROM price_observations
+                WHERE airline = ? AND route = ? AND outbound_date = ? AND return_date = ? AND observed_at >= ?
+                ORDER BY observed_at
+            ''', (airline, route, outbound_date, return_date, since))
+        else:
+            resolution = "hour" if since >= now - HISTORY_HOURLY_RETENTION_DAYS * DAY_SECONDS else "day"
+            cursor = conn.execute('''
+                SELECT bucket, min_price, max_price, last_price FROM price_rollups
+                WHERE resolution = ? AND airline = ? AND route = ? AND outbound_date = ? AND return_date = ?
+                    AND bucket >= ?
+                ORDER BY bucket
+            ''', (resolution, airline, route, outbound_date, return_date, since - since % RESOLUTIONS[resolution]))
+        yield from cursor
+    finally:
+        conn.close()
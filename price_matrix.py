@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Price matrix for round trips: outbound date x return date.
+
+Each outbound date is one row, an array('d') of total prices indexed by
+return date (as day ordinal minus the matrix's first return ordinal). Missing
+cells hold infinity, so row minimums and slices run at C speed without numpy.
+"""
+
+import heapq
+import math
+from array import array
+from typing import NamedTuple
+from dates import ordinal_iso
+
+INF = math.inf
+
+class Cell(NamedTuple):
+    """One priced outbound/return pair."""
+    outbound: int
+    inbound: int
+    price: float
+
+    @property
+    def duration_days(self):
+        return self.inbound - self.outbound
+
+    @property
+    def outbound_date(self):
+        return ordinal_iso(self.outbound)
+
+    @property
+    def return_date(self):
+        return ordinal_iso(self.inbound)
+
+class PriceMatrix:
+    """Total prices for every outbound/return pair seen in a route's calendars."""
+
+    def __init__(self, first_return, last_return):
+        self.first_return = first_return
+        self.width = last_return - first_return + 1
+        self.rows = {}
+        self.outbound_prices = {}
+
+    def set_outbound(self, outbound, price):
+        """Sets the one-way price of the outbound leg."""
+        self.outbound_prices[outbound] = price
+
+    def add_returns(self, outbound, return_prices):
+        """
+        Adds the return leg prices ({return ordinal: price}) for an outbound
+        date whose price is already set. Returns outside the matrix are ignored.
+        """
+        outbound_price = self.outbound_prices.get(outbound)
+        if outbound_price is None:
+            return
+        row = self.rows.get(outbound)
+        if row is None:
+            row = self.rows[outbound] = array('d', [INF]) * self.width
+        first = self.first_return
+        for inbound, price in return_prices.items():
+            column = inbound - first
+            if 0 <= column < self.width and inbound > outbound:
+                row[column] = outbound_price + price
+
+    def _columns(self, outbound, min_days, max_days):
+        """Column range of the row whose durations lie in [min_days, max_days]."""
+        start = 0 if min_days is None else max(0, outbound + min_days - self.first_return)
+        stop = self.width if max_days is None else min(self.width, outbound + max_days - self.first_return + 1)
+        return start, stop
+
+    def cells(self, min_days=None, max_days=None):
+        """Yields every priced cell within the duration bounds."""
+        first = self.first_return
+        for outbound, row in self.rows.items():
+            start, stop = self._columns(outbound, min_days, max_days)
+            for column in range(start, stop):
+                price = row[column]
+                if price != INF:
+                    yield Cell(outbound, first + column, price)
+
+    def cheapest_per_outbound(self, min_days=None, max_days=None):
+        """Returns the cheapest cell of every outbound date, in date order."""
+        result = []
+        for outbound in sorted(self.rows):
+            row = self.rows[outbound]
+            start, stop = self._columns(outbound, min_days, max_days)
+            if start >= stop:
+                continue
+            segment = row[start:stop]
+            price = min(segment)
+            if price != INF:
+                result.append(Cell(outbound, self.first_return + start + segment.index(price), price))
+        return result
+
+    def cheapest_per_duration(self, bucket_days=7, min_days=None, max_days=None):
+        """
+        Returns {bucket start in days: cheapest cell} with durations grouped
+        into buckets of bucket_days.
+        """
+        best = {}
+        for cell in self.cells(min_days, max_days):
+            bucket = cell.duration_days // bucket_days * bucket_days
+            current = best.get(bucket)
+            if current is None or cell.price < current.price:
+                best[bucket] = cell
+        return dict(sorted(best.items()))
+
+    def top(self, k, min_days=None, max_days=None):
+        """Returns the k cheapest cells overall."""
+        # The k cheapest prices of each row bound the overall k-th price, so
+        # only cells at or below it need to be materialized
+        candidates = []
+        for outbound, row in self.rows.items():
+            start, stop = self._columns(outbound, min_days, max_days)
+            candidates.extend(sorted(row[start:stop])[:k])
+        candidates = [price for price in heapq.nsmallest(k, candidates) if price != INF]
+        if not candidates:
+            return []
+        cells = self.under(math.nextafter(candidates[-1], INF), min_days, max_days)
+        return sorted(cells, key=lambda cell: cell.price)[:k]
+
+    def under(self, threshold, min_days=None, max_days=None):
+        """Returns every cell cheaper than threshold."""
+        first = self.first_return
+        result = []
+        for outbound, row in self.rows.items():
+            start, stop = self._columns(outbound, min_days, max_days)
+            if start >= stop or min(row[start:stop]) >= threshold:
+                continue
+            for column in range(start, stop):
+                if row[column] < threshold:
+                    result.append(Cell(outbound, first + column, row[column]))
+        return result
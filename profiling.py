@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+On-demand profiling of flight check cycles.
+
+Profiling is off by default and then costs a single flag check per span.
+It is switched on for the next cycle(s) with PROFILE_CYCLES=N at startup or by
+sending SIGUSR1 to the worker. PROFILE_MODE picks the profiler:
+
+- sample (default): samples the cycle's stack every PROFILE_INTERVAL_MS and
+  writes folded stacks (`*.folded`) for flamegraph.pl / speedscope.
+- cprofile: runs the cycle under cProfile and writes `*.pstats`.
+
+Code tags what it is doing with span("airline:level") / span("phase:db");
+sampled stacks are prefixed with the active spans. Output goes to a
+`profiles` directory next to the database.
+"""
+
+import cProfile
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from config import DB_FILE
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), "profiles")
+
+_pending_cycles = int(os.getenv("PROFILE_CYCLES", "0") or 0)
+_active = False
+_spans = {}
+
+class _Span:
+    __slots__ = ("name", "stack")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.stack = _spans.setdefault(threading.get_ident(), [])
+        self.stack.append(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.stack.pop()
+        return False
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def span(name):
+    """Tags the enclosed code in profiles. Free when profiling is off."""
+    if not _active:
+        return _NULL_SPAN
+    return _Span(name)
+
+def request_profile(cycles=1):
+    """Asks for the next `cycles` flight checks to be profiled."""
+    global _pending_cycles
+    _pending_cycles += cycles
+    logging.info(f"Profiling requested for the next {cycles} cycle(s)")
+
+def install_signal_handler():
+    """SIGUSR1 profiles the next cycle (where the platform supports it)."""
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: request_profile())
+
+class StackSampler:
+    """Samples one thread's stack from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            frames.reverse()
+            tags = _spans.get(self.thread_id, ())
+            self.samples[";".join([*tags, *frames])] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, "w") as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+
+class _CycleProfile:
+    """Context manager profiling one cycle when one has been requested."""
+
+    def __enter__(self):
+        global _pending_cycles, _active
+        self.enabled = _pending_cycles > 0
+        if not self.enabled:
+            return self
+
+        _pending_cycles -= 1
+        _active = True
+        self.mode = os.getenv("PROFILE_MODE", "sample")
+        self.started = time.perf_counter()
+        if self.mode == "cprofile":
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        else:
+            interval = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+            self.profiler = StackSampler(threading.get_ident(), interval)
+            self.profiler.start()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        if not self.enabled:
+            return False
+
+        _active = False
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = f"cycle-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        try:
+            if self.mode == "cprofile":
+                self.profiler.disable()
+                path = os.path.join(PROFILE_DIR, f"{name}.pstats")
+                self.profiler.dump_stats(path)
+            else:
+                self.profiler.stop()
+                path = os.path.join(PROFILE_DIR, f"{name}.folded")
+                self.profiler.write(path)
+            logging.info(f"Cycle profile ({time.perf_counter() - self.started:.2f}s) written to {path}")
+        except OSError as e:
+            logging.error(f"Failed to write cycle profile: {e}")
+        return False
+
+def profile_cycle():
+    """Wraps one cycle; profiles it only if a profile was requested."""
+    return _CycleProfile()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Airline provider interface and the runtime that executes it.
+
+A provider describes one airline API and does no I/O of its own:
+
+- plan(watch, responses): the queries a watch needs. It is called again as
+  responses arrive, so queries may depend on earlier answers (e.g. LEVEL's
+  return calendars depend on the outbound dates it returned).
+- send(session, query): sends one query and returns the HTTP response.
+- extract(response): keeps only the fields parse() reads (dates and
+  prices) from the response body, as plain tuples.
+- parse(watch, responses): turns the extracted responses into Deal objects.
+
+The Runtime runs every watch of a cycle together. Each round it collects
+the queries all watches still need, sends every distinct query once (served
+from the cycle cache when possible) on a shared thread pool, bounded per
+provider by max_concurrency and requests_per_second, and counts cache
+lookups; request metrics come from the session's response hook. The full
+JSON tree of a response is dropped as soon as extract() returns, so the
+cycle cache only holds the projected fields.
+
+A new airline subclasses Provider, sets name and watch_types, and calls
+register(); its watches then go through the same runtime.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from search_plan import WATCH_AIRLINES, compile_watch
+from metrics import CACHE_LOOKUPS
+from profiling import span
+from config import FETCH_WORKERS
+from log_setup import REQUEST_LOGGER
+
+try:
+    # Optional faster parser for the calendar payloads
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+request_log = logging.getLogger(REQUEST_LOGGER)
+
+class Provider:
+    """Base class of airline providers."""
+
+    # Query.airline of the provider's queries
+    name = None
+    # Watch types (search_plan.toml `type`) the provider serves
+    watch_types = ()
+    # Requests in flight at once, and requests started per second (None: unlimited)
+    max_concurrency = 4
+    requests_per_second = None
+
+    def plan(self, watch, responses):
+        """Returns the queries the watch needs given the responses so far."""
+        return compile_watch(watch)
+
+    def send(self, session, query):
+        """Sends one query through session and returns the response."""
+        raise NotImplementedError
+
+    def extract(self, response):
+        """Returns the parts of the response body that parse() reads."""
+        return loads(response.content)
+
+    def parse(self, watch, responses):
+        """
+        Returns the watch's deals. responses maps queries to what extract()
+        returned, and failed queries to None.
+        """
+        raise NotImplementedError
+
+    def describe(self, query):
+        """Short text of a query for logs."""
+        if query.outbound_date and query.return_date:
+            return f"{query.origin}-{query.destination} {query.outbound_date} -> {query.return_date}"
+        if query.outbound_date:
+            return f"{query.origin}-{query.destination} returns {query.year}-{query.month:02d} after {query.outbound_date}"
+        return f"{query.origin}-{query.destination} {query.triptype} {query.year}-{query.month:02d}"
+
+# Provider name -> provider, and watch type -> provider
+PROVIDERS = {}
+WATCH_PROVIDERS = {}
+
+def register(provider):
+    """Registers a provider for its watch types and returns it."""
+    PROVIDERS[provider.name] = provider
+    for watch_type in provider.watch_types:
+        WATCH_PROVIDERS[watch_type] = provider
+        # Lets search_plan.toml use the type
+        WATCH_AIRLINES.setdefault(watch_type, provider.name)
+    return provider
+
+class RateLimiter:
+    """Spaces out request starts to at most rate per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_start = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+class Runtime:
+    """Executes provider queries: cycle cache, concurrency and rate limits."""
+
+    def __init__(self, session, workers=FETCH_WORKERS):
+        self.session = session
+        self.workers = workers
+        self._executor = None
+        # Responses of the current cycle, keyed by query. Watches that need
+        # the same query share one request; failures are not cached.
+        self._results = {}
+        self._slots = {}
+        self._limiters = {}
+
+    def begin_cycle(self):
+        """Forgets the responses of the previous cycle."""
+        self._results.clear()
+
+    def _limits(self, provider):
+        if provider.name not in self._slots:
+            self._slots[provider.name] = threading.BoundedSemaphore(provider.max_concurrency)
+            self._limiters[provider.name] = RateLimiter(provider.requests_per_second)
+        return self._slots[provider.name], self._limiters[provider.name]
+
+    def _send(self, provider, query, slots, limiter):
+        request_log.info("Fetching %s %s", provider.name, provider.describe(query))
+        with slots:
+            limiter.wait()
+            response = provider.send(self.session, query)
+        response.raise_for_status()
+        try:
+            return provider.extract(response)
+        except (LookupError, TypeError, AttributeError) as e:
+            raise ValueError(f"unexpected response shape: {e!r}") from e
+
+    def fetch(self, queries):
+        """
+        Runs queries concurrently and returns {query: extracted response},
+        with None for queries that failed (the error is logged).
+        """
+        results = {}
+        futures = {}
+        for query in dict.fromkeys(queries):
+            if query in self._results:
+                CACHE_LOOKUPS.inc(cache="query", result="hit")
+                results[query] = self._results[query]
+                continue
+            CACHE_LOOKUPS.inc(cache="query", result="miss")
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="fetch")
+            provider = PROVIDERS[query.airline]
+            futures[query] = self._executor.submit(self._send, provider, query, *self._limits(provider))
+
+        for query, future in futures.items():
+            provider = PROVIDERS[query.airline]
+            try:
+                # Tags the wait in sampled profiles, which only see this thread
+                with span(f"airline:{provider.name}"):
+                    data = future.result()
+                results[query] = self._results[query] = data
+            except requests.exceptions.RequestException as e:
+                logging.error(f"Error fetching {provider.name} {provider.describe(query)}: {e}")
+                results[query] = None
+            except ValueError as e:
+                logging.error(f"Error parsing {provider.name} JSON for {provider.describe(query)}: {e}")
+                results[query] = None
+        return results
+
+    def run(self, watches):
+        """Returns the deals of every watch, in watch order."""
+        watches = [watch for watch in watches if watch.type in WATCH_PROVIDERS]
+        responses = {}
+        while True:
+            needed = [
+                query
+                for watch in watches
+                for query in WATCH_PROVIDERS[watch.type].plan(watch, responses)
+                if query not in responses
+            ]
+            if not needed:
+                break
+            responses.update(self.fetch(needed))
+
+        deals = []
+        for watch in watches:
+            with span(f"search:{watch.type}"):
+                deals.extend(WATCH_PROVIDERS[watch.type].parse(watch, responses))
+        return deals
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+Declarative search plan.
+
+Routes, airlines, date windows, durations and thresholds are listed as
+[[watch]] entries in search_plan.toml. At startup every watch is compiled into
+the API queries it needs, and identical queries are merged so that watches
+sharing a calendar only cost one request per cycle.
+
+If the plan file does not exist, an equivalent plan is built from config.py.
+"""
+
+import logging
+import os
+import signal
+import tomllib
+from dataclasses import dataclass
+from datetime import date
+from dates import date_grid, iso_month
+from config import (
+    SEARCH_PLAN_FILE, CURRENCY, ORIGIN, DESTINATION, SEARCH_DATES, PRICE_THRESHOLD_EUR,
+    ONE_WAY_ORIGIN, ONE_WAY_DESTINATION, ONE_WAY_DATES, ONE_WAY_THRESHOLD_EUR,
+    SPECIFIC_ORIGIN, SPECIFIC_DESTINATION, SPECIFIC_THRESHOLD_EUR,
+    SPECIFIC_START_DATE, SPECIFIC_END_DATE, MIN_DURATION_DAYS, MAX_DURATION_DAYS,
+    AR_ROUTES, AIR_EUROPA_ROUTES
+)
+
+# Watch type -> airline serving it
+WATCH_AIRLINES = {
+    "round_trip": "level",
+    "one_way": "level",
+    "specific_range": "level",
+    "aerolineas_argentinas": "aerolineas_argentinas",
+    "aireuropa": "aireuropa"
+}
+
+class SearchPlanError(ValueError):
+    """Raised when the search plan file is invalid."""
+
+@dataclass(frozen=True)
+class Query:
+    """
+    One API request. Hashable, so identical requests from different watches
+    collapse into a single entry.
+    """
+    airline: str
+    origin: str
+    destination: str
+    triptype: str = "RT"
+    year: int = None
+    month: int = None
+    outbound_date: str = None
+    return_date: str = None
+    currency: str = CURRENCY
+
+@dataclass(frozen=True)
+class Watch:
+    """One entry of the search plan."""
+    name: str
+    type: str
+    origin: str
+    destination: str
+    threshold: float
+    airline: str = "level"
+    description: str = ""
+    currency: str = CURRENCY
+    enabled: bool = True
+    months: tuple = ()
+    outbound_months: tuple = ()
+    return_months: tuple = ()
+    max_outbound_dates: int = 5
+    all_pairs: bool = False
+    start_date: str = None
+    end_date: str = None
+    min_duration_days: int = MIN_DURATION_DAYS
+    max_duration_days: int = MAX_DURATION_DAYS
+
+    def outbound_windows(self):
+        """
+        Returns the precomputed dates.Window grid of a date-range watch: every
+        outbound date with a valid return window.
+        """
+        return date_grid(self.start_date, self.end_date, self.min_duration_days, self.max_duration_days)
+
+def compile_watch(watch):
+    """
+    Returns the queries a watch needs, in execution order.
+    Round trips only list their outbound calendars here: the return calendars
+    depend on which outbound dates the API returns.
+    """
+    queries = []
+    if watch.type == "one_way":
+        for year, month in watch.months:
+            queries.append(Query("level", watch.origin, watch.destination, "OW", year, month, currency=watch.currency))
+    elif watch.type == "round_trip":
+        for year, month in watch.outbound_months:
+            queries.append(Query("level", watch.origin, watch.destination, "RT", year, month, currency=watch.currency))
+    elif watch.type == "specific_range":
+        for window in watch.outbound_windows():
+            queries.append(Query("level", watch.origin, watch.destination, "RT", *iso_month(window.max_return_iso),
+                                 outbound_date=window.outbound_iso, currency=watch.currency))
+            queries.append(Query("level", watch.origin, watch.destination, "RT", *iso_month(window.outbound_iso),
+                                 currency=watch.currency))
+    else:
+        for window in watch.outbound_windows():
+            queries.append(Query(watch.airline, watch.origin, watch.destination,
+                                 outbound_date=window.outbound_iso, return_date=window.max_return_iso,
+                                 currency=watch.currency))
+    return queries
+
+class SearchPlan:
+    """Watches plus the deduplicated set of queries they compile to."""
+
+    def __init__(self, watches):
+        self.watches = tuple(watches)
+        self.watch_queries = {}
+        self.queries = {}
+        for watch in self.watches:
+            if not watch.enabled:
+                continue
+            compiled = compile_watch(watch)
+            self.watch_queries[watch.name] = tuple(dict.fromkeys(compiled))
+            for query in compiled:
+                self.queries.setdefault(query, set()).add(watch.name)
+
+    @property
+    def enabled_watches(self):
+        return [watch for watch in self.watches if watch.enabled]
+
+    def summary(self):
+        requested = sum(len(queries) for queries in self.watch_queries.values())
+        return (f"{len(self.enabled_watches)} watches compiled into {len(self.queries)} queries "
+                f"({requested - len(self.queries)} shared)")
+
+def _parse_month(value):
+    try:
+        year, month = (int(part) for part in str(value).split("-"))
+    except ValueError:
+        raise SearchPlanError(f"Invalid month '{value}', expected YYYY-MM")
+    if not 1 <= month <= 12:
+        raise SearchPlanError(f"Invalid month '{value}', expected YYYY-MM")
+    return year, month
+
+def _optional_int(value):
+    return int(value) if value is not None else None
+
+def _parse_watch(entry, defaults, index):
+    try:
+        return _build_watch({**defaults, **entry}, index)
+    except SearchPlanError:
+        raise
+    except (TypeError, ValueError) as e:
+        # e.g. threshold_eur = "cheap" or max_outbound_dates = []
+        raise SearchPlanError(f"Watch #{index}: {e}")
+
+def _build_watch(entry, index):
+    watch_type = entry.get("type")
+    if watch_type not in WATCH_AIRLINES:
+        raise SearchPlanError(f"Watch #{index}: unknown type '{watch_type}'")
+
+    for field in ("origin", "destination", "threshold_eur"):
+        if field not in entry:
+            raise SearchPlanError(f"Watch #{index}: missing '{field}'")
+
+    # Round trips span months, so their durations are only bounded when asked
+    default_durations = (None, None) if watch_type == "round_trip" else (MIN_DURATION_DAYS, MAX_DURATION_DAYS)
+
+    kwargs = {
+        "name": entry.get("name", f"{watch_type}-{entry['origin']}-{entry['destination']}-{index}"),
+        "type": watch_type,
+        "airline": WATCH_AIRLINES[watch_type],
+        "origin": entry["origin"],
+        "destination": entry["destination"],
+        "threshold": float(entry["threshold_eur"]),
+        "description": entry.get("description", f"{entry['origin']} ➔ {entry['destination']}"),
+        "currency": entry.get("currency", CURRENCY),
+        "enabled": bool(entry.get("enabled", True)),
+        "months": tuple(_parse_month(month) for month in entry.get("months", ())),
+        "outbound_months": tuple(_parse_month(month) for month in entry.get("outbound_months", ())),
+        "return_months": tuple(_parse_month(month) for month in entry.get("return_months", ())),
+        "max_outbound_dates": int(entry.get("max_outbound_dates", 5)),
+        "all_pairs": bool(entry.get("all_pairs", False)),
+        "start_date": entry.get("start_date"),
+        "end_date": entry.get("end_date"),
+        "min_duration_days": _optional_int(entry.get("min_duration_days", default_durations[0])),
+        "max_duration_days": _optional_int(entry.get("max_duration_days", default_durations[1]))
+    }
+
+    if watch_type == "one_way" and not kwargs["months"]:
+        raise SearchPlanError(f"Watch #{index}: one_way needs 'months'")
+    if watch_type == "round_trip" and not (kwargs["outbound_months"] and kwargs["return_months"]):
+        raise SearchPlanError(f"Watch #{index}: round_trip needs 'outbound_months' and 'return_months'")
+    if watch_type not in ("one_way", "round_trip"):
+        try:
+            date.fromisoformat(str(kwargs["start_date"]))
+            date.fromisoformat(str(kwargs["end_date"]))
+        except ValueError:
+            raise SearchPlanError(f"Watch #{index}: {watch_type} needs 'start_date' and 'end_date' as YYYY-MM-DD")
+        kwargs["start_date"] = str(kwargs["start_date"])
+        kwargs["end_date"] = str(kwargs["end_date"])
+    return Watch(**kwargs)
+
+def parse_search_plan(data):
+    """Builds a SearchPlan from the parsed TOML document."""
+    defaults = data.get("defaults", {})
+    watches = [_parse_watch(entry, defaults, index) for index, entry in enumerate(data.get("watch", []), 1)]
+    names = [watch.name for watch in watches]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise SearchPlanError(f"Duplicate watch names: {', '.join(sorted(duplicates))}")
+    return SearchPlan(watches)
+
+def plan_from_config():
+    """Builds the plan equivalent to the constants in config.py."""
+    def month(year, month):
+        return f"{year}-{month:02d}"
+
+    watches = [
+        {
+            "name": "round-trip", "type": "round_trip", "origin": ORIGIN, "destination": DESTINATION,
+            "outbound_months": sorted({month(y, m) for y, m, _, _ in SEARCH_DATES}),
+            "return_months": sorted({month(y, m) for _, _, y, m in SEARCH_DATES}),
+            "threshold_eur": PRICE_THRESHOLD_EUR
+        },
+        {
+            "name": "one-way", "type": "one_way", "origin": ONE_WAY_ORIGIN, "destination": ONE_WAY_DESTINATION,
+            "months": [month(y, m) for y, m in ONE_WAY_DATES], "threshold_eur": ONE_WAY_THRESHOLD_EUR
+        },
+        {
+            "name": "specific-range", "type": "specific_range", "origin": SPECIFIC_ORIGIN,
+            "destination": SPECIFIC_DESTINATION, "start_date": SPECIFIC_START_DATE, "end_date": SPECIFIC_END_DATE,
+            "threshold_eur": SPECIFIC_THRESHOLD_EUR
+        }
+    ]
+    for index, route in enumerate(AR_ROUTES, 1):
+        watches.append({
+            "name": f"aerolineas-argentinas-{index}", "type": "aerolineas_argentinas", "enabled": False,
+            "origin": route["origin"], "destination": route["destination"], "description": route["description"],
+            "start_date": SPECIFIC_START_DATE, "end_date": SPECIFIC_END_DATE, "threshold_eur": route["threshold_eur"]
+        })
+    for index, route in enumerate(AIR_EUROPA_ROUTES, 1):
+        watches.append({
+            "name": f"aireuropa-{index}", "type": "aireuropa", "enabled": False,
+            "origin": route["origin"], "destination": route["destination"], "description": route["description"],
+            "start_date": SPECIFIC_START_DATE, "end_date": SPECIFIC_END_DATE, "threshold_eur": route["threshold_eur"]
+        })
+    return parse_search_plan({"watch": watches})
+
+def load_search_plan(path=SEARCH_PLAN_FILE):
+    """Loads and compiles the plan file, or falls back to config.py."""
+    if not os.path.exists(path):
+        logging.info(f"{path} not found, using the search plan from config.py")
+        plan = plan_from_config()
+    else:
+        try:
+            with open(path, "rb") as file:
+                plan = parse_search_plan(tomllib.load(file))
+        except SearchPlanError:
+            raise
+        except (TypeError, ValueError) as e:
+            # Invalid TOML, or values of the wrong type outside a watch
+            raise SearchPlanError(f"Invalid {path}: {e}")
+    logging.info(f"Search plan: {plan.summary()}")
+    return plan
+
+class PlanDiff:
+    """What changed between the running plan and a reloaded one."""
+
+    def __init__(self, old, new):
+        old_watches = {watch.name: watch for watch in old.enabled_watches}
+        new_watches = {watch.name: watch for watch in new.enabled_watches}
+        self.added = [watch for name, watch in new_watches.items() if name not in old_watches]
+        self.removed = [watch for name, watch in old_watches.items() if name not in new_watches]
+        self.changed = [watch for name, watch in new_watches.items()
+                        if name in old_watches and old_watches[name] != watch]
+        self.new_queries = [query for query in new.queries if query not in old.queries]
+
+    @property
+    def watches_to_run(self):
+        """Watches that have not been searched with their current settings yet."""
+        return self.added + self.changed
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def summary(self):
+        return (f"{len(self.added)} added, {len(self.changed)} changed, {len(self.removed)} removed watches; "
+                f"{len(self.new_queries)} new queries")
+
+_current_plan = None
+
+def current_plan():
+    """Returns the active search plan, loading it on first use."""
+    global _current_plan
+    if _current_plan is None:
+        _current_plan = load_search_plan()
+    return _current_plan
+
+def reload_plan(path=SEARCH_PLAN_FILE):
+    """
+    Re-compiles the plan file and swaps it in.
+    Returns the PlanDiff against the running plan, or None if the new plan is
+    invalid (the running plan is then kept).
+    """
+    global _current_plan
+    old = current_plan()
+    try:
+        new = load_search_plan(path)
+    except (SearchPlanError, OSError) as e:
+        logging.error(f"Search plan reload failed, keeping the running plan: {e}")
+        return None
+
+    diff = PlanDiff(old, new)
+    _current_plan = new
+    logging.info(f"Search plan reloaded: {diff.summary()}")
+    return diff
+
+class PlanWatcher:
+    """
+    Notices changes to the plan file by its modification time, or on SIGHUP.
+    Polled from the scheduler loop, so reloads happen between cycles.
+    """
+
+    def __init__(self, path=SEARCH_PLAN_FILE):
+        self.path = path
+        self._mtime = self._stat()
+        self._requested = False
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def request_reload(self):
+        self._requested = True
+
+    def install_signal_handler(self):
+        """SIGHUP reloads the plan (where the platform supports it)."""
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: self.request_reload())
+
+    def poll(self):
+        """Reloads the plan if it changed. Returns the PlanDiff, or None."""
+        mtime = self._stat()
+        if mtime == self._mtime and not self._requested:
+            return None
+        self._mtime = mtime
+        self._requested = False
+        return reload_plan(self.path)
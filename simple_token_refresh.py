@@ -5,8 +5,6 @@ Uses browser automation to capture fresh tokens from airline websites.
 """
 
 import logging
-import time
-import json
 import re
 from datetime import datetime
 from selenium import webdriver
@@ -16,6 +14,11 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException
 import requests
+from log_setup import configure_logging
+from token_capture import (
+    enable_network_events, wait_for_headers, strip_bearer,
+    AR_API_HOST, AR_TOKEN_HEADERS, AIR_EUROPA_API_HOST, AIR_EUROPA_TOKEN_HEADERS
+)
 
 class SimpleTokenRefresh:
     def __init__(self):
@@ -27,10 +30,7 @@ class SimpleTokenRefresh:
     
     def setup_logging(self):
         """Setup logging for token refresh."""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        configure_logging()
     
     def setup_driver(self):
         """Setup Chrome driver with network logging enabled."""
@@ -53,70 +53,56 @@ class SimpleTokenRefresh:
             logging.error(f"Failed to initialize Chrome driver: {e}")
             return False
     
+    def fill_search_form(self):
+        """
+        Fills origin/destination and submits the search form, one step at a time.
+        Yields after each step so capture can stop as soon as tokens appear.
+        """
+        search_elements = self.driver.find_elements(By.CSS_SELECTOR, "input, button, select")
+        
+        for element in search_elements:
+            try:
+                placeholder = (element.get_attribute("placeholder") or "").lower()
+                if "origen" in placeholder:
+                    element.clear()
+                    element.send_keys("MAD")
+                    yield
+                elif "destino" in placeholder:
+                    element.clear()
+                    element.send_keys("COR")
+                    yield
+                elif element.tag_name == "button" and ("buscar" in element.text.lower() or "search" in element.text.lower()):
+                    element.click()
+                    yield
+                    break
+            except Exception:
+                continue
+    
     def capture_ar_token(self):
         """Capture AR token by navigating to their website and triggering API calls."""
         logging.info("Capturing AR token...")
         
         try:
+            enable_network_events(self.driver)
+            
             # Navigate to AR website
             self.driver.get("https://www.aerolineas.com.ar")
-            time.sleep(3)
-            
-            # Navigate to flight search page
-            self.driver.get("https://www.aerolineas.com.ar/es-ar/vuelos/buscar")
-            time.sleep(5)
             
-            # Clear any existing logs
+            # Drop landing page events, then open the flight search page
             self.driver.get_log('performance')
+            self.driver.get("https://www.aerolineas.com.ar/es-ar/vuelos/buscar")
             
-            # Try to trigger a flight search to generate API calls
-            try:
-                # Look for search form elements
-                search_elements = self.driver.find_elements(By.CSS_SELECTOR, "input, button, select")
-                
-                # Try to fill in a simple search
-                for element in search_elements:
-                    try:
-                        if element.get_attribute("placeholder") and "origen" in element.get_attribute("placeholder").lower():
-                            element.clear()
-                            element.send_keys("MAD")
-                            time.sleep(1)
-                        elif element.get_attribute("placeholder") and "destino" in element.get_attribute("placeholder").lower():
-                            element.clear()
-                            element.send_keys("COR")
-                            time.sleep(1)
-                        elif element.tag_name == "button" and ("buscar" in element.text.lower() or "search" in element.text.lower()):
-                            element.click()
-                            time.sleep(3)
-                            break
-                    except:
-                        continue
-                
-            except Exception as e:
-                logging.warning(f"Could not interact with search form: {e}")
-            
-            # Extract tokens from network logs
-            logs = self.driver.get_log('performance')
+            # Wait for the first authorized API call while filling the search form
+            captured = wait_for_headers(
+                self.driver, AR_API_HOST, AR_TOKEN_HEADERS,
+                actions=self.fill_search_form()
+            )
             
-            for log in logs:
-                try:
-                    log_entry = json.loads(log['message'])
-                    
-                    if 'message' in log_entry and log_entry['message']['method'] == 'Network.requestWillBeSent':
-                        request = log_entry['message']['params']['request']
-                        url = request['url']
-                        headers = request.get('headers', {})
-                        
-                        # Look for AR API calls
-                        if 'api.aerolineas.com.ar' in url and 'authorization' in headers:
-                            auth_header = headers['authorization']
-                            if auth_header.startswith('Bearer '):
-                                self.ar_token = auth_header.replace('Bearer ', '')
-                                logging.info(f"✅ Captured AR token: {self.ar_token[:50]}...")
-                                return True
-                
-                except (json.JSONDecodeError, KeyError):
-                    continue
+            auth_header = captured.get('authorization', '')
+            if auth_header.startswith('Bearer '):
+                self.ar_token = strip_bearer(auth_header)
+                logging.info(f"✅ Captured AR token: {self.ar_token[:50]}...")
+                return True
             
             logging.warning("❌ No AR token found in network logs")
             return False
@@ -130,65 +116,27 @@ class SimpleTokenRefresh:
         logging.info("Capturing AirEuropa tokens...")
         
         try:
+            enable_network_events(self.driver)
+            
             # Navigate to AirEuropa website
             self.driver.get("https://digital.aireuropa.com")
-            time.sleep(3)
-            
-            # Navigate to flight search
-            self.driver.get("https://digital.aireuropa.com/es/vuelos")
-            time.sleep(5)
             
-            # Clear any existing logs
+            # Drop landing page events, then open the flight search page
             self.driver.get_log('performance')
+            self.driver.get("https://digital.aireuropa.com/es/vuelos")
             
-            # Try to trigger a flight search
-            try:
-                search_elements = self.driver.find_elements(By.CSS_SELECTOR, "input, button, select")
-                
-                for element in search_elements:
-                    try:
-                        if element.get_attribute("placeholder") and "origen" in element.get_attribute("placeholder").lower():
-                            element.clear()
-                            element.send_keys("MAD")
-                            time.sleep(1)
-                        elif element.get_attribute("placeholder") and "destino" in element.get_attribute("placeholder").lower():
-                            element.clear()
-                            element.send_keys("COR")
-                            time.sleep(1)
-                        elif element.tag_name == "button" and ("buscar" in element.text.lower() or "search" in element.text.lower()):
-                            element.click()
-                            time.sleep(3)
-                            break
-                    except:
-                        continue
-                
-            except Exception as e:
-                logging.warning(f"Could not interact with AirEuropa search form: {e}")
+            captured = wait_for_headers(
+                self.driver, AIR_EUROPA_API_HOST, AIR_EUROPA_TOKEN_HEADERS,
+                actions=self.fill_search_form()
+            )
             
-            # Extract tokens from network logs
-            logs = self.driver.get_log('performance')
+            if captured.get('authorization'):
+                self.aireuropa_auth = strip_bearer(captured['authorization'])
+                logging.info(f"✅ Captured AirEuropa auth: {self.aireuropa_auth[:50]}...")
             
-            for log in logs:
-                try:
-                    log_entry = json.loads(log['message'])
-                    
-                    if 'message' in log_entry and log_entry['message']['method'] == 'Network.requestWillBeSent':
-                        request = log_entry['message']['params']['request']
-                        url = request['url']
-                        headers = request.get('headers', {})
-                        
-                        # Look for AirEuropa API calls
-                        if 'digital.aireuropa.com' in url:
-                            if 'authorization' in headers:
-                                self.aireuropa_auth = headers['authorization']
-                                logging.info(f"✅ Captured AirEuropa auth: {self.aireuropa_auth[:50]}...")
-                            
-                            if 'd-token' in headers:
-                                self.aireuropa_d_token = headers['d-token']
-                                logging.info(f"✅ Captured AirEuropa d-token: {self.aireuropa_d_token[:50]}...")
-                
-                except (json.JSONDecodeError, KeyError):
-                    continue
+            if captured.get('x-d-token'):
+                self.aireuropa_d_token = captured['x-d-token']
+                logging.info(f"✅ Captured AirEuropa d-token: {self.aireuropa_d_token[:50]}...")
             
             if self.aireuropa_auth or self.aireuropa_d_token:
                 return True
@@ -5,20 +5,21 @@ Automatically detects expired tokens and refreshes them before running searches.
 """
 
 import logging
-import time
-import json
 import re
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException
 import requests
+from log_setup import configure_logging
 from api_client import check_ar_token, check_aireuropa_token
+from token_capture import (
+    enable_network_events, wait_for_headers, strip_bearer,
+    AR_API_HOST, AR_TOKEN_HEADERS, AIR_EUROPA_API_HOST, AIR_EUROPA_TOKEN_HEADERS
+)
+from token_providers import default_token_provider, AR_TOKEN, AIR_EUROPA_AUTH, AIR_EUROPA_D_TOKEN
 
 class SmartTokenRefresh:
-    def __init__(self):
+    def __init__(self, token_provider=None):
         self.driver = None
+        self.token_provider = token_provider or default_token_provider()
         self.ar_token = None
         self.aireuropa_auth = None
         self.aireuropa_d_token = None
@@ -26,13 +27,19 @@ class SmartTokenRefresh:
     
     def setup_logging(self):
         """Setup logging for smart token refresh."""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        configure_logging()
     
     def setup_driver(self):
         """Setup Chrome driver with network logging enabled."""
+        # Selenium is only loaded when a browser capture is needed, so token
+        # checks and HTTP refreshes in the worker don't pay for it
+        try:
+            from selenium import webdriver
+            from selenium.webdriver.chrome.options import Options
+        except ImportError as e:
+            logging.error(f"Selenium is not installed, cannot capture tokens with a browser: {e}")
+            return False
+
         chrome_options = Options()
         chrome_options.add_argument("--headless")
         chrome_options.add_argument("--no-sandbox")
@@ -64,66 +71,53 @@ class SmartTokenRefresh:
         
         return ar_valid, ae_valid
     
+    def interact_with_page(self):
+        """
+        Clicks visible buttons and fills inputs one at a time to trigger API calls.
+        Yields after each interaction so capture can stop as soon as tokens appear.
+        """
+        from selenium.webdriver.common.by import By
+
+        elements = self.driver.find_elements(By.CSS_SELECTOR, "button, input, select, a")
+        
+        for element in elements:
+            try:
+                if element.is_displayed() and element.is_enabled():
+                    if element.tag_name == "button":
+                        element.click()
+                        yield
+                    elif element.tag_name == "input" and element.get_attribute("placeholder"):
+                        element.clear()
+                        element.send_keys("MAD")
+                        yield
+            except Exception:
+                continue
+    
     def capture_ar_token(self):
         """Capture AR token using browser automation."""
         logging.info("🔄 Capturing fresh AR token...")
         
         try:
+            enable_network_events(self.driver)
+            
             # Navigate to AR website
             self.driver.get("https://www.aerolineas.com.ar")
-            time.sleep(3)
             
-            # Navigate to flight search page
-            self.driver.get("https://www.aerolineas.com.ar/es-ar/vuelos/buscar")
-            time.sleep(5)
-            
-            # Clear existing logs
+            # Drop landing page events, then open the flight search page
             self.driver.get_log('performance')
+            self.driver.get("https://www.aerolineas.com.ar/es-ar/vuelos/buscar")
             
-            # Try to trigger API calls by interacting with the page
-            try:
-                # Look for any clickable elements that might trigger API calls
-                elements = self.driver.find_elements(By.CSS_SELECTOR, "button, input, select, a")
-                
-                for element in elements:
-                    try:
-                        if element.is_displayed() and element.is_enabled():
-                            # Try clicking on buttons or filling inputs
-                            if element.tag_name == "button":
-                                element.click()
-                                time.sleep(2)
-                            elif element.tag_name == "input" and element.get_attribute("placeholder"):
-                                element.clear()
-                                element.send_keys("MAD")
-                                time.sleep(1)
-                    except:
-                        continue
-                
-            except Exception as e:
-                logging.warning(f"Could not interact with AR page: {e}")
-            
-            # Extract tokens from network logs
-            logs = self.driver.get_log('performance')
+            # Wait for the first authorized API call, interacting with the page meanwhile
+            captured = wait_for_headers(
+                self.driver, AR_API_HOST, AR_TOKEN_HEADERS,
+                actions=self.interact_with_page()
+            )
             
-            for log in logs:
-                try:
-                    log_entry = json.loads(log['message'])
-                    
-                    if 'message' in log_entry and log_entry['message']['method'] == 'Network.requestWillBeSent':
-                        request = log_entry['message']['params']['request']
-                        url = request['url']
-                        headers = request.get('headers', {})
-                        
-                        # Look for AR API calls
-                        if 'api.aerolineas.com.ar' in url and 'authorization' in headers:
-                            auth_header = headers['authorization']
-                            if auth_header.startswith('Bearer '):
-                                self.ar_token = auth_header.replace('Bearer ', '')
-                                logging.info(f"✅ Captured fresh AR token: {self.ar_token[:50]}...")
-                                return True
-                
-                except (json.JSONDecodeError, KeyError):
-                    continue
+            auth_header = captured.get('authorization', '')
+            if auth_header.startswith('Bearer '):
+                self.ar_token = strip_bearer(auth_header)
+                logging.info(f"✅ Captured fresh AR token: {self.ar_token[:50]}...")
+                return True
             
             logging.warning("❌ No AR token found in network logs")
             return False
@@ -137,61 +131,27 @@ class SmartTokenRefresh:
         logging.info("🔄 Capturing fresh AirEuropa tokens...")
         
         try:
+            enable_network_events(self.driver)
+            
             # Navigate to AirEuropa website
             self.driver.get("https://digital.aireuropa.com")
-            time.sleep(3)
             
-            # Navigate to flight search
-            self.driver.get("https://digital.aireuropa.com/es/vuelos")
-            time.sleep(5)
-            
-            # Clear existing logs
+            # Drop landing page events, then open the flight search page
             self.driver.get_log('performance')
+            self.driver.get("https://digital.aireuropa.com/es/vuelos")
             
-            # Try to trigger API calls
-            try:
-                elements = self.driver.find_elements(By.CSS_SELECTOR, "button, input, select, a")
-                
-                for element in elements:
-                    try:
-                        if element.is_displayed() and element.is_enabled():
-                            if element.tag_name == "button":
-                                element.click()
-                                time.sleep(2)
-                            elif element.tag_name == "input" and element.get_attribute("placeholder"):
-                                element.clear()
-                                element.send_keys("MAD")
-                                time.sleep(1)
-                    except:
-                        continue
-                
-            except Exception as e:
-                logging.warning(f"Could not interact with AirEuropa page: {e}")
+            captured = wait_for_headers(
+                self.driver, AIR_EUROPA_API_HOST, AIR_EUROPA_TOKEN_HEADERS,
+                actions=self.interact_with_page()
+            )
             
-            # Extract tokens from network logs
-            logs = self.driver.get_log('performance')
+            if captured.get('authorization'):
+                self.aireuropa_auth = strip_bearer(captured['authorization'])
+                logging.info(f"✅ Captured fresh AirEuropa auth: {self.aireuropa_auth[:50]}...")
             
-            for log in logs:
-                try:
-                    log_entry = json.loads(log['message'])
-                    
-                    if 'message' in log_entry and log_entry['message']['method'] == 'Network.requestWillBeSent':
-                        request = log_entry['message']['params']['request']
-                        url = request['url']
-                        headers = request.get('headers', {})
-                        
-                        # Look for AirEuropa API calls
-                        if 'digital.aireuropa.com' in url:
-                            if 'authorization' in headers:
-                                self.aireuropa_auth = headers['authorization']
-                                logging.info(f"✅ Captured fresh AirEuropa auth: {self.aireuropa_auth[:50]}...")
-                            
-                            if 'd-token' in headers:
-                                self.aireuropa_d_token = headers['d-token']
-                                logging.info(f"✅ Captured fresh AirEuropa d-token: {self.aireuropa_d_token[:50]}...")
-                
-                except (json.JSONDecodeError, KeyError):
-                    continue
+            if captured.get('x-d-token'):
+                self.aireuropa_d_token = captured['x-d-token']
+                logging.info(f"✅ Captured fresh AirEuropa d-token: {self.aireuropa_d_token[:50]}...")
             
             if self.aireuropa_auth or self.aireuropa_d_token:
                 return True
@@ -263,38 +223,25 @@ class SmartTokenRefresh:
         
         logging.info("🔄 Some tokens are expired, refreshing...")
         
-        if not self.setup_driver():
-            return False
+        airlines = []
+        if not ar_valid:
+            airlines.append("ar")
+        if not ae_valid:
+            airlines.append("aireuropa")
         
-        try:
-            success = False
-            
-            # Refresh AR token if needed
-            if not ar_valid:
-                ar_success = self.capture_ar_token()
-                if ar_success:
-                    success = True
-            
-            # Refresh AirEuropa tokens if needed
-            if not ae_valid:
-                ae_success = self.capture_aireuropa_tokens()
-                if ae_success:
-                    success = True
-            
-            # Update tokens in file if any were captured
-            if success:
-                file_success = self.update_tokens_in_file()
-                if file_success:
-                    logging.info("✅ Smart token refresh completed successfully!")
-                    return True
-            
-            logging.error("❌ Smart token refresh failed")
-            return False
-                
-        finally:
-            if self.driver:
-                self.driver.quit()
-                logging.info("🔒 Browser driver closed")
+        # HTTP handshake first, browser capture only for what is still missing
+        tokens = self.token_provider.fetch_tokens(tuple(airlines))
+        self.ar_token = tokens.get(AR_TOKEN)
+        self.aireuropa_auth = tokens.get(AIR_EUROPA_AUTH)
+        self.aireuropa_d_token = tokens.get(AIR_EUROPA_D_TOKEN)
+        
+        # Update tokens in file if any were captured
+        if tokens and self.update_tokens_in_file():
+            logging.info("✅ Smart token refresh completed successfully!")
+            return True
+        
+        logging.error("❌ Smart token refresh failed")
+        return False
 
 def main():
     """Main function for smart token refresh."""
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+In-memory snapshot of the latest cycle's deals, read by the Telegram commands.
+
+run_flight_check() builds a new Snapshot after every cycle and publishes it
+by rebinding a single module-level reference, so readers always see one
+complete cycle without taking a lock, calling an airline API or querying
+the database.
+"""
+
+import time
+from change_tracker import DEFAULT_AIRLINE
+
+def _price(deal):
+    return deal.price
+
+def _cell(deal):
+    return deal.airline or DEFAULT_AIRLINE, deal.origin, deal.destination, deal.outbound, deal.inbound
+
+class Snapshot:
+    """Deals of one cycle, grouped by route ("ORIGIN-DESTINATION") and sorted by price."""
+
+    __slots__ = ("taken_at", "routes", "best")
+
+    def __init__(self, routes, taken_at):
+        self.taken_at = taken_at
+        self.routes = routes
+        self.best = sorted((deals[0] for deals in routes.values()), key=_price)
+
+    @classmethod
+    def from_deals(cls, deals, base=None, taken_at=None):
+        """
+        Builds a snapshot from deals, keeping the cheapest price per cell.
+        Cells of the base snapshot that are missing from deals are kept.
+        """
+        cells = {}
+        for deal in deals:
+            key = _cell(deal)
+            if key not in cells or deal.price < cells[key].price:
+                cells[key] = deal
+        if base is not None:
+            for route_deals in base.routes.values():
+                for deal in route_deals:
+                    cells.setdefault(_cell(deal), deal)
+
+        routes = {}
+        for deal in cells.values():
+            routes.setdefault(f"{deal.origin}-{deal.destination}", []).append(deal)
+        for route_deals in routes.values():
+            route_deals.sort(key=_price)
+        return cls(routes, taken_at if taken_at is not None else time.time())
+
+    def route(self, route, limit=None):
+        """Returns the cheapest deals of a route, or an empty list if it was not searched."""
+        return self.routes.get(route.upper(), [])[:limit]
+
+_current = Snapshot({}, 0.0)
+
+def current():
+    """Returns the latest published snapshot."""
+    return _current
+
+def publish(deals, partial=False):
+    """
+    Publishes the deals of a finished cycle. A partial cycle (only some watches
+    ran) updates its cells and keeps the rest of the previous snapshot.
+    """
+    global _current
+    _current = Snapshot.from_deals(deals, base=_current if partial else None)
+    return _current
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Telegram subscribers and their deal filters.
+
+Every chat can subscribe to routes ("BCN-EZE", or "*" for all of them) with
+its own maximum price, and set quiet hours during which it gets no alerts.
+Subscriptions are kept in memory, indexed by route and by price bucket
+(SUBSCRIPTION_PRICE_BUCKET wide): a deal only visits the buckets at or above
+its price on its own route, so matching cost follows the number of matching
+chats instead of the number of subscribers. The registry is persisted in
+the subscribers and subscriptions tables.
+"""
+
+import logging
+import math
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+import database
+import notifier
+from config import SUBSCRIPTION_PRICE_BUCKET, SUBSCRIPTION_TIMEZONE
+
+# Route of subscriptions to every route
+ALL_ROUTES = "*"
+
+def is_quiet(hour, start, end):
+    """True if hour falls in [start, end), which may wrap past midnight."""
+    if start is None or end is None or start == end:
+        return False
+    if start < end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+class SubscriptionRegistry:
+    """Subscriptions of every chat, indexed for matching deals."""
+
+    def __init__(self, bucket_width=SUBSCRIPTION_PRICE_BUCKET):
+        self.bucket_width = bucket_width
+        self.loaded = False
+        # (chat_id, route) -> max price
+        self._subscriptions = {}
+        # route -> bucket -> {chat_id: max price}, and route -> sorted buckets
+        self._index = {}
+        self._buckets = {}
+        # chat_id -> (quiet start hour, quiet end hour, timezone)
+        self._quiet = {}
+        # The bot thread edits subscriptions while the worker matches deals
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Loads the stored subscriptions from the database."""
+        subscribers, subscriptions = database.load_subscriptions()
+        with self._lock:
+            for chat_id, quiet_start, quiet_end, tz in subscribers:
+                self._quiet[chat_id] = (quiet_start, quiet_end, tz)
+            for chat_id, route, max_price in subscriptions:
+                self._add(chat_id, route, max_price)
+            self.loaded = True
+        logging.info(f"Loaded {len(self._subscriptions)} subscriptions of {len(self._quiet)} chats")
+
+    def _ensure_loaded(self):
+        if not self.loaded:
+            self.load()
+
+    def _bucket(self, price):
+        return int(price // self.bucket_width)
+
+    def _add(self, chat_id, route, max_price):
+        self._remove(chat_id, route)
+        bucket = self._bucket(max_price)
+        route_index = self._index.setdefault(route, {})
+        if bucket not in route_index:
+            route_index[bucket] = {}
+            insort(self._buckets.setdefault(route, []), bucket)
+        route_index[bucket][chat_id] = max_price
+        self._subscriptions[(chat_id, route)] = max_price
+
+    def _remove(self, chat_id, route):
+        max_price = self._subscriptions.pop((chat_id, route), None)
+        if max_price is None:
+            return False
+        bucket = self._bucket(max_price)
+        chats = self._index[route][bucket]
+        del chats[chat_id]
+        if not chats:
+            del self._index[route][bucket]
+            self._buckets[route].remove(bucket)
+        return True
+
+    def subscribe(self, chat_id, route, max_price):
+        """
+        Adds or replaces the subscription of a chat to a route. Raises
+        ValueError, changing nothing, unless max_price is finite and positive.
+        """
+        if not (math.isfinite(max_price) and max_price > 0):
+            raise ValueError(f"Invalid maximum price: {max_price}")
+        self._ensure_loaded()
+        chat_id, route = str(chat_id), route.upper()
+        with self._lock:
+            self._add(chat_id, route, max_price)
+            quiet = self._quiet.setdefault(chat_id, (None, None, SUBSCRIPTION_TIMEZONE))
+        database.save_subscription(chat_id, route, max_price, *quiet)
+
+    def unsubscribe(self, chat_id, route):
+        """Removes a subscription; returns False if there was none."""
+        self._ensure_loaded()
+        chat_id, route = str(chat_id), route.upper()
+        with self._lock:
+            removed = self._remove(chat_id, route)
+        if removed:
+            database.delete_subscription(chat_id, route)
+        return removed
+
+    def set_quiet_hours(self, chat_id, start, end, tz=SUBSCRIPTION_TIMEZONE):
+        """Sets the quiet hours of a chat; start=end=None turns them off."""
+        self._ensure_loaded()
+        ZoneInfo(tz)  # raises ZoneInfoNotFoundError for unknown names
+        chat_id = str(chat_id)
+        with self._lock:
+            self._quiet[chat_id] = (start, end, tz)
+        database.save_subscriber(chat_id, start, end, tz)
+
+    def subscriptions_of(self, chat_id):
+        """Returns the chat's (route, max price) pairs and its quiet hours."""
+        self._ensure_loaded()
+        chat_id = str(chat_id)
+        with self._lock:
+            routes = sorted((route, max_price) for (chat, route), max_price in self._subscriptions.items()
+                            if chat == chat_id)
+            return routes, self._quiet.get(chat_id)
+
+    def matches(self, route, price):
+        """Returns the chats subscribed to route (or to every route) at or above price."""
+        self._ensure_loaded()
+        first = self._bucket(price)
+        chats = []
+        with self._lock:
+            for key in (route, ALL_ROUTES):
+                buckets = self._buckets.get(key)
+                if not buckets:
+                    continue
+                route_index = self._index[key]
+                for bucket in buckets[bisect_left(buckets, first):]:
+                    for chat_id, max_price in route_index[bucket].items():
+                        if price <= max_price:
+                            chats.append(chat_id)
+        return chats
+
+    def _quiet_now(self, chat_id, now, hours):
+        quiet = self._quiet.get(chat_id)
+        if quiet is None or quiet[0] is None:
+            return False
+        start, end, tz = quiet
+        # Local hour per timezone, computed once per fan-out
+        if tz not in hours:
+            try:
+                hours[tz] = now.astimezone(ZoneInfo(tz)).hour
+            except ZoneInfoNotFoundError:
+                hours[tz] = now.hour
+        return is_quiet(hours[tz], start, end)
+
+    def recipients(self, deal, alert=False, now=None):
+        """
+        Returns the chats to notify about a deal: the default chat when alert
+        is set, plus every subscriber it matches that is not in quiet hours.
+        """
+        now = now or datetime.now(timezone.utc)
+        chats = {notifier.chat_id()} if alert else set()
+        hours = {}
+        for chat_id in self.matches(f"{deal.origin}-{deal.destination}", deal.price):
+            if chat_id not in chats and not self._quiet_now(chat_id, now, hours):
+                chats.add(chat_id)
+        return chats
+
+# Shared registry for the worker and the Telegram bot
+registry = SubscriptionRegistry()
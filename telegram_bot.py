@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Telegram commands, answered from the in-memory deal snapshot.
+
+    /best               cheapest deal of every route searched in the last cycle
+    /route MAD-COR      cheapest deals of one route
+    /history BCN-EZE    cheapest price per outbound week over the last 30 days
+    /subscribe BCN-EZE 700, /unsubscribe BCN-EZE, /quiet 23-8, /subscriptions
+                        manage the chat's alerts (subscriptions.py)
+
+Updates are read with Bot API long polling (getUpdates) on a daemon thread,
+next to the scheduler. /best and /route read snapshot.current() and never
+touch the airline APIs or the database; /history is an indexed read-only
+query over the daily rollups (history.py). Any chat can use the commands.
+TELEGRAM_API_URL points it at a local fake server for testing.
+
+The worker starts it when TELEGRAM_COMMANDS=1.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime
+import requests
+import notifier
+import snapshot
+import subscriptions
+from change_tracker import DEFAULT_AIRLINE
+from metrics import COMMAND_SECONDS
+
+# Seconds a getUpdates call waits for new messages
+LONG_POLL_SECONDS = 30
+
+# Deals listed per route
+ROUTE_LIMIT = 10
+
+def format_deal(deal):
+    dates = deal.outbound_date if deal.type == "one_way" else f"{deal.outbound_date} ➔ {deal.return_date}"
+    return f"{dates}: *{deal.price:.2f} {deal.currency}* ({deal.airline or DEFAULT_AIRLINE})"
+
+def _route_label(route):
+    route = route.upper()
+    return "todas las rutas" if route == subscriptions.ALL_ROUTES else route
+
+def _clock(taken_at):
+    return datetime.fromtimestamp(taken_at).strftime("%Y-%m-%d %H:%M")
+
+class CommandBot:
+    """Long-polling command handler."""
+
+    def __init__(self, api_url=None, bot_token=None, poll_seconds=LONG_POLL_SECONDS):
+        self.api_url = api_url or notifier.api_url()
+        self.bot_token = bot_token or notifier.bot_token()
+        self.poll_seconds = poll_seconds
+        self.offset = None
+        self.session = requests.Session()
+        self._stop = threading.Event()
+        self.commands = {
+            "/best": self.best,
+            "/route": self.route,
+            "/history": self.history,
+            "/subscribe": self.subscribe,
+            "/unsubscribe": self.unsubscribe,
+            "/quiet": self.quiet,
+            "/subscriptions": self.list_subscriptions,
+            "/help": self.help,
+            "/start": self.help,
+        }
+
+    # Commands: each takes the chat and the command's arguments and returns the reply text
+
+    def best(self, chat_id, args):
+        current = snapshot.current()
+        if not current.best:
+            return "Todavía no hay precios, esperá a que termine la primera búsqueda."
+        lines = [f"✈️ *Mejores precios* (búsqueda de las {_clock(current.taken_at)})\n"]
+        lines += [f"*{deal.origin} ➔ {deal.destination}* {format_deal(deal)}" for deal in current.best]
+        return "\n".join(lines)
+
+    def route(self, chat_id, args):
+        if not args:
+            return "Uso: /route ORIGEN-DESTINO, por ejemplo /route MAD-COR"
+        current = snapshot.current()
+        deals = current.route(args[0], ROUTE_LIMIT)
+        if not deals:
+            routes = ", ".join(sorted(current.routes)) or "ninguna todavía"
+            return f"No hay precios para {args[0].upper()}. Rutas buscadas: {routes}"
+        lines = [f"✈️ *{args[0].upper()}* (búsqueda de las {_clock(current.taken_at)})\n"]
+        lines += [format_deal(deal) for deal in deals]
+        return "\n".join(lines)
+
+    def history(self, chat_id, args):
+        if not args:
+            return "Uso: /history ORIGEN-DESTINO, por ejemplo /history BCN-EZE"
+        # Only loaded once someone asks for history
+        import history
+
+        route = args[0].upper()
+        rows = list(history.cheapest(route, by="week"))
+        if not rows:
+            return f"No hay historial para {route}."
+        lines = [f"📈 *{route}*: precio más bajo por semana de salida (últimos 30 días)\n"]
+        lines += [f"{period}: *{price:.2f}* ({outbound} ➔ {inbound}, {airline})"
+                  for period, price, outbound, inbound, airline in rows]
+        return "\n".join(lines)
+
+    def subscribe(self, chat_id, args):
+        if len(args) != 2:
+            return "Uso: /subscribe ORIGEN-DESTINO PRECIO_MAXIMO, por ejemplo /subscribe BCN-EZE 700 (* para todas las rutas)"
+        try:
+            max_price = float(args[1])
+            # Rejects nan, inf and prices of 0 or less before touching the registry
+            subscriptions.registry.subscribe(chat_id, args[0], max_price)
+        except ValueError:
+            return f"Precio inválido: {args[1]}"
+        return f"🔔 Te aviso de precios de {_route_label(args[0])} hasta {max_price:.2f} EUR."
+
+    def unsubscribe(self, chat_id, args):
+        if len(args) != 1:
+            return "Uso: /unsubscribe ORIGEN-DESTINO"
+        if subscriptions.registry.unsubscribe(chat_id, args[0]):
+            return f"🔕 Ya no te aviso de {_route_label(args[0])}."
+        return f"No estabas suscrito a {_route_label(args[0])}."
+
+    def quiet(self, chat_id, args):
+        usage = "Uso: /quiet DESDE-HASTA [zona horaria], por ejemplo /quiet 23-8 Europe/Madrid, o /quiet off"
+        if not args:
+            return usage
+        if args[0].lower() == "off":
+            subscriptions.registry.set_quiet_hours(chat_id, None, None)
+            return "🔔 Horas de silencio desactivadas."
+        try:
+            start, end = (int(hour) % 24 for hour in args[0].split("-"))
+        except ValueError:
+            return usage
+        tz = args[1] if len(args) > 1 else subscriptions.SUBSCRIPTION_TIMEZONE
+        try:
+            subscriptions.registry.set_quiet_hours(chat_id, start, end, tz)
+        except (subscriptions.ZoneInfoNotFoundError, ValueError):
+            return f"Zona horaria desconocida: {tz}"
+        return f"🌙 Sin avisos de {start:02d}:00 a {end:02d}:00 ({tz})."
+
+    def list_subscriptions(self, chat_id, args):
+        routes, quiet = subscriptions.registry.subscriptions_of(chat_id)
+        if not routes:
+            return "No tenés suscripciones. Usá /subscribe ORIGEN-DESTINO PRECIO_MAXIMO"
+        lines = [f"{_route_label(route)}: hasta *{max_price:.2f} EUR*" for route, max_price in routes]
+        if quiet and quiet[0] is not None:
+            lines.append(f"🌙 Sin avisos de {quiet[0]:02d}:00 a {quiet[1]:02d}:00 ({quiet[2]})")
+        return "\n".join(lines)
+
+    def help(self, chat_id, args):
+        return (
+            "/best - mejor precio de cada ruta\n"
+            "/route ORIGEN-DESTINO - precios más baratos de una ruta\n"
+            "/history ORIGEN-DESTINO - historial de precios por semana\n"
+            "/subscribe ORIGEN-DESTINO PRECIO_MAXIMO - avisarme de precios de una ruta\n"
+            "/unsubscribe ORIGEN-DESTINO - dejar de avisarme\n"
+            "/quiet DESDE-HASTA - horas sin avisos (/quiet off para quitarlas)\n"
+            "/subscriptions - mis suscripciones"
+        )
+
+    # Polling
+
+    def handle(self, update):
+        """Answers one update; returns the reply text, or None if it was ignored."""
+        message = update.get("message") or {}
+        text = message.get("text") or ""
+        chat_id = str(message.get("chat", {}).get("id", ""))
+        if not text.startswith("/") or not chat_id:
+            return None
+
+        name, *args = text.split()
+        # Commands addressed to the bot in a group arrive as /best@BotName
+        name = name.split("@", 1)[0].lower()
+        command = self.commands.get(name)
+        if command is None:
+            return None
+
+        start = time.perf_counter()
+        try:
+            reply = command(chat_id, args)
+        except Exception as e:
+            logging.error(f"Telegram command {name} failed: {e}")
+            reply = "⚠️ No se pudo responder, probá de nuevo en un rato."
+        COMMAND_SECONDS.observe(time.perf_counter() - start, command=name)
+        notifier.send_telegram_notification(reply, to_chat=chat_id, base_url=self.api_url, token=self.bot_token)
+        return reply
+
+    def get_updates(self):
+        """Waits up to poll_seconds for new updates and returns them."""
+        params = {"timeout": self.poll_seconds, "allowed_updates": '["message"]'}
+        if self.offset is not None:
+            params["offset"] = self.offset
+        response = self.session.get(
+            notifier.bot_url("getUpdates", self.bot_token, self.api_url),
+            params=params, timeout=self.poll_seconds + 10
+        )
+        response.raise_for_status()
+        updates = response.json().get("result", [])
+        if updates:
+            # Acknowledges them on the next call
+            self.offset = updates[-1]["update_id"] + 1
+        return updates
+
+    def poll_once(self):
+        for update in self.get_updates():
+            self.handle(update)
+
+    def run(self):
+        """Polls until stop() is called; errors are logged and retried."""
+        logging.info("Telegram command bot started")
+        while not self._stop.is_set():
+            try:
+                self.poll_once()
+            except Exception as e:
+                logging.error(f"Telegram polling failed: {e}")
+                self._stop.wait(5)
+
+    def start(self):
+        """Runs the bot on a daemon thread."""
+        thread = threading.Thread(target=self.run, name="telegram-bot", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Tests the read-only history queries against a temporary database.
+"""
+
+import os
+import sys
+import tempfile
+
+import database
+import history
+import price_history
+
+def _use_temp_database(observations):
+    original = database.DB_FILE
+    database.DB_FILE = os.path.join(tempfile.mkdtemp(prefix="history-test-"), "history.db")
+    database.init_db()
+    price_history.record_observations(observations)
+    return original
+
+def test_weeks_start_on_monday():
+    """A Monday outbound opens its week and the next Sunday closes it."""
+    print("\n📅 Testing outbound weeks from Monday to Sunday...")
+    original_db = _use_temp_database([
+        # Sunday 2026-03-08 belongs to the week before
+        ("LEVEL", "BCN-EZE", "2026-03-08", "2026-04-05", 500.0),
+        # Monday 2026-03-09 and Sunday 2026-03-15 share a week
+        ("LEVEL", "BCN-EZE", "2026-03-09", "2026-04-05", 450.0),
+        ("LEVEL", "BCN-EZE", "2026-03-15", "2026-04-05", 610.0),
+    ])
+    try:
+        weeks = [(period, price, outbound) for period, price, outbound, _, _ in history.cheapest("BCN-EZE", by="week")]
+        assert weeks == [("2026-03-02", 500.0, "2026-03-08"), ("2026-03-09", 450.0, "2026-03-09")], weeks
+        print("✅ Monday and Sunday outbounds grouped into the same week")
+    finally:
+        database.DB_FILE = original_db
+    return True
+
+def main():
+    """Main test function."""
+    print("🧪 Price History Test Suite")
+    print("=" * 50)
+    try:
+        passed = test_weeks_start_on_monday()
+    except Exception as e:
+        print(f"❌ Outbound weeks FAILED with exception: {e!r}")
+        passed = False
+    print(f"\n📊 Test Results: {int(passed)}/1 tests passed")
+    return passed
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
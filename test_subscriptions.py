@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Tests that subscriptions reach deals of the non-LEVEL providers.
+The providers parse canned responses and the registry uses a temporary
+database, so nothing is sent to an airline or to Telegram.
+"""
+
+import os
+import sys
+import tempfile
+
+import database
+from api_client import AerolineasProvider, AirEuropaProvider
+from search_plan import compile_watch, parse_search_plan
+from subscriptions import SubscriptionRegistry
+
+CHAT_ID = "4242"
+THRESHOLD = 500
+MAX_PRICE = 900
+
+def _watch(watch_type, destination):
+    plan = parse_search_plan({"watch": [{
+        "name": f"{watch_type}-test", "type": watch_type, "origin": "MAD", "destination": destination,
+        "start_date": "2026-03-10", "end_date": "2026-04-15", "min_duration_days": 20,
+        "max_duration_days": 30, "threshold_eur": THRESHOLD
+    }]})
+    return plan.enabled_watches[0]
+
+def _registry(route):
+    database.DB_FILE = os.path.join(tempfile.mkdtemp(prefix="subscriptions-test-"), "subscriptions.db")
+    database.init_db()
+    registry = SubscriptionRegistry()
+    registry.subscribe(CHAT_ID, route, MAX_PRICE)
+    return registry
+
+def test_aerolineas_above_threshold():
+    """An AR price above the threshold still reaches a subscriber whose max price covers it."""
+    print("\n🇦🇷 Testing AR deal above the watch threshold...")
+    original_db = database.DB_FILE
+    try:
+        watch = _watch("aerolineas_argentinas", "COR")
+        query = compile_watch(watch)[0]
+        # Outbound 2026-03-10 at 400, cheapest return in the window at 250
+        responses = {query: (
+            [("2026-03-10", 400.0)],
+            [("2026-04-01", 300.0), ("2026-04-03", 250.0), ("2026-05-30", 10.0)]
+        )}
+        deals = AerolineasProvider().parse(watch, responses)
+        assert [(deal.return_date, deal.price) for deal in deals] == [("2026-04-03", 650.0)], deals
+        print("✅ Cheapest pair kept although above the threshold")
+
+        registry = _registry("MAD-COR")
+        assert registry.recipients(deals[0], alert=deals[0].price < THRESHOLD) == {CHAT_ID}
+        print("✅ Subscriber with a higher max price notified")
+    finally:
+        database.DB_FILE = original_db
+    return True
+
+def test_aireuropa_above_threshold():
+    """An AirEuropa price above the threshold still reaches a subscriber whose max price covers it."""
+    print("\n🇪🇸 Testing AirEuropa deal above the watch threshold...")
+    original_db = database.DB_FILE
+    try:
+        watch = _watch("aireuropa", "EZE")
+        query = compile_watch(watch)[0]
+        # Prices in centavos; only the searched dates count
+        responses = {query: [
+            ("2026-03-10", "2026-04-09", 90000),
+            ("2026-03-10", "2026-04-09", 80000),
+            ("2026-03-11", "2026-04-09", 10000)
+        ]}
+        deals = AirEuropaProvider().parse(watch, responses)
+        assert [(deal.return_date, deal.price) for deal in deals] == [("2026-04-09", 800.0)], deals
+        print("✅ Cheapest entry kept although above the threshold")
+
+        registry = _registry("MAD-EZE")
+        assert registry.recipients(deals[0], alert=deals[0].price < THRESHOLD) == {CHAT_ID}
+        print("✅ Subscriber with a higher max price notified")
+    finally:
+        database.DB_FILE = original_db
+    return True
+
+def main():
+    """Main test function."""
+    print("🧪 Subscription Matching Test Suite")
+    print("=" * 50)
+
+    tests = [
+        ("Aerolíneas Above Threshold", test_aerolineas_above_threshold),
+        ("AirEuropa Above Threshold", test_aireuropa_above_threshold),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+                print(f"✅ {test_name} PASSED")
+            else:
+                print(f"❌ {test_name} FAILED")
+        except Exception as e:
+            print(f"❌ {test_name} FAILED with exception: {e!r}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
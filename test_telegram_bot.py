@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests the Telegram command bot against a local fake Bot API.
+The fake server answers getUpdates from a queue of updates and records every
+sendMessage, so no message reaches Telegram.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import database
+import price_history
+import snapshot
+from deals import Deal
+from telegram_bot import CommandBot
+
+BOT_TOKEN = "123:fake"
+CHAT_ID = 4242
+
+class FakeTelegramServer:
+    """Local Bot API serving queued updates and recording sent messages."""
+
+    def __init__(self):
+        self.updates = []
+        self.offsets = []
+        self.sent = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def queue_command(self, text):
+        update_id = 100 + len(self.updates)
+        self.updates.append({"update_id": update_id, "message": {"chat": {"id": CHAT_ID}, "text": text}})
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != f"/bot{BOT_TOKEN}/getUpdates":
+                    return self._reply(404, {"ok": False})
+                offset = int(parse_qs(url.query).get("offset", ["0"])[0])
+                fake.offsets.append(offset)
+                # Like the Bot API: updates below the offset are acknowledged
+                self._reply(200, {"ok": True, "result": [update for update in fake.updates if update["update_id"] >= offset]})
+
+            def do_POST(self):
+                if self.path != f"/bot{BOT_TOKEN}/sendMessage":
+                    return self._reply(404, {"ok": False})
+                fake.sent.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+                self._reply(200, {"ok": True, "result": {}})
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def _publish_deals():
+    snapshot.publish([
+        Deal("one_way", "2026-03-10", None, 120.0, "EUR", "MAD", "COR", 700),
+        Deal("one_way", "2026-03-11", None, 95.5, "EUR", "MAD", "COR", 700),
+        Deal("round_trip", "2026-03-01", "2026-03-20", 610.0, "EUR", "BCN", "EZE", 700),
+    ])
+
+def _use_temp_database():
+    original = database.DB_FILE
+    database.DB_FILE = os.path.join(tempfile.mkdtemp(prefix="bot-test-"), "bot.db")
+    database.init_db()
+    price_history.record_observations([("LEVEL", "BCN-EZE", "2026-03-02", "2026-03-20", 580.0)])
+    return original
+
+def test_commands_and_offset():
+    """/best, /route and /history replies, and the offset acknowledging them."""
+    print("\n🤖 Testing commands against a fake Bot API...")
+    _publish_deals()
+    original_db = _use_temp_database()
+    try:
+        with FakeTelegramServer() as fake:
+            bot = CommandBot(api_url=fake.url, bot_token=BOT_TOKEN, poll_seconds=0)
+            for text in ("/best", "/route mad-cor", "/history BCN-EZE", "hello"):
+                fake.queue_command(text)
+
+            bot.poll_once()
+            replies = [message["text"] for message in fake.sent]
+            assert all(message["chat_id"] == str(CHAT_ID) for message in fake.sent)
+            assert len(replies) == 3, replies
+            best, route, history = replies
+            assert "MAD ➔ COR" in best and "95.50" in best and "BCN ➔ EZE" in best
+            assert route.index("95.50") < route.index("120.00")
+            assert "BCN-EZE" in history and "580.00" in history
+            print("✅ /best, /route and /history answered")
+
+            assert fake.offsets == [0]
+            assert bot.offset == 104
+            bot.poll_once()
+            assert fake.offsets == [0, 104]
+            assert len(fake.sent) == 3
+            print("✅ Answered updates acknowledged with the next offset")
+    finally:
+        database.DB_FILE = original_db
+    return True
+
+def main():
+    """Main test function."""
+    print("🧪 Telegram Command Bot Test Suite")
+    print("=" * 50)
+    try:
+        passed = test_commands_and_offset()
+    except Exception as e:
+        print(f"❌ Telegram commands FAILED with exception: {e!r}")
+        passed = False
+    print(f"\n📊 Test Results: {int(passed)}/1 tests passed")
+    return passed
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Tests the HTTP token provider against a local stub server.
+No airline site is contacted and no browser is started.
+"""
+
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from token_providers import (
+    AR_TOKEN, AIR_EUROPA_AUTH, AIR_EUROPA_D_TOKEN,
+    HttpTokenProvider, ChainedTokenProvider, TokenProvider
+)
+
+# Public client id of the Aerolíneas web app, the one the provider defaults to
+AR_WEB_CLIENT_ID = "oy81ZUn6IX1gv4eGceSFIyaFfhH6a6G"
+
+class StubTokenServer:
+    """
+    Local server playing the AR token endpoint (POST /oauth/token) and the
+    AirEuropa search page (GET /es/vuelos). Records every request it gets;
+    only the web app's client id and "stub-secret" get an AR token.
+    """
+
+    def __init__(self, aireuropa_headers=None, aireuropa_cookies=None):
+        self.aireuropa_headers = aireuropa_headers or {}
+        self.aireuropa_cookies = aireuropa_cookies or {}
+        self.requests = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                stub.requests.append(("POST", self.path, body))
+                if (self.path != "/oauth/token" or body.get("client_id") != AR_WEB_CLIENT_ID
+                        or body.get("client_secret") != "stub-secret"):
+                    self.send_response(401)
+                    self.end_headers()
+                    return
+                payload = json.dumps({"access_token": "stub-ar-token", "token_type": "Bearer"}).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                stub.requests.append(("GET", self.path, None))
+                self.send_response(200 if self.path == "/es/vuelos" else 404)
+                for name, value in stub.aireuropa_headers.items():
+                    self.send_header(name, value)
+                for name, value in stub.aireuropa_cookies.items():
+                    self.send_header("Set-Cookie", f"{name}={value}; Path=/")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+        return Handler
+
+    def provider(self, client_secret="stub-secret"):
+        return HttpTokenProvider(
+            ar_token_url=f"{self.url}/oauth/token", aireuropa_token_url=f"{self.url}/es/vuelos",
+            client_secret=client_secret, timeout=5
+        )
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def test_ar_client_credentials():
+    """The AR token comes from a client-credentials grant with the web app's client id."""
+    print("\n🔑 Testing AR client-credentials grant...")
+    with StubTokenServer() as stub:
+        assert stub.provider().fetch_ar_token() == "stub-ar-token"
+        method, path, body = stub.requests[0]
+        assert (method, path) == ("POST", "/oauth/token")
+        assert body["grant_type"] == "client_credentials"
+        print("✅ AR token fetched over HTTP")
+
+        assert stub.provider(client_secret="wrong").fetch_ar_token() is None
+        print("✅ Rejected grant returns no token")
+    return True
+
+def test_ar_without_secret():
+    """Without AR_CLIENT_SECRET the provider skips AR and sends nothing."""
+    print("\n🚫 Testing AR without a client secret...")
+    with StubTokenServer() as stub:
+        assert stub.provider(client_secret=None).fetch_ar_token() is None
+        assert stub.requests == []
+        print("✅ No request sent without a secret")
+    return True
+
+def test_aireuropa_tokens():
+    """AirEuropa tokens are read from the page's headers, then from its cookies."""
+    print("\n🌍 Testing AirEuropa tokens from headers and cookies...")
+    with StubTokenServer(aireuropa_headers={"Authorization": "Bearer stub-auth", "X-D-Token": "stub-d"}) as stub:
+        assert stub.provider().fetch_aireuropa_tokens() == {AIR_EUROPA_AUTH: "stub-auth", AIR_EUROPA_D_TOKEN: "stub-d"}
+        print("✅ Tokens read from response headers")
+
+    with StubTokenServer(aireuropa_cookies={"x-d-token": "cookie-d"}) as stub:
+        assert stub.provider().fetch_aireuropa_tokens() == {AIR_EUROPA_D_TOKEN: "cookie-d"}
+        print("✅ Tokens read from cookies")
+
+    with StubTokenServer() as stub:
+        assert stub.provider().fetch_aireuropa_tokens() == {}
+        print("✅ Page without tokens returns nothing")
+    return True
+
+def test_chain_falls_back_for_missing_airlines():
+    """The next provider is only asked for the airlines HTTP could not serve."""
+    print("\n⛓️ Testing provider chain fallback...")
+
+    class FallbackProvider(TokenProvider):
+        name = "fallback"
+
+        def __init__(self):
+            self.asked = None
+
+        def fetch_tokens(self, airlines=("ar", "aireuropa")):
+            self.asked = airlines
+            return {AR_TOKEN: "fallback-ar-token"}
+
+    with StubTokenServer(aireuropa_headers={"X-D-Token": "stub-d"}) as stub:
+        fallback = FallbackProvider()
+        tokens = ChainedTokenProvider([stub.provider(client_secret=None), fallback]).fetch_tokens()
+        assert fallback.asked == ("ar",)
+        assert tokens == {AR_TOKEN: "fallback-ar-token", AIR_EUROPA_D_TOKEN: "stub-d"}
+        print("✅ Only AR fell through to the fallback provider")
+    return True
+
+def main():
+    """Main test function."""
+    print("🧪 Token Provider Test Suite")
+    print("=" * 50)
+
+    tests = [
+        ("AR Client Credentials", test_ar_client_credentials),
+        ("AR Without Secret", test_ar_without_secret),
+        ("AirEuropa Tokens", test_aireuropa_tokens),
+        ("Chain Fallback", test_chain_falls_back_for_missing_airlines),
+    ]
+
+    passed = 0
+    for test_name, test_func in tests:
+        try:
+            if test_func():
+                passed += 1
+                print(f"✅ {test_name} PASSED")
+            else:
+                print(f"❌ {test_name} FAILED")
+        except Exception as e:
+            print(f"❌ {test_name} FAILED with exception: {e!r}")
+
+    print(f"\n📊 Test Results: {passed}/{len(tests)} tests passed")
+    return passed == len(tests)
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
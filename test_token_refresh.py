@@ -4,35 +4,31 @@ Test script for the token refresh system.
 Tests all components of the automatic token refresh functionality.
 """
 
+import importlib.util
 import sys
 import time
 import logging
 from datetime import datetime
 
 def test_imports():
-    """Test that all required modules can be imported."""
+    """Test that all required modules are installed, without importing them."""
     print("🧪 Testing imports...")
     
-    try:
-        import selenium
-        print("✅ Selenium imported successfully")
-    except ImportError as e:
-        print(f"❌ Failed to import Selenium: {e}")
-        return False
-    
-    try:
-        from selenium import webdriver
-        print("✅ WebDriver imported successfully")
-    except ImportError as e:
-        print(f"❌ Failed to import WebDriver: {e}")
-        return False
-    
-    try:
-        from webdriver_manager.chrome import ChromeDriverManager
-        print("✅ ChromeDriverManager imported successfully")
-    except ImportError as e:
-        print(f"❌ Failed to import ChromeDriverManager: {e}")
-        return False
+    # find_spec only locates the module (and imports parent packages), so
+    # this check doesn't pay for loading Selenium itself
+    for module, label in (
+        ("selenium", "Selenium"),
+        ("selenium.webdriver", "WebDriver"),
+        ("webdriver_manager.chrome", "ChromeDriverManager"),
+    ):
+        try:
+            found = importlib.util.find_spec(module) is not None
+        except ImportError:
+            found = False
+        if not found:
+            print(f"❌ {label} is not installed ({module})")
+            return False
+        print(f"✅ {label} is installed")
     
     return True
 
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Event-driven token capture for the browser based refresh scripts.
+Consumes Chrome's CDP Network.requestWillBeSent events and returns as soon as
+the wanted headers show up, instead of sleeping a fixed time per page.
+"""
+
+import json
+import logging
+import time
+
+# Overall deadline for a single capture, in seconds
+DEFAULT_CAPTURE_TIMEOUT = 30
+
+# How often the performance log is drained while waiting, in seconds
+POLL_INTERVAL = 0.25
+
+# Event name as it appears in the raw CDP message, quotes included so that
+# Network.requestWillBeSentExtraInfo entries are skipped too
+REQUEST_EVENT_MARKER = '"Network.requestWillBeSent"'
+
+# Hosts and headers carrying the tokens we care about
+AR_API_HOST = "api.aerolineas.com.ar"
+AR_TOKEN_HEADERS = ("authorization",)
+AIR_EUROPA_API_HOST = "aireuropa.com"
+AIR_EUROPA_TOKEN_HEADERS = ("authorization", "x-d-token")
+
+def enable_network_events(driver):
+    """
+    Makes sure the Network domain is enabled so requestWillBeSent events
+    are emitted to the performance log.
+    """
+    try:
+        driver.execute_cdp_cmd('Network.enable', {})
+    except Exception as e:
+        logging.debug(f"Could not enable CDP network events: {e}")
+
+def iter_request_events(log_entries, hosts=None):
+    """
+    Yields (url, headers) for every Network.requestWillBeSent entry in
+    log_entries, decoding them lazily. Header names are lower-cased.
+
+    Raw messages are pre-filtered with cheap substring checks on the event name
+    and hosts, so the bulk of irrelevant CDP traffic is never JSON-decoded.
+    """
+    for log in log_entries:
+        raw = log.get('message', '')
+        if REQUEST_EVENT_MARKER not in raw:
+            continue
+        if hosts and not any(host in raw for host in hosts):
+            continue
+        try:
+            request = json.loads(raw)['message']['params']['request']
+            url = request['url']
+            if hosts and not any(host in url for host in hosts):
+                continue
+            headers = {name.lower(): value for name, value in request.get('headers', {}).items()}
+            yield url, headers
+        except (json.JSONDecodeError, KeyError, TypeError):
+            continue
+
+def tokens_complete(captured, targets):
+    """Returns True once every header of every target host has been captured."""
+    return all(len(captured.get(host, {})) == len(names) for host, names in targets.items())
+
+def extract_tokens(log_entries, targets, captured=None):
+    """
+    Scans log entries for the headers listed in targets.
+
+    Args:
+        log_entries: Iterable of performance log entries (consumed lazily).
+        targets: Dict of host substring -> tuple of lower-case header names.
+        captured: Optional result of a previous call to keep filling in.
+
+    Returns:
+        A dict of host -> {header name: value}. Scanning stops as soon as every
+        target header has been found.
+    """
+    if captured is None:
+        captured = {host: {} for host in targets}
+
+    if tokens_complete(captured, targets):
+        return captured
+
+    for url, headers in iter_request_events(log_entries, targets):
+        for host, names in targets.items():
+            if host not in url:
+                continue
+            found = captured.setdefault(host, {})
+            for name in names:
+                if name not in found and headers.get(name):
+                    found[name] = headers[name]
+        if tokens_complete(captured, targets):
+            break
+
+    return captured
+
+def wait_for_tokens(driver, targets, timeout=DEFAULT_CAPTURE_TIMEOUT, actions=None):
+    """
+    Waits until every header in targets has been seen on a matching request.
+
+    Args:
+        driver: Chrome WebDriver with performance logging enabled.
+        targets: Dict of host substring -> tuple of lower-case header names.
+        timeout: Overall deadline in seconds.
+        actions: Optional iterator of page interactions. One step is advanced
+            per poll until the headers are found or it is exhausted.
+
+    Returns:
+        A dict of host -> captured headers (possibly partial on timeout).
+
+    Raises:
+        Whatever an action raises (e.g. a WebDriverWait TimeoutException),
+        unless every header had been captured by then.
+    """
+    captured = {host: {} for host in targets}
+    deadline = time.monotonic() + timeout
+
+    while True:
+        # Draining every poll keeps each batch, and so memory use, small
+        extract_tokens(driver.get_log('performance'), targets, captured)
+        if tokens_complete(captured, targets):
+            return captured
+
+        if time.monotonic() >= deadline:
+            logging.warning(f"Timed out after {timeout}s waiting for tokens on {', '.join(targets)}")
+            return captured
+
+        if actions is not None:
+            try:
+                next(actions)
+                continue
+            except StopIteration:
+                actions = None
+            except Exception:
+                # Requests the page sent before the failure still count
+                extract_tokens(driver.get_log('performance'), targets, captured)
+                if tokens_complete(captured, targets):
+                    return captured
+                raise
+
+        time.sleep(POLL_INTERVAL)
+
+def wait_for_headers(driver, host, header_names, timeout=DEFAULT_CAPTURE_TIMEOUT, actions=None):
+    """
+    Waits until every header in header_names has been seen on a request to host.
+
+    Returns:
+        A dict with the headers captured before the deadline (possibly partial).
+        Exceptions from actions propagate, as in wait_for_tokens().
+    """
+    return wait_for_tokens(driver, {host: header_names}, timeout, actions)[host]
+
+def strip_bearer(value):
+    """Returns the raw token from an 'authorization' header value."""
+    if value and value.startswith('Bearer '):
+        return value[len('Bearer '):]
+    return value
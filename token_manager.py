@@ -5,8 +5,6 @@ Uses browser automation to refresh tokens when they expire.
 """
 
 import logging
-import time
-import json
 import os
 from datetime import datetime, timedelta
 from selenium import webdriver
@@ -15,18 +13,23 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from log_setup import configure_logging
+from token_capture import (
+    enable_network_events, wait_for_headers, strip_bearer,
+    AR_API_HOST, AR_TOKEN_HEADERS, AIR_EUROPA_API_HOST, AIR_EUROPA_TOKEN_HEADERS
+)
 
 class TokenManager:
     def __init__(self):
         self.driver = None
+        self.ar_token = None
+        self.aireuropa_auth = None
+        self.aireuropa_d_token = None
         self.setup_logging()
     
     def setup_logging(self):
         """Setup logging for token manager."""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s'
-        )
+        configure_logging()
     
     def setup_driver(self):
         """Setup Chrome driver with headless options."""
@@ -38,6 +41,9 @@ class TokenManager:
         chrome_options.add_argument("--window-size=1920,1080")
         chrome_options.add_argument("--user-agent=Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36")
         
+        # Enable performance logging to receive network events
+        chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+        
         try:
             self.driver = webdriver.Chrome(options=chrome_options)
             logging.info("Chrome driver initialized successfully")
@@ -46,6 +52,44 @@ class TokenManager:
             logging.error(f"Failed to initialize Chrome driver: {e}")
             return False
     
+    def submit_search_form(self):
+        """
+        Fills the MAD ➔ COR search form and submits it, one step at a time.
+        Yields after each step so capture can stop as soon as tokens appear.
+        """
+        # Origin field
+        origin_field = WebDriverWait(self.driver, 10).until(
+            EC.element_to_be_clickable((By.CSS_SELECTOR, "input[placeholder*='Origen']"))
+        )
+        origin_field.clear()
+        origin_field.send_keys("MAD")
+        yield
+        
+        # Destination field
+        dest_field = self.driver.find_element(By.CSS_SELECTOR, "input[placeholder*='Destino']")
+        dest_field.clear()
+        dest_field.send_keys("COR")
+        yield
+        
+        # Search button
+        search_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
+        search_btn.click()
+        yield
+    
+    def open_search_page(self, home_url, search_url):
+        """Loads the airline home page and then its flight search page."""
+        enable_network_events(self.driver)
+        self.driver.get(home_url)
+        
+        # Wait for page to load
+        WebDriverWait(self.driver, 10).until(
+            EC.presence_of_element_located((By.TAG_NAME, "body"))
+        )
+        
+        # Drop landing page events, then navigate to flight search
+        self.driver.get_log('performance')
+        self.driver.get(search_url)
+    
     def refresh_ar_token(self):
         """
         Automatically refresh Aerolíneas Argentinas token.
@@ -53,62 +97,29 @@ class TokenManager:
         logging.info("Starting AR token refresh...")
         
         try:
-            # Navigate to AR website
-            self.driver.get("https://www.aerolineas.com.ar")
-            time.sleep(3)
-            
-            # Wait for page to load
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            self.open_search_page(
+                "https://www.aerolineas.com.ar",
+                "https://www.aerolineas.com.ar/es-ar/vuelos/buscar"
             )
             
             # Search for a flight to trigger API calls
             logging.info("Searching for a flight to capture new token...")
+            captured = wait_for_headers(
+                self.driver, AR_API_HOST, AR_TOKEN_HEADERS,
+                actions=self.submit_search_form()
+            )
             
-            # Navigate to flight search
-            self.driver.get("https://www.aerolineas.com.ar/es-ar/vuelos/buscar")
-            time.sleep(3)
-            
-            # Fill in search form
-            try:
-                # Origin field
-                origin_field = WebDriverWait(self.driver, 10).until(
-                    EC.element_to_be_clickable((By.CSS_SELECTOR, "input[placeholder*='Origen']"))
-                )
-                origin_field.clear()
-                origin_field.send_keys("MAD")
-                time.sleep(1)
-                
-                # Destination field
-                dest_field = self.driver.find_element(By.CSS_SELECTOR, "input[placeholder*='Destino']")
-                dest_field.clear()
-                dest_field.send_keys("COR")
-                time.sleep(1)
-                
-                # Search button
-                search_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-                search_btn.click()
-                
-                # Wait for results
-                time.sleep(5)
-                
-                # Get network logs to find the token
-                logs = self.driver.get_log('performance')
-                
-                for log in logs:
-                    if 'authorization' in str(log).lower():
-                        # Extract token from network request
-                        # This is a simplified approach - in practice you'd need to parse the actual network traffic
-                        logging.info("Found authorization header in network logs")
-                        break
-                
-                logging.info("AR token refresh completed")
-                return True
-                
-            except TimeoutException:
-                logging.error("Timeout waiting for AR search form")
+            if not captured.get('authorization'):
+                logging.error("No authorization header found in network events")
                 return False
+            
+            self.ar_token = strip_bearer(captured['authorization'])
+            logging.info("AR token refresh completed")
+            return True
                 
+        except TimeoutException:
+            logging.error("Timeout waiting for AR search form")
+            return False
         except Exception as e:
             logging.error(f"Error refreshing AR token: {e}")
             return False
@@ -120,49 +131,28 @@ class TokenManager:
         logging.info("Starting AirEuropa token refresh...")
         
         try:
-            # Navigate to AirEuropa website
-            self.driver.get("https://digital.aireuropa.com")
-            time.sleep(3)
-            
-            # Wait for page to load
-            WebDriverWait(self.driver, 10).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
+            self.open_search_page(
+                "https://digital.aireuropa.com",
+                "https://digital.aireuropa.com/es/vuelos"
             )
             
-            # Navigate to flight search
-            self.driver.get("https://digital.aireuropa.com/es/vuelos")
-            time.sleep(3)
+            captured = wait_for_headers(
+                self.driver, AIR_EUROPA_API_HOST, AIR_EUROPA_TOKEN_HEADERS,
+                actions=self.submit_search_form()
+            )
             
-            # Fill in search form
-            try:
-                # Origin field
-                origin_field = WebDriverWait(self.driver, 10).until(
-                    EC.element_to_be_clickable((By.CSS_SELECTOR, "input[placeholder*='Origen']"))
-                )
-                origin_field.clear()
-                origin_field.send_keys("MAD")
-                time.sleep(1)
-                
-                # Destination field
-                dest_field = self.driver.find_element(By.CSS_SELECTOR, "input[placeholder*='Destino']")
-                dest_field.clear()
-                dest_field.send_keys("COR")
-                time.sleep(1)
-                
-                # Search button
-                search_btn = self.driver.find_element(By.CSS_SELECTOR, "button[type='submit']")
-                search_btn.click()
-                
-                # Wait for results
-                time.sleep(5)
-                
-                logging.info("AirEuropa token refresh completed")
-                return True
-                
-            except TimeoutException:
-                logging.error("Timeout waiting for AirEuropa search form")
+            if not captured:
+                logging.error("No AirEuropa tokens found in network events")
                 return False
+            
+            self.aireuropa_auth = strip_bearer(captured.get('authorization'))
+            self.aireuropa_d_token = captured.get('x-d-token')
+            logging.info("AirEuropa token refresh completed")
+            return True
                 
+        except TimeoutException:
+            logging.error("Timeout waiting for AirEuropa search form")
+            return False
         except Exception as e:
             logging.error(f"Error refreshing AirEuropa token: {e}")
             return False
@@ -224,7 +214,11 @@ class TokenManager:
             
             if ar_success or ae_success:
                 logging.info("Token refresh completed successfully")
-                return True
+                return self.update_tokens_in_file(
+                    ar_token=self.ar_token,
+                    aireuropa_auth=self.aireuropa_auth,
+                    aireuropa_d_token=self.aireuropa_d_token
+                )
             else:
                 logging.error("Failed to refresh any tokens")
                 return False
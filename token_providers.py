@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Pluggable token providers for the airline APIs.
+The HTTP provider fetches tokens with plain requests, without a browser, but
+only where that is possible with what is configured:
+
+- Aerolíneas Argentinas: an Auth0 client-credentials grant, which needs
+  AR_CLIENT_SECRET. There is no anonymous HTTP path; without the secret the
+  provider skips AR.
+- AirEuropa: the tokens are read from the headers or cookies of the search
+  page, if the site hands them out there. When it does not, nothing is
+  returned.
+
+Whatever the HTTP provider cannot get falls through to Selenium.
+"""
+
+import os
+import logging
+import requests
+
+# Keys used for the tokens in every provider result
+AR_TOKEN = "ar_token"
+AIR_EUROPA_AUTH = "aireuropa_auth"
+AIR_EUROPA_D_TOKEN = "aireuropa_d_token"
+
+# Aerolíneas Argentinas issues its API tokens through Auth0 client credentials
+AR_TOKEN_URL = os.getenv("AR_TOKEN_URL", "https://aerolineas-test.auth0.com/oauth/token")
+AR_CLIENT_ID = os.getenv("AR_CLIENT_ID", "oy81ZUn6IX1gv4eGceSFIyaFfhH6a6G")
+AR_CLIENT_SECRET = os.getenv("AR_CLIENT_SECRET")
+AR_AUDIENCE = "ar-auth"
+AR_SCOPE = "catalog:read catalog:admin rules:payment:read rules:shopping:read rules:checkout:read loyalty:read"
+
+# Search page checked for AirEuropa tokens in its headers and cookies
+AIR_EUROPA_TOKEN_URL = os.getenv("AIR_EUROPA_TOKEN_URL", "https://digital.aireuropa.com/es/vuelos")
+
+USER_AGENT = "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/137.0.0.0 Safari/537.36"
+
+class TokenProvider:
+    """
+    Base class for token providers.
+    Subclasses return a dict with any of AR_TOKEN, AIR_EUROPA_AUTH and
+    AIR_EUROPA_D_TOKEN they managed to obtain.
+    """
+    name = "base"
+
+    def fetch_tokens(self, airlines=("ar", "aireuropa")):
+        raise NotImplementedError
+
+class HttpTokenProvider(TokenProvider):
+    """Fetches tokens with plain HTTP requests, without launching a browser."""
+    name = "http"
+
+    def __init__(self, ar_token_url=AR_TOKEN_URL, aireuropa_token_url=AIR_EUROPA_TOKEN_URL,
+                 client_id=AR_CLIENT_ID, client_secret=AR_CLIENT_SECRET, session=None, timeout=10):
+        self.ar_token_url = ar_token_url
+        self.aireuropa_token_url = aireuropa_token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.session = session or requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        self.timeout = timeout
+
+    def fetch_ar_token(self):
+        """
+        Requests a new AR access token with the configured client secret.
+        Returns None without a secret or if the grant fails.
+        """
+        if not self.client_secret:
+            logging.info("AR_CLIENT_SECRET not configured. Skipping HTTP AR token refresh.")
+            return None
+
+        payload = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "audience": AR_AUDIENCE,
+            "grant_type": "client_credentials",
+            "scope": AR_SCOPE
+        }
+
+        try:
+            response = self.session.post(self.ar_token_url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            token = response.json().get("access_token")
+            if token:
+                logging.info("✅ Got AR token over HTTP")
+            return token
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"HTTP AR token refresh failed: {e}")
+        except ValueError as e:
+            logging.warning(f"Could not parse AR token response: {e}")
+        return None
+
+    def fetch_aireuropa_tokens(self):
+        """
+        Reads the AirEuropa tokens from the search page's response headers or
+        cookies. Returns {} if the page does not carry them.
+        """
+        tokens = {}
+
+        try:
+            response = self.session.get(self.aireuropa_token_url, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            logging.warning(f"HTTP AirEuropa token refresh failed: {e}")
+            return tokens
+
+        auth = response.headers.get('authorization') or self.session.cookies.get('authorization')
+        d_token = response.headers.get('x-d-token') or self.session.cookies.get('x-d-token')
+
+        if auth:
+            tokens[AIR_EUROPA_AUTH] = auth[len('Bearer '):] if auth.startswith('Bearer ') else auth
+        if d_token:
+            tokens[AIR_EUROPA_D_TOKEN] = d_token
+        if tokens:
+            logging.info("✅ Got AirEuropa tokens over HTTP")
+        return tokens
+
+    def fetch_tokens(self, airlines=("ar", "aireuropa")):
+        tokens = {}
+        if "ar" in airlines:
+            ar_token = self.fetch_ar_token()
+            if ar_token:
+                tokens[AR_TOKEN] = ar_token
+        if "aireuropa" in airlines:
+            tokens.update(self.fetch_aireuropa_tokens())
+        return tokens
+
+class SeleniumTokenProvider(TokenProvider):
+    """Captures tokens by driving a headless Chrome. Slow, used as a fallback."""
+    name = "selenium"
+
+    def fetch_tokens(self, airlines=("ar", "aireuropa")):
+        # Imported lazily so the HTTP path never pulls in Selenium
+        from smart_token_refresh import SmartTokenRefresh
+
+        refresh = SmartTokenRefresh()
+        if not refresh.setup_driver():
+            return {}
+
+        try:
+            if "ar" in airlines:
+                refresh.capture_ar_token()
+            if "aireuropa" in airlines:
+                refresh.capture_aireuropa_tokens()
+        finally:
+            refresh.driver.quit()
+            logging.info("🔒 Browser driver closed")
+
+        tokens = {
+            AR_TOKEN: refresh.ar_token,
+            AIR_EUROPA_AUTH: refresh.aireuropa_auth,
+            AIR_EUROPA_D_TOKEN: refresh.aireuropa_d_token
+        }
+        return {key: value for key, value in tokens.items() if value}
+
+class ChainedTokenProvider(TokenProvider):
+    """
+    Tries each provider in order and only asks the next one for the
+    airlines that are still missing tokens.
+    """
+    name = "chain"
+
+    def __init__(self, providers):
+        self.providers = providers
+
+    def fetch_tokens(self, airlines=("ar", "aireuropa")):
+        tokens = {}
+        missing = list(airlines)
+
+        for provider in self.providers:
+            if not missing:
+                break
+            logging.info(f"Fetching {', '.join(missing)} tokens with {provider.name} provider...")
+            try:
+                tokens.update(provider.fetch_tokens(tuple(missing)))
+            except Exception as e:
+                logging.error(f"Token provider {provider.name} failed: {e}")
+            missing = [airline for airline in missing if not has_tokens(tokens, airline)]
+
+        return tokens
+
+def has_tokens(tokens, airline):
+    """Returns True if tokens contains what the given airline needs."""
+    if airline == "ar":
+        return bool(tokens.get(AR_TOKEN))
+    return bool(tokens.get(AIR_EUROPA_AUTH) or tokens.get(AIR_EUROPA_D_TOKEN))
+
+def default_token_provider():
+    """HTTP first, Selenium only for whatever HTTP could not provide."""
+    return ChainedTokenProvider([HttpTokenProvider(), SeleniumTokenProvider()])
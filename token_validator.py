@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Token validity checks without extra remote calls.
+JWT tokens are checked locally against their expiry. Opaque tokens are trusted
+until a production request comes back with 401 Unauthorized. That verdict is
+kept in TOKEN_STATUS_FILE (a hash of the token, never the token itself), so
+the refresh scripts see a 401 that the worker got in another process.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from config import TOKEN_STATUS_TTL_SECONDS, TOKEN_STATUS_FILE
+from metrics import CACHE_LOOKUPS
+
+def decode_jwt_token(token):
+    """
+    Decodes a JWT token to extract its payload.
+    Note: This doesn't verify the signature, just decodes the payload.
+    """
+    try:
+        # Split the token into parts
+        parts = token.split('.')
+        if len(parts) != 3:
+            return None
+
+        # Decode the payload (second part)
+        payload = parts[1]
+        # Add padding if needed
+        payload += '=' * (4 - len(payload) % 4)
+        decoded = base64.urlsafe_b64decode(payload)
+        return json.loads(decoded)
+    except Exception as e:
+        logging.error(f"Error decoding JWT token: {e}")
+        return None
+
+def is_token_expired(token):
+    """
+    Checks if the JWT token is expired.
+    """
+    payload = decode_jwt_token(token)
+    if not payload:
+        return True
+
+    # Get expiration time
+    exp_timestamp = payload.get('exp')
+    if not exp_timestamp:
+        return True
+
+    # Convert to datetime
+    exp_datetime = datetime.fromtimestamp(exp_timestamp)
+    current_datetime = datetime.now()
+
+    # Add 5 minutes buffer to refresh before actual expiration
+    buffer_time = timedelta(minutes=5)
+
+    return current_datetime + buffer_time >= exp_datetime
+
+def is_jwt(token):
+    """Returns True if the token looks like a JWT (three dot-separated parts)."""
+    return bool(token) and token.count('.') == 2
+
+def token_fingerprint(token):
+    """Short hash identifying a token in the status file."""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+class TokenValidator:
+    """
+    Caches a validity verdict per airline for a short TTL.
+    A 401 seen on a real request invalidates that exact token until it changes,
+    in this process and, through status_file, in every other one.
+    """
+
+    def __init__(self, ttl=TOKEN_STATUS_TTL_SECONDS, clock=time.monotonic, status_file=TOKEN_STATUS_FILE):
+        self.ttl = ttl
+        self.clock = clock
+        self.status_file = status_file
+        self._verdicts = {}
+        # airline -> fingerprint of the token rejected with 401
+        self._rejected = {}
+
+    def _load_rejected(self):
+        """Reads the 401 verdicts recorded by any process."""
+        try:
+            with open(self.status_file, 'r') as file:
+                self._rejected = dict(json.load(file).get("rejected", {}))
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    def _save_rejected(self):
+        """Writes the 401 verdicts to disk atomically."""
+        tmp_file = f"{self.status_file}.tmp"
+        try:
+            with open(tmp_file, 'w') as file:
+                json.dump({"rejected": self._rejected}, file)
+            os.replace(tmp_file, self.status_file)
+        except OSError as e:
+            logging.error(f"Failed to save token status: {e}")
+
+    def is_valid(self, airline, token):
+        """Returns the cached verdict for token, computing it locally if stale."""
+        if not token:
+            return False
+
+        cached = self._verdicts.get(airline)
+        if cached and cached[0] == token and self.clock() - cached[2] < self.ttl:
+            CACHE_LOOKUPS.inc(cache="token_status", result="hit")
+            return cached[1]
+
+        CACHE_LOOKUPS.inc(cache="token_status", result="miss")
+
+        # Another process may have seen a 401 since the last check
+        self._load_rejected()
+        if self._rejected.get(airline) == token_fingerprint(token):
+            valid = False
+        else:
+            valid = not is_token_expired(token) if is_jwt(token) else True
+        self._verdicts[airline] = (token, valid, self.clock())
+        return valid
+
+    def report_unauthorized(self, airline, token):
+        """Records a 401 returned by a production request made with token."""
+        fingerprint = token_fingerprint(token)
+        self._load_rejected()
+        if self._rejected.get(airline) != fingerprint:
+            logging.warning(f"{airline} token rejected with 401 Unauthorized")
+            self._rejected[airline] = fingerprint
+            self._save_rejected()
+        self._verdicts[airline] = (token, False, self.clock())
+
+    def report_authorized(self, airline, token):
+        """Records a successful production request made with token."""
+        if self._rejected.get(airline) == token_fingerprint(token):
+            # Re-read first so another airline's verdict is not overwritten
+            self._load_rejected()
+            self._rejected.pop(airline, None)
+            self._save_rejected()
+        self._verdicts[airline] = (token, True, self.clock())
+
+# Shared validator used by api_client and the refresh scripts
+token_validator = TokenValidator()